@@ -0,0 +1,199 @@
+import os
+import hmac
+import json
+import argparse
+from contextlib import asynccontextmanager
+
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from attachments import close_spooled, spool_stream
+from ids import make_idempotency_key
+from pipeline import build_payload, submit_feedback_batch
+from validation import API_VALIDATOR
+from warmup import readiness, start_warmup
+
+# ------------------------- Config ------------------------- #
+# Local service: bind to loopback unless told otherwise. Graph settings are the
+# form's: sharepoint.py reads them from .streamlit/secrets.toml or env, so API
+# submits reach the same site and workbook.
+API_HOST = os.getenv("ROF_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("ROF_API_PORT", "8502"))
+# When set, requests must send "Authorization: Bearer <token>"
+API_TOKEN = os.getenv("ROF_API_TOKEN")
+
+API_BATCH_LIMIT = 200  # submissions per batch request
+MAX_FILES_PER_REQUEST = 1000
+
+
+# ==========================================================
+# Requests
+#
+#   POST /api/submissions
+#       JSON object of form fields, or multipart/form-data with the fields
+#       and the images as "attachments" (repeat for several).
+#       Header Idempotency-Key (or field idempotency_key): a retry with the
+#       same key returns the first receipt instead of submitting again (409
+#       while the first request is still running; a retry after a failed
+#       SharePoint step runs that step again).
+#
+#   POST /api/submissions/batch
+#       JSON {"submissions": [{...fields, "idempotency_key": ...}, ...]}, or
+#       multipart with that JSON in the "submissions" field and the images of
+#       submission i as "attachments.<i>".
+#
+# Field names are the payload's (see pipeline.build_payload); route_date is
+# YYYY-MM-DD.
+# ==========================================================
+class BadRequest(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _check_token(request: Request) -> None:
+    # constant-time comparison: the response time must not reveal how much of the token matched
+    sent = request.headers.get("authorization", "").encode()
+    if API_TOKEN and not hmac.compare_digest(sent, f"Bearer {API_TOKEN}".encode()):
+        raise BadRequest("Missing or invalid API token.", status=401)
+
+
+async def _read_json(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise BadRequest("Body is not valid JSON.")
+
+
+def _is_multipart(request: Request) -> bool:
+    return request.headers.get("content-type", "").startswith("multipart/form-data")
+
+
+def _entry(fields, uploads: list[UploadFile], key: str | None) -> tuple[dict, list[UploadFile], str]:
+    if not isinstance(fields, dict):
+        raise BadRequest("Each submission must be a JSON object.")
+    return fields, uploads, str(key or fields.get("idempotency_key") or make_idempotency_key())
+
+
+def _process(entries: list[tuple[dict, list[UploadFile], str]]) -> list[dict]:
+    """Spools, validates (one vectorized pass) and submits; one result per entry, in order."""
+    spooled = [[spool_stream(u.filename or "attachment", u.file) for u in uploads] for _, uploads, _ in entries]
+    try:
+        payloads = [build_payload(fields) for fields, _, _ in entries]
+        frame = pd.DataFrame([{**p, "attachments": files} for p, files in zip(payloads, spooled)])
+        errors = API_VALIDATOR.validate_frame(frame) if len(frame) else []
+        results: list[dict | None] = [{"status": "invalid", "errors": e} if e else None for e in errors]
+
+        valid = [i for i, e in enumerate(errors) if not e]
+        outcomes = submit_feedback_batch([(payloads[i], spooled[i], entries[i][2]) for i in valid])
+        for i, (receipt, replayed) in zip(valid, outcomes):
+            if receipt.get("in_progress"):
+                # same key, first request still running: retry later for its receipt
+                results[i] = {"status": "in_progress", "submission_id": receipt["submission_id"]}
+                continue
+            results[i] = {
+                "status": "duplicate" if replayed else "created",
+                "submission_id": receipt["submission_id"],
+                "receipt": receipt,
+            }
+        return results
+    finally:
+        for files in spooled:
+            close_spooled(files)
+
+
+# ==========================================================
+# Endpoints
+# ==========================================================
+async def submit_one(request: Request) -> JSONResponse:
+    _check_token(request)
+    key = request.headers.get("idempotency-key")
+    if _is_multipart(request):
+        async with request.form(max_files=MAX_FILES_PER_REQUEST) as form:
+            fields = {k: v for k, v in form.multi_items() if not isinstance(v, UploadFile)}
+            uploads = [f for f in form.getlist("attachments") if isinstance(f, UploadFile)]
+            [result] = await run_in_threadpool(_process, [_entry(fields, uploads, key)])
+    else:
+        [result] = await run_in_threadpool(_process, [_entry(await _read_json(request), [], key)])
+    status = {"created": 201, "duplicate": 200, "invalid": 422, "in_progress": 409}[result["status"]]
+    headers = {"Retry-After": "5"} if result["status"] == "in_progress" else None
+    return JSONResponse(result, status_code=status, headers=headers)
+
+
+async def submit_batch(request: Request) -> JSONResponse:
+    _check_token(request)
+    if _is_multipart(request):
+        async with request.form(max_files=MAX_FILES_PER_REQUEST) as form:
+            try:
+                body = json.loads(form.get("submissions") or "")
+            except (TypeError, ValueError):
+                raise BadRequest("Field 'submissions' must hold a JSON list.")
+            uploads = {}
+            for name, value in form.multi_items():
+                if isinstance(value, UploadFile) and name.startswith("attachments."):
+                    uploads.setdefault(name.split(".", 1)[1], []).append(value)
+            items = _batch_items(body)
+            entries = [_entry(fields, uploads.get(str(i), []), None) for i, fields in enumerate(items)]
+            results = await run_in_threadpool(_process, entries)
+    else:
+        items = _batch_items(await _read_json(request))
+        results = await run_in_threadpool(_process, [_entry(fields, [], None) for fields in items])
+
+    counts = {
+        status: sum(r["status"] == status for r in results) for status in ("created", "duplicate", "invalid", "in_progress")
+    }
+    return JSONResponse({**counts, "results": results})
+
+
+def _batch_items(body) -> list:
+    items = body.get("submissions") if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        raise BadRequest("Expected {\"submissions\": [...]}.")
+    if len(items) > API_BATCH_LIMIT:
+        raise BadRequest(f"At most {API_BATCH_LIMIT} submissions per batch (got {len(items)}).", status=413)
+    return items
+
+
+async def health(request: Request) -> JSONResponse:
+    """503 until every warm-up step succeeded (token, site, workbooks, lists), so load balancers wait for a warm process."""
+    start_warmup()  # retries failed steps (at most every WARMUP_RETRY_S); no-op once warm
+    status = readiness()
+    return JSONResponse(
+        {"status": "ok" if status["ready"] else "warming", **status}, status_code=200 if status["ready"] else 503
+    )
+
+
+async def _bad_request(request: Request, exc: BadRequest) -> JSONResponse:
+    return JSONResponse({"error": str(exc)}, status_code=exc.status)
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    start_warmup()
+    yield
+
+
+app = Starlette(
+    lifespan=lifespan,
+    routes=[
+        Route("/api/submissions", submit_one, methods=["POST"]),
+        Route("/api/submissions/batch", submit_batch, methods=["POST"]),
+        Route("/api/health", health, methods=["GET"]),
+    ],
+    exception_handlers={BadRequest: _bad_request},
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="HTTP ingestion API for route feedback (same pipeline as the form).")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
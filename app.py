@@ -6,6 +6,22 @@ from datetime import datetime, timezone
 import pandas as pd
 import streamlit as st
 
+from metrics import numeric_fields
+from store import SubmitInProgress, claim_idempotency_key, save_receipt, save_submission_record
+from search_index import index_submission
+from image_hash import LOCAL_INDEX_FILE, dhash, get_index
+from ids import make_idempotency_key, make_submission_id
+from attachments import (
+    SpooledAttachment,
+    close_spooled,
+    local_attachment_dir,
+    record_local_attachment,
+    spool_uploads,
+)
+from session_memory import clear_uploaded_files, enforce_session_limit, track_transient, uploader_key
+from validation import LEGACY_FORM_VALIDATOR
+from sharepoint import read_local_workbook, write_local_workbook
+
 # ------------------------- Config ------------------------- #
 IDC_FILE = "IDC NAME.xlsx"
 STATIONS_FILE = "Station adresses ASN.xlsx"
@@ -77,20 +93,30 @@ def safe_filename(name: str) -> str:
     return cleaned[:150] if cleaned else "file"
 
 
-def save_submission(payload: dict, uploaded_files: list) -> str:
+def save_submission(payload: dict, uploaded_files: list[SpooledAttachment], submission_id: str) -> str:
     ensure_dirs()
 
-    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%fZ")
-    submission_id = f"rof_{ts}"
-
+    phash_index = get_index(LOCAL_INDEX_FILE)
     attachment_paths = []
     for f in uploaded_files or []:
         if f is None:
             continue
+
+        # Near-duplicate of an image we already stored? Link to the existing file.
+        with f.open() as r:
+            h = dhash(r)
+        existing = phash_index.find(h) if h is not None else None
+        if existing and os.path.exists(existing["path"]):
+            attachment_paths.append(existing["path"])
+            continue
+
         fname = safe_filename(f.name)
-        out_path = os.path.join(ATTACHMENTS_DIR, f"{submission_id}__{fname}")
-        with open(out_path, "wb") as w:
-            w.write(f.getbuffer())
+        out_dir = local_attachment_dir(payload.get("station"), submission_id, ATTACHMENTS_DIR)
+        out_path = os.path.join(out_dir, f"{submission_id}__{fname}")
+        f.save_to(out_path)
+        record_local_attachment(out_path, submission_id, f.size)
+        if h is not None:
+            phash_index.add(h, out_path, submission_id=submission_id)
         attachment_paths.append(out_path)
 
     payload["submission_id"] = submission_id
@@ -101,6 +127,9 @@ def save_submission(payload: dict, uploaded_files: list) -> str:
     with open(out_json, "w", encoding="utf-8") as w:
         json.dump(payload, w, ensure_ascii=False, indent=2)
 
+    # SQLite system of record (indexed lookups for search, export, review, rollups)
+    save_submission_record(payload)
+
     return out_json
 
 
@@ -108,18 +137,18 @@ def append_submission_to_excel(payload: dict, excel_path: str) -> None:
     """
     Append one submission (payload dict) to a single Excel file.
     Creates the file if it doesn't exist. Keeps all columns that ever appeared.
+    The rows live in <file>.parquet next to it (see sharepoint.read_local_workbook);
+    the .xlsx is regenerated from them, so a submit does not parse Excel.
     """
     os.makedirs(os.path.dirname(excel_path), exist_ok=True)
 
     new_row = pd.DataFrame([payload])
+    existing = read_local_workbook(excel_path)
 
-    if os.path.exists(excel_path):
-        try:
-            existing = pd.read_excel(excel_path)
-        except Exception:
-            existing = pd.DataFrame()
-
+    if len(existing.columns):
         all_cols = list(dict.fromkeys(list(existing.columns) + list(new_row.columns)))
+        if "submission_id" in existing.columns and (existing["submission_id"] == payload["submission_id"]).any():
+            return  # retried submit, already appended
         existing = existing.reindex(columns=all_cols)
         new_row = new_row.reindex(columns=all_cols)
 
@@ -127,14 +156,7 @@ def append_submission_to_excel(payload: dict, excel_path: str) -> None:
     else:
         updated = new_row
 
-    updated.to_excel(excel_path, index=False)
-
-
-def is_digits_only(s: str) -> bool:
-    if s is None:
-        return False
-    s = str(s).strip()
-    return bool(s) and s.isdigit()
+    write_local_workbook(updated, excel_path)
 
 
 def banner_as_data_uri(path: str) -> str:
@@ -158,6 +180,13 @@ logo_icon = "logo_intelcom_2024.png"
 logo_image = "logo_intelcom_2024.png"
 st.logo(icon_image=logo_icon, image=logo_image)
 
+# Per-session memory budget (see session_memory.py; usage shown on the Memory page)
+enforce_session_limit(upload_base="attachments")
+
+# One idempotency key per filled-in form; every submit attempt of this form reuses it
+if "idempotency_key" not in st.session_state:
+    st.session_state["idempotency_key"] = make_idempotency_key()
+
 banner_uri = banner_as_data_uri(BANNER_FILE)
 
 # ------------------------- CSS ------------------------- #
@@ -278,7 +307,8 @@ def _reset_form():
         "time_lost", "parcel_tracking_id",
         "main_issue", "sub_issue",
         "what_happened", "what_should", "suggestion",
-        "attachments", "agree",
+        "agree",
+        "idempotency_key",
     ]
     for k in keys:
         if k in st.session_state:
@@ -452,7 +482,7 @@ with st.container():
         "Attach screenshots / files (optional)",
         accept_multiple_files=True,
         type=["png", "jpg", "jpeg", "pdf", "xlsx", "csv", "txt"],
-        key="attachments",
+        key=uploader_key("attachments"),
     )
 
     agree = st.checkbox(
@@ -463,8 +493,6 @@ with st.container():
     submitted = st.button("Submit feedback", type="primary")
 
     if submitted:
-        errors = []
-
         # Clean
         driver_last_name_clean = (driver_last_name or "").strip()
         driver_first_name_clean = (driver_first_name or "").strip()
@@ -479,51 +507,6 @@ with st.container():
         stop_number_clean = (stop_number or "").strip()
 
 
-        # Validation (Identification)
-        if not driver_last_name_clean:
-            errors.append("Driver last name is required.")
-        if not driver_first_name_clean:
-            errors.append("Driver first name is required.")
-        if not driver_email_required_clean:
-            errors.append("Driver email is required.")
-        if not idc_name_clean:
-            errors.append("IDC is required.")
-        if not station_clean:
-            errors.append("Station is required.")
-        if not route_number_clean:
-            errors.append("Route number is required.")
-        elif not is_digits_only(route_number_clean):
-            errors.append("Route number must contain digits only (e.g., 1235).")
-
-        if not idc_liaison_clean:
-            errors.append("IDC Liaison is required.")
-        if not vehicle_type_clean:
-            errors.append("Vehicle type is required.")
-
-        # Validation (Problem scope)
-        if issue_applies_to == "Specific stop":
-            if not stop_number_clean:
-                errors.append("Stop number is required when 'Specific stop' is selected.")
-
-            if not parcel_tracking_id_clean:
-                errors.append("Parcel Tracking ID is required when 'Specific stop' is selected.")
-
-        if not time_lost:
-            errors.append("Estimated time lost is required.")
-
-        # Validation (Issue identification)
-        if not main_issue:
-            errors.append("Main issue category is required.")
-        if main_issue and not sub_issue:
-            errors.append("Sub-category is required.")
-
-        if not agree:
-            errors.append("You must confirm the accuracy checkbox.")
-
-        if errors:
-            st.error("Please fix the following:\n- " + "\n- ".join(errors))
-            st.stop()
-
         payload = {
             # Identification
             "driver_last_name": driver_last_name_clean,
@@ -555,11 +538,43 @@ with st.container():
             "suggestion": (suggestion or "").strip(),
         }
 
-        # ✅ Save JSON + attachments (existing behavior)
-        out_path = save_submission(payload, attachments)
+        # Validation (shared schema, see validation.py)
+        errors = LEGACY_FORM_VALIDATOR.validate({**payload, "agree": agree, "attachments": attachments})
+        if errors:
+            st.error("Please fix the following:\n- " + "\n- ".join(errors))
+            st.stop()
+
+        # Numeric columns (time lost bounds/midpoint, integer rating)
+        payload.update(numeric_fields(payload))
+
+        # Same form submitted again (double click, retry after a dropped connection)?
+        idempotency_key = st.session_state["idempotency_key"]
+        try:
+            submission_id, receipt, final = claim_idempotency_key(idempotency_key, make_submission_id())
+        except SubmitInProgress as e:
+            st.info(f"This feedback is still being submitted (ID {e.submission_id}).")
+            st.stop()
+        if final:
+            st.info(f"This feedback was already submitted (ID {receipt['submission_id']}).")
+            st.caption(f"Saved JSON to: {receipt['out_path']}")
+            st.stop()
+
+        # ✅ Save JSON + attachments (uploads moved out of memory first, large ones to temp files)
+        spooled = spool_uploads(attachments)
+        out_path = save_submission(payload, spooled, submission_id)
+        close_spooled(spooled)
+
+        # Keep the full-text search index up to date (the search page also catches up on its own)
+        try:
+            index_submission(payload)
+        except Exception:
+            pass
 
         # ✅ Append to Excel (single file updated each submission)
-        append_submission_to_excel(payload, EXCEL_EXPORT_FILE)
+        with track_transient("Excel update"):
+            append_submission_to_excel(payload, EXCEL_EXPORT_FILE)
+
+        save_receipt(idempotency_key, {"submission_id": submission_id, "out_path": out_path})
 
         st.success("✅ Feedback submitted successfully!")
         st.caption(f"Saved JSON to: {out_path}")
@@ -567,5 +582,6 @@ with st.container():
         st.json(payload)
 
         # ✅ Clear everything like clear_on_submit=True
+        clear_uploaded_files("attachments")
         _reset_form()
         st.rerun()
@@ -1,13 +1,28 @@
 import os
 import json
 import base64
-from io import BytesIO
 from datetime import datetime, timezone
 
 import pandas as pd
 import streamlit as st
 import requests
 
+from metrics import numeric_fields
+from store import SubmitInProgress, claim_idempotency_key, save_receipt, save_submission_record
+from search_index import index_submission
+from image_hash import LOCAL_INDEX_FILE, dhash, get_index
+from ids import make_idempotency_key, make_submission_id
+from attachments import (
+    SpooledAttachment,
+    close_spooled,
+    local_attachment_dir,
+    record_local_attachment,
+    spool_uploads,
+)
+from session_memory import clear_uploaded_files, enforce_session_limit, track_transient, uploader_key
+from validation import LEGACY_FORM_VALIDATOR
+from sharepoint import append_rows_to_remote_excel
+
 # ------------------------- Config ------------------------- #
 IDC_FILE = "IDC NAME.xlsx"
 STATIONS_FILE = "Station adresses ASN.xlsx"
@@ -92,7 +107,7 @@ SUBCATS = {
 }
 
 # ==========================================================
-# ✅ Microsoft Graph: remote-only Excel (download -> append -> upload)
+# ✅ Microsoft Graph: remote-only Excel (cached read -> append -> conditional upload)
 # ==========================================================
 def graph_is_configured() -> bool:
     required = [TENANT_ID, CLIENT_ID, CLIENT_SECRET, SP_HOSTNAME, SP_SITE_PATH, SP_EXCEL_PATH]
@@ -116,75 +131,19 @@ def graph_get_site_id(token: str) -> str:
     r.raise_for_status()
     return r.json()["id"]
 
-def graph_download_excel_bytes(token: str, site_id: str, sp_file_path: str) -> bytes | None:
-    """
-    Returns file bytes if exists.
-    Returns None if file does NOT exist yet (404).
-    """
-    url = f"{GRAPH_BASE}/sites/{site_id}/drive/root:{sp_file_path}:/content"
-    r = requests.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=120)
-
-    if r.status_code == 404:
-        return None
-
-    if not r.ok:
-        raise RuntimeError(f"SharePoint download failed: {r.status_code} - {r.text}")
-
-    return r.content
-
-def graph_upload_excel_bytes(token: str, site_id: str, sp_file_path: str, content: bytes) -> None:
-    """
-    Creates the file if missing, overwrites if exists.
-    """
-    url = f"{GRAPH_BASE}/sites/{site_id}/drive/root:{sp_file_path}:/content"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    }
-    r = requests.put(url, headers=headers, data=content, timeout=120)
-
-    if r.status_code not in (200, 201):
-        raise RuntimeError(f"SharePoint upload failed: {r.status_code} - {r.text}")
-
 def append_payload_to_remote_excel(payload: dict) -> None:
     """
-    Remote-only Excel update:
-    - download current Excel from SharePoint (if exists)
-    - append payload row, preserving existing columns
-    - upload updated Excel back
+    Remote-only Excel update through sharepoint.py: the workbook is read from the
+    local cache / Parquet mirror (revalidated by eTag, not downloaded and parsed
+    on every submit), the row appended, and the upload is conditional on the
+    version read (retried on a concurrent write).
     """
     if not graph_is_configured():
         raise RuntimeError("Graph is not configured (missing TENANT_ID/CLIENT_ID/CLIENT_SECRET/SP_* settings).")
 
     token = graph_get_token()
     site_id = graph_get_site_id(token)
-
-    # 1) Download existing Excel (if any)
-    existing_bytes = graph_download_excel_bytes(token, site_id, SP_EXCEL_PATH)
-
-    if existing_bytes:
-        try:
-            existing_df = pd.read_excel(BytesIO(existing_bytes))
-        except Exception:
-            existing_df = pd.DataFrame()
-    else:
-        existing_df = pd.DataFrame()
-
-    # 2) Append row with union of columns
-    new_row = pd.DataFrame([payload])
-    all_cols = list(dict.fromkeys(list(existing_df.columns) + list(new_row.columns)))
-    existing_df = existing_df.reindex(columns=all_cols)
-    new_row = new_row.reindex(columns=all_cols)
-    updated_df = pd.concat([existing_df, new_row], ignore_index=True)
-
-    # 3) Write to bytes (no local file)
-    out = BytesIO()
-    with pd.ExcelWriter(out, engine="openpyxl") as writer:
-        updated_df.to_excel(writer, index=False, sheet_name="Submissions")
-    out.seek(0)
-
-    # 4) Upload back to SharePoint
-    graph_upload_excel_bytes(token, site_id, SP_EXCEL_PATH, out.getvalue())
+    append_rows_to_remote_excel(token, site_id, SP_EXCEL_PATH, [payload])
 
 # ==========================================================
 # Local helpers (JSON + attachments) — same as your old behavior
@@ -217,19 +176,30 @@ def safe_filename(name: str) -> str:
     cleaned = "".join(keep).strip().replace(" ", "_")
     return cleaned[:150] if cleaned else "file"
 
-def save_submission(payload: dict, uploaded_files: list) -> str:
+def save_submission(payload: dict, uploaded_files: list[SpooledAttachment], submission_id: str) -> str:
     ensure_dirs()
-    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%fZ")
-    submission_id = f"rof_{ts}"
 
+    phash_index = get_index(LOCAL_INDEX_FILE)
     attachment_paths = []
     for f in uploaded_files or []:
         if f is None:
             continue
+
+        # Near-duplicate of an image we already stored? Link to the existing file.
+        with f.open() as r:
+            h = dhash(r)
+        existing = phash_index.find(h) if h is not None else None
+        if existing and os.path.exists(existing["path"]):
+            attachment_paths.append(existing["path"])
+            continue
+
         fname = safe_filename(f.name)
-        out_path = os.path.join(ATTACHMENTS_DIR, f"{submission_id}__{fname}")
-        with open(out_path, "wb") as w:
-            w.write(f.getbuffer())
+        out_dir = local_attachment_dir(payload.get("station"), submission_id, ATTACHMENTS_DIR)
+        out_path = os.path.join(out_dir, f"{submission_id}__{fname}")
+        f.save_to(out_path)
+        record_local_attachment(out_path, submission_id, f.size)
+        if h is not None:
+            phash_index.add(h, out_path, submission_id=submission_id)
         attachment_paths.append(out_path)
 
     payload["submission_id"] = submission_id
@@ -240,6 +210,9 @@ def save_submission(payload: dict, uploaded_files: list) -> str:
     with open(out_json, "w", encoding="utf-8") as w:
         json.dump(payload, w, ensure_ascii=False, indent=2)
 
+    # SQLite system of record (indexed lookups for search, export, review, rollups)
+    save_submission_record(payload)
+
     return out_json
 
 def is_digits_only(s: str) -> bool:
@@ -273,7 +246,8 @@ def _reset_form():
         "time_lost", "parcel_tracking_id",
         "main_issue", "sub_issue",
         "what_happened", "what_should", "suggestion",
-        "attachments", "agree",
+        "agree",
+        "idempotency_key",
     ]
     for k in keys:
         if k in st.session_state:
@@ -283,6 +257,13 @@ def _reset_form():
 st.set_page_config(page_title="Route Optimization Feedback", page_icon="🧭", layout="centered")
 st.logo(icon_image="logo_intelcom_2024.png", image="logo_intelcom_2024.png")
 
+# Per-session memory budget (see session_memory.py; usage shown on the Memory page)
+enforce_session_limit(upload_base="attachments")
+
+# One idempotency key per filled-in form; every submit attempt of this form reuses it
+if "idempotency_key" not in st.session_state:
+    st.session_state["idempotency_key"] = make_idempotency_key()
+
 banner_uri = banner_as_data_uri(BANNER_FILE)
 
 st.markdown(
@@ -401,7 +382,7 @@ attachments = st.file_uploader(
     "Attach screenshots / files (optional)",
     accept_multiple_files=True,
     type=["png", "jpg", "jpeg", "pdf", "xlsx", "csv", "txt"],
-    key="attachments",
+    key=uploader_key("attachments"),
 )
 
 agree = st.checkbox("I confirm this information is accurate to the best of my knowledge *", key="agree")
@@ -409,8 +390,6 @@ submitted = st.button("Submit feedback", type="primary")
 
 # ------------------------- Submit handler ------------------------- #
 if submitted:
-    errors = []
-
     # Clean
     driver_last_name_clean = (driver_last_name or "").strip()
     driver_first_name_clean = (driver_first_name or "").strip()
@@ -425,46 +404,6 @@ if submitted:
     stop_number_clean = (stop_number or "").strip()
     stop_address_clean = (stop_address or "").strip()
 
-    # Validation (Identification)
-    if not driver_last_name_clean:
-        errors.append("Driver last name is required.")
-    if not driver_first_name_clean:
-        errors.append("Driver first name is required.")
-    if not driver_email_required_clean:
-        errors.append("Driver email is required.")
-    if not idc_name_clean:
-        errors.append("IDC is required.")
-    if not station_clean:
-        errors.append("Station is required.")
-    if not route_number_clean:
-        errors.append("Route number is required.")
-    elif not is_digits_only(route_number_clean):
-        errors.append("Route number must contain digits only (e.g., 1235).")
-    if not idc_liaison_clean:
-        errors.append("IDC Liaison is required.")
-    if not vehicle_type_clean:
-        errors.append("Vehicle type is required.")
-
-    # Validation (Problem scope)
-    if issue_applies_to == "Specific stop":
-        if not stop_number_clean:
-            errors.append("Stop number is required when 'Specific stop' is selected.")
-        if not parcel_tracking_id_clean:
-            errors.append("Parcel Tracking ID is required when 'Specific stop' is selected.")
-
-    if not time_lost:
-        errors.append("Estimated time lost is required.")
-    if not main_issue:
-        errors.append("Main issue category is required.")
-    if main_issue and not sub_issue:
-        errors.append("Sub-category is required.")
-    if not agree:
-        errors.append("You must confirm the accuracy checkbox.")
-
-    if errors:
-        st.error("Please fix the following:\n- " + "\n- ".join(errors))
-        st.stop()
-
     payload = {
         # Identification
         "driver_last_name": driver_last_name_clean,
@@ -496,18 +435,55 @@ if submitted:
         "suggestion": (suggestion or "").strip(),
     }
 
+    # Validation (shared schema, see validation.py)
+    errors = LEGACY_FORM_VALIDATOR.validate({**payload, "agree": agree, "attachments": attachments})
+    if errors:
+        st.error("Please fix the following:\n- " + "\n- ".join(errors))
+        st.stop()
+
+    # Numeric columns (time lost bounds/midpoint, integer rating)
+    payload.update(numeric_fields(payload))
+
+    # Same form submitted again (double click, retry after a dropped connection)?
+    idempotency_key = st.session_state["idempotency_key"]
+    try:
+        submission_id, receipt, final = claim_idempotency_key(idempotency_key, make_submission_id())
+    except SubmitInProgress as e:
+        st.info(f"This feedback is still being submitted (ID {e.submission_id}).")
+        st.stop()
+    if final:
+        st.info(f"This feedback was already submitted (ID {receipt['submission_id']}).")
+        st.stop()
+
     # Keep your existing local JSON + attachments behavior (optional)
-    out_path = save_submission(payload, attachments)
+    # Move the uploads out of memory (large ones to temp files) before saving them
+    spooled = spool_uploads(attachments)
+    out_path = save_submission(payload, spooled, submission_id)
+    close_spooled(spooled)
+
+    # Keep the full-text search index up to date (the search page also catches up on its own)
+    try:
+        index_submission(payload)
+    except Exception:
+        pass
 
     # Remote-only Excel update on SharePoint
     sp_ok = False
     sp_err = None
     try:
-        append_payload_to_remote_excel(payload)
+        with track_transient("Excel update"):
+            append_payload_to_remote_excel(payload)
         sp_ok = True
     except Exception as e:
         sp_err = str(e)
 
+    # not final when the Excel update failed: a retry with the same key runs it again
+    save_receipt(
+        idempotency_key,
+        {"submission_id": submission_id, "out_path": out_path, "sp_ok": sp_ok, "sp_err": sp_err},
+        final=sp_ok,
+    )
+
     if sp_ok:
         st.success("✅ Feedback submitted successfully and SharePoint Excel updated!")
         st.caption(f"SharePoint file: {SP_EXCEL_PATH}")
@@ -517,5 +493,6 @@ if submitted:
         st.caption(f"Error: {sp_err}")
 
     # st.json(payload)
+    clear_uploaded_files("attachments")
     _reset_form()
     st.rerun()
@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import gzip
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from ids import submission_id_time
+from store import SUBMISSIONS_DIR, list_submission_files, read_submission_file, submission_id_from_path
+
+# ------------------------- Config ------------------------- #
+ARCHIVE_DIR = os.path.join(SUBMISSIONS_DIR, "archive")
+COMPACT_AFTER_DAYS = 30
+
+# Records per gzip member: a lookup decompresses one block (a few dozen KB), not the day
+BLOCK_RECORDS = 64
+
+
+# ==========================================================
+# Daily archives
+#
+#   archive/2026/01/2026-01-26.jsonl.gz   concatenated gzip members, one per
+#                                         block of records (a plain `zcat`
+#                                         still reads it as JSONL)
+#   archive/2026/01/2026-01-26.idx.json   {submission_id: [offset, length, line]}
+#
+# The day comes from the submission id, so finding a submission is: id ->
+# day -> index -> seek + decompress one block.
+# ==========================================================
+def _day_of(submission_id: str) -> str:
+    return submission_id_time(submission_id).strftime("%Y-%m-%d")
+
+
+def archive_paths(day: str, directory: str = ARCHIVE_DIR) -> tuple[str, str]:
+    folder = os.path.join(directory, day[:4], day[5:7])
+    return os.path.join(folder, f"{day}.jsonl.gz"), os.path.join(folder, f"{day}.idx.json")
+
+
+def read_archive_index(day: str, directory: str = ARCHIVE_DIR) -> dict[str, list[int]]:
+    _, idx_path = archive_paths(day, directory)
+    if not os.path.exists(idx_path):
+        return {}
+    with open(idx_path, "r", encoding="utf-8") as r:
+        return json.load(r)
+
+
+def read_archived_submission(submission_id: str, directory: str = ARCHIVE_DIR) -> dict | None:
+    """One archived submission: an index lookup, one seek and one block decompressed."""
+    day = _day_of(submission_id)
+    entry = read_archive_index(day, directory).get(submission_id)
+    if entry is None:
+        return None
+    offset, length, line = entry
+    gz_path, _ = archive_paths(day, directory)
+    with open(gz_path, "rb") as r:
+        r.seek(offset)
+        block = gzip.decompress(r.read(length))
+    return json.loads(block.split(b"\n")[line])
+
+
+def iter_archived_submissions(directory: str = ARCHIVE_DIR):
+    """Every archived submission, day by day (sequential reads, in submission_id order)."""
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths += [os.path.join(root, f) for f in files if f.endswith(".jsonl.gz")]
+    for path in sorted(paths, key=os.path.basename):
+        with gzip.open(path, "rt", encoding="utf-8") as r:
+            for line in r:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def iter_day(day: str, directory: str = ARCHIVE_DIR):
+    gz_path, _ = archive_paths(day, directory)
+    if not os.path.exists(gz_path):
+        return
+    with gzip.open(gz_path, "rt", encoding="utf-8") as r:
+        for line in r:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_day_archive(day: str, payloads: list[dict], directory: str = ARCHIVE_DIR) -> int:
+    """
+    Writes (or rewrites, merged with what is already archived) one day.
+    Archive and index are written to temp files and swapped in, index last.
+    Returns the number of records in the archive.
+    """
+    gz_path, idx_path = archive_paths(day, directory)
+    os.makedirs(os.path.dirname(gz_path), exist_ok=True)
+
+    records = {p["submission_id"]: p for p in iter_day(day, directory)}
+    records.update({p["submission_id"]: p for p in payloads})
+    ordered = [records[sid] for sid in sorted(records)]
+
+    index = {}
+    tmp_gz, tmp_idx = f"{gz_path}.{os.getpid()}.tmp", f"{idx_path}.{os.getpid()}.tmp"
+    with open(tmp_gz, "wb") as w:
+        for start in range(0, len(ordered), BLOCK_RECORDS):
+            block = ordered[start:start + BLOCK_RECORDS]
+            lines = [json.dumps(p, ensure_ascii=False, separators=(",", ":")) for p in block]
+            member = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), mtime=0)
+            offset = w.tell()
+            w.write(member)
+            for line, p in enumerate(block):
+                index[p["submission_id"]] = [offset, len(member), line]
+        w.flush()
+        os.fsync(w.fileno())
+    with open(tmp_idx, "w", encoding="utf-8") as w:
+        json.dump(index, w, separators=(",", ":"))
+        w.flush()
+        os.fsync(w.fileno())
+    os.replace(tmp_gz, gz_path)
+    os.replace(tmp_idx, idx_path)
+    return len(ordered)
+
+
+def update_archived_submissions(updates: dict[str, dict], directory: str = ARCHIVE_DIR) -> int:
+    """
+    Merges fields into archived submissions ({submission_id: fields}), one
+    rewrite per day touched; ids that are not archived are skipped. Returns
+    the number of submissions updated.
+    """
+    by_day: dict[str, list[str]] = {}
+    for sid in updates:
+        by_day.setdefault(_day_of(sid), []).append(sid)
+    updated = 0
+    for day, sids in sorted(by_day.items()):
+        index = read_archive_index(day, directory)
+        archived = [sid for sid in sids if sid in index]
+        if not archived:
+            continue
+        records = {p["submission_id"]: p for p in iter_day(day, directory) if p["submission_id"] in updates}
+        write_day_archive(day, [{**records[sid], **updates[sid]} for sid in archived if sid in records], directory)
+        updated += len(archived)
+    return updated
+
+
+# ==========================================================
+# Compaction
+# ==========================================================
+def compact_submissions(
+    older_than_days: int = COMPACT_AFTER_DAYS,
+    directory: str = SUBMISSIONS_DIR,
+    archive_dir: str = ARCHIVE_DIR,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Rolls the per-submission JSON files older than N days into daily archives,
+    then deletes them. A file is only deleted once its day's archive and index
+    are on disk, so an interrupted run loses nothing and can simply be re-run.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    by_day: dict[str, list[str]] = {}
+    for path in list_submission_files(directory):
+        sid = submission_id_from_path(path)
+        if submission_id_time(sid) < cutoff:
+            by_day.setdefault(_day_of(sid), []).append(path)
+
+    report = {
+        "days": len(by_day),
+        "files": sum(len(paths) for paths in by_day.values()),
+        "bytes_before": sum(os.path.getsize(p) for paths in by_day.values() for p in paths),
+        "bytes_after": 0,
+    }
+    if dry_run:
+        return report
+
+    for day, paths in sorted(by_day.items()):
+        readable = {}
+        for path in paths:
+            try:
+                readable[path] = read_submission_file(path)
+            except (OSError, ValueError):
+                continue  # unreadable: left in place
+        write_day_archive(day, list(readable.values()), archive_dir)
+        archived = read_archive_index(day, archive_dir)
+        for path, payload in readable.items():
+            if payload["submission_id"] in archived:
+                os.remove(path)
+        report["bytes_after"] += os.path.getsize(archive_paths(day, archive_dir)[0])
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact old submission JSON files into daily gzip JSONL archives.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compact = sub.add_parser("compact", help="archive and delete JSON files older than --days")
+    compact.add_argument("--days", type=int, default=COMPACT_AFTER_DAYS)
+    compact.add_argument("--dry-run", action="store_true")
+    get = sub.add_parser("get", help="print one archived submission")
+    get.add_argument("submission_id")
+    args = parser.parse_args()
+
+    if args.command == "get":
+        payload = read_archived_submission(args.submission_id)
+        if payload is None:
+            print(f"{args.submission_id} is not archived.")
+            sys.exit(1)
+        print(json.dumps(payload, ensure_ascii=False, indent=2))
+    else:
+        report = compact_submissions(args.days, dry_run=args.dry_run)
+        print(
+            f"{report['files']} file(s) over {report['days']} day(s), "
+            f"{report['bytes_before'] / 1024:.0f} KB of JSON"
+            + ("" if args.dry_run else f" -> {report['bytes_after'] / 1024:.0f} KB archived")
+        )
@@ -0,0 +1,177 @@
+import os
+import json
+import shutil
+import tempfile
+from io import BytesIO
+from typing import IO
+from datetime import datetime, timezone
+
+from ids import submission_id_time
+from store import SUBMISSIONS_DIR
+
+# ------------------------- Config ------------------------- #
+SPOOL_DIR = os.path.join(SUBMISSIONS_DIR, "cache", "spool")
+
+# Local copies live in ATTACHMENTS_DIR/<STATION>/<YYYY>/<MM>/ (same layout in SharePoint)
+ATTACHMENTS_DIR = os.path.join(SUBMISSIONS_DIR, "attachments")
+PARTITION_INDEX_FILE = "_index.jsonl"
+UNKNOWN_STATION = "NO_STATION"
+
+# Uploads above this size are moved to a temp file instead of being kept in memory
+SPOOL_MAX_MEMORY_BYTES = 1024 * 1024
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# Total size of the attachments of one submission (also see server.maxUploadSize, per file)
+MAX_SUBMISSION_ATTACHMENT_BYTES = int(float(os.getenv("MAX_SUBMISSION_ATTACHMENT_MB", "25")) * 1024 * 1024)
+
+
+# ==========================================================
+# Sizes (uploads, spooled attachments, bytes, local file paths)
+# ==========================================================
+def attachment_size(f) -> int:
+    size = getattr(f, "size", None)
+    if size is not None:
+        return int(size)
+    if isinstance(f, (bytes, bytearray, memoryview)):
+        return len(f)
+    if isinstance(f, str):
+        return os.path.getsize(f) if os.path.isfile(f) else 0
+    return len(f.getbuffer())
+
+
+def total_attachment_size(files) -> int:
+    return sum(attachment_size(f) for f in files or [] if f is not None)
+
+
+# ==========================================================
+# Spooling
+#
+# st.file_uploader keeps uploads in memory for as long as the widget holds them.
+# At submit, each upload is copied (in chunks, from a memoryview, so never
+# duplicated whole in memory) to a temp file if it is large; everything after
+# that (hashing, SharePoint upload, local copy) streams from the spooled file.
+# ==========================================================
+class SpooledAttachment:
+    def __init__(self, name: str, size: int, content: bytes | None = None, path: str | None = None):
+        self.name = name
+        self.size = size
+        self._content = content
+        self._path = path
+
+    @property
+    def on_disk(self) -> bool:
+        return self._path is not None
+
+    def open(self) -> IO[bytes]:
+        """A fresh reader positioned at the start (caller closes it)."""
+        if self._path is not None:
+            return open(self._path, "rb")
+        return BytesIO(self._content)
+
+    def save_to(self, path: str) -> None:
+        if self._path is not None:
+            # same filesystem (both under submissions/): link instead of copying
+            try:
+                os.link(self._path, path)
+                return
+            except OSError:
+                pass
+        with self.open() as r, open(path, "wb") as w:
+            shutil.copyfileobj(r, w, COPY_CHUNK_BYTES)
+
+    def close(self) -> None:
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            self._path = None
+        self._content = None
+
+    def __del__(self):
+        self.close()
+
+
+def spool_upload(f) -> SpooledAttachment:
+    view = f.getbuffer()  # memoryview on the upload: no copy
+    try:
+        size = len(view)
+        if size <= SPOOL_MAX_MEMORY_BYTES:
+            return SpooledAttachment(f.name, size, content=bytes(view))
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=SPOOL_DIR, suffix=os.path.splitext(f.name)[1])
+        with os.fdopen(fd, "wb") as w:
+            for start in range(0, size, COPY_CHUNK_BYTES):
+                w.write(view[start:start + COPY_CHUNK_BYTES])
+        return SpooledAttachment(f.name, size, path=path)
+    finally:
+        view.release()
+
+
+def spool_stream(name: str, reader: IO[bytes]) -> SpooledAttachment:
+    """Same as spool_upload for a file object (e.g. a multipart part of an HTTP request)."""
+    head = reader.read(SPOOL_MAX_MEMORY_BYTES + 1)
+    if len(head) <= SPOOL_MAX_MEMORY_BYTES:
+        return SpooledAttachment(name, len(head), content=head)
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=SPOOL_DIR, suffix=os.path.splitext(name)[1])
+    with os.fdopen(fd, "wb") as w:
+        w.write(head)
+        shutil.copyfileobj(reader, w, COPY_CHUNK_BYTES)
+        size = w.tell()
+    return SpooledAttachment(name, size, path=path)
+
+
+def spool_uploads(files) -> list[SpooledAttachment]:
+    return [spool_upload(f) for f in files or [] if f is not None]
+
+
+def close_spooled(spooled: list[SpooledAttachment]) -> None:
+    for s in spooled or []:
+        s.close()
+
+
+# ==========================================================
+# Partitions: <STATION>/<YYYY>/<MM> (submission month, UTC)
+#
+# Keeps every folder small, locally and in SharePoint. Each partition has an
+# index file listing its files, so tools never need to list a folder.
+# ==========================================================
+def _clean_station(station) -> str:
+    cleaned = "".join(ch for ch in str(station or "").strip().upper() if ch.isalnum() or ch in ("-", "_"))
+    return cleaned or UNKNOWN_STATION
+
+
+def attachment_partition(station, submission_id: str | None) -> str:
+    when = submission_id_time(submission_id) if submission_id else datetime.now(timezone.utc)
+    return f"{_clean_station(station)}/{when:%Y}/{when:%m}"
+
+
+def local_attachment_dir(station, submission_id: str | None, base_dir: str = ATTACHMENTS_DIR) -> str:
+    folder = os.path.join(base_dir, *attachment_partition(station, submission_id).split("/"))
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def partition_index_entry(path: str, submission_id: str | None, size: int | None = None) -> dict:
+    return {
+        "name": os.path.basename(path),
+        "submission_id": submission_id,
+        "size": size if size is not None else (os.path.getsize(path) if os.path.exists(path) else None),
+        "added_at_utc": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def record_local_attachment(path: str, submission_id: str | None, size: int | None = None) -> None:
+    """Appends the file to its partition's index (one small O_APPEND write)."""
+    entry = partition_index_entry(path, submission_id, size)
+    with open(os.path.join(os.path.dirname(path), PARTITION_INDEX_FILE), "a", encoding="utf-8") as w:
+        w.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def read_partition_index(folder: str) -> list[dict]:
+    path = os.path.join(folder, PARTITION_INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as r:
+        return [json.loads(line) for line in r if line.strip()]
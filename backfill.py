@@ -0,0 +1,230 @@
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from attachments import partition_index_entry
+from store import DB_FILE, SUBMISSION_PREFIX, import_json_dir, iter_submissions, local_path, update_submission
+from sharepoint import (
+    append_rows_to_workbooks,
+    build_sp_attachment_name,
+    excel_workbook_paths,
+    graph_get_items,
+    graph_get_site_id,
+    graph_get_token,
+    graph_is_configured,
+    graph_upload_file_bytes,
+    mime_from_filename,
+    read_remote_workbook,
+    sp_attachment_partition_folder,
+    update_rows_in_workbooks,
+    update_sp_attachment_index,
+)
+
+# ------------------------- Config ------------------------- #
+UPLOAD_WORKERS = 4
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+# ==========================================================
+# Diff: local store vs SharePoint
+# ==========================================================
+def remote_attachment_cells(token: str, site_id: str) -> dict[str, bool]:
+    """{submission_id: whether its workbook row lists SharePoint attachments} over every workbook."""
+    rows = {}
+    for path in excel_workbook_paths(token, site_id):
+        df, _ = read_remote_workbook(token, site_id, path)
+        if "submission_id" not in df.columns:
+            continue
+        ids = df["submission_id"].astype(str)
+        cells = df["sp_attachments"] if "sp_attachments" in df.columns else None
+        for i in df.index[df["submission_id"].notna()]:
+            value = None if cells is None else cells[i]
+            rows[ids[i]] = not pd.isna(value) and str(value).strip() not in ("", "[]")
+    return rows
+
+
+def workbook_attachment_updates(payloads: list[dict], remote: dict[str, bool]) -> dict[str, dict]:
+    """
+    {submission_id: {"sp_attachments": paths}} for rows already in a workbook that
+    list no attachments while the store has them (images backfilled after the row
+    was written, now or by an earlier run whose workbook update failed).
+    """
+    return {
+        p["submission_id"]: {"sp_attachments": p["sp_attachments"]}
+        for p in payloads
+        if p.get("sp_attachments") and remote.get(p["submission_id"]) is False
+    }
+
+
+def _original_filename(path: str) -> str:
+    # local copies are saved as <submission_id>__<original name>
+    name = os.path.basename(local_path(path))
+    if name.startswith(SUBMISSION_PREFIX) and "__" in name:
+        return name.split("__", 1)[1]
+    return name
+
+
+def pending_attachments(payload: dict) -> list[str]:
+    """Local images of a submission that never made it to SharePoint."""
+    if payload.get("sp_attachments"):
+        return []
+    return [
+        p for p in payload.get("attachments") or []
+        if p and os.path.splitext(p.lower())[1] in IMAGE_EXTENSIONS and os.path.exists(local_path(p))
+    ]
+
+
+# ==========================================================
+# Upload
+# ==========================================================
+def attachment_sp_path(payload: dict, path: str) -> str:
+    name = build_sp_attachment_name(
+        payload["submission_id"], payload.get("driver_id"), payload.get("idc_id"), _original_filename(path)
+    )
+    return f"{sp_attachment_partition_folder(payload.get('station'), payload['submission_id'])}/{name}"
+
+
+def upload_attachment(token: str, site_id: str, payload: dict, path: str) -> str:
+    """Uploads one local image. Returns its SharePoint path."""
+    sp_path = attachment_sp_path(payload, path)
+    with open(local_path(path), "rb") as r:
+        graph_upload_file_bytes(token, site_id, sp_path, r, mime_from_filename(path))
+    return sp_path
+
+
+def backfill_attachments(
+    token: str, site_id: str, payloads: list[dict], workers: int = UPLOAD_WORKERS, db_path: str = DB_FILE
+) -> tuple[int, list[str]]:
+    """
+    Uploads pending images in parallel (skipping those already there, so re-runs
+    are cheap). A submission's sp_attachments is only recorded once all of its
+    images are up. Returns (uploaded, errors).
+    """
+    jobs = {p["submission_id"]: (p, pending_attachments(p)) for p in payloads}
+    jobs = {sid: job for sid, job in jobs.items() if job[1]}
+    results: dict[str, dict[int, str]] = {sid: {} for sid in jobs}
+    index_entries: dict[str, list[dict]] = {}
+    errors = []
+
+    # Files already in SharePoint (earlier, interrupted run) are not re-uploaded: batched lookups
+    targets = {
+        (sid, i): attachment_sp_path(payload, path)
+        for sid, (payload, paths) in jobs.items()
+        for i, path in enumerate(paths)
+    }
+    present = graph_get_items(token, site_id, list(targets.values()), select="id") if targets else {}
+    for (sid, i), sp_path in targets.items():
+        if present.get(sp_path) is not None:
+            results[sid][i] = sp_path
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(upload_attachment, token, site_id, payload, path): (sid, i, path)
+            for sid, (payload, paths) in jobs.items()
+            for i, path in enumerate(paths)
+            if i not in results[sid]
+        }
+        for future in as_completed(futures):
+            sid, i, path = futures[future]
+            try:
+                results[sid][i] = future.result()
+            except Exception as e:
+                errors.append(f"{sid}: {path}: {e}")
+                continue
+            folder = os.path.dirname(results[sid][i])
+            index_entries.setdefault(folder, []).append(
+                partition_index_entry(results[sid][i], sid, os.path.getsize(local_path(path)))
+            )
+
+    for folder, entries in index_entries.items():
+        try:
+            update_sp_attachment_index(token, site_id, folder, entries)
+        except Exception as e:
+            errors.append(f"{folder}: index not updated: {e}")
+
+    uploaded = 0
+    for sid, (payload, paths) in jobs.items():
+        if len(results[sid]) != len(paths):
+            continue
+        sp_paths = [results[sid][i] for i in range(len(paths))]
+        payload["sp_attachments"] = sp_paths
+        update_submission(sid, {"sp_attachments": sp_paths}, db_path=db_path)
+        uploaded += len(sp_paths)
+    return uploaded, errors
+
+
+def run_backfill(
+    db_path: str = DB_FILE, dry_run: bool = False, workers: int = UPLOAD_WORKERS, attachments: bool = True
+) -> dict:
+    """
+    Pushes every local submission missing from the SharePoint workbook(s) (one
+    rewrite per shard), after uploading its pending images, and fills in the
+    attachments of rows written before their images were up. Safe to re-run:
+    rows are matched by submission_id and existing files are not re-uploaded.
+    """
+    if not graph_is_configured():
+        raise RuntimeError("Graph is not configured (missing TENANT_ID/CLIENT_ID/CLIENT_SECRET/SP_* settings).")
+
+    # JSON files written while the database was unavailable
+    import_json_dir(db_path=db_path)
+
+    token = graph_get_token()
+    site_id = graph_get_site_id(token)
+    remote = remote_attachment_cells(token, site_id)
+
+    local = list(iter_submissions(db_path=db_path))
+    missing_rows = [p for p in local if p["submission_id"] not in remote]
+    pending = [p for p in local if pending_attachments(p)]
+    report = {
+        "local": len(local),
+        "remote": len(remote),
+        "missing_rows": len(missing_rows),
+        "pending_attachments": sum(len(pending_attachments(p)) for p in pending),
+        "uploaded_attachments": 0,
+        "appended_rows": 0,
+        "updated_rows": 0,
+        "errors": [],
+    }
+    if dry_run:
+        return report
+
+    if attachments and pending:
+        report["uploaded_attachments"], report["errors"] = backfill_attachments(
+            token, site_id, pending, workers, db_path
+        )
+
+    # rows written before their images were up: point them at the uploaded files
+    # (conditional rewrite from the mirror; rows appended below already carry them)
+    updates = workbook_attachment_updates(local, remote)
+    if updates:
+        try:
+            report["updated_rows"] = update_rows_in_workbooks(token, site_id, updates)
+        except Exception as e:
+            report["errors"].append(f"workbook rows: {e}; re-run to update them")
+
+    report["appended_rows"] = append_rows_to_workbooks(token, site_id, missing_rows)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Push local submissions (rows + images) missing from SharePoint.")
+    parser.add_argument("--dry-run", action="store_true", help="only report what is missing")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS, help="parallel image uploads")
+    parser.add_argument("--no-attachments", action="store_true", help="only reconcile workbook rows")
+    parser.add_argument("--db", default=DB_FILE)
+    args = parser.parse_args()
+
+    report = run_backfill(db_path=args.db, dry_run=args.dry_run, workers=args.workers, attachments=not args.no_attachments)
+    print(
+        f"Local: {report['local']}  remote: {report['remote']}  missing rows: {report['missing_rows']}  "
+        f"pending images: {report['pending_attachments']}"
+    )
+    if not args.dry_run:
+        print(
+            f"Uploaded {report['uploaded_attachments']} image(s), appended {report['appended_rows']} row(s), "
+            f"updated {report['updated_rows']} row(s)."
+        )
+    for err in report["errors"]:
+        print(f"  ! {err}")
@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import api
+from benchmark_graph import LATENCY_MS, use_fake_graph
+from ids import make_idempotency_key
+
+# ------------------------- Config ------------------------- #
+SINGLE_SUBMITS = 20
+CONCURRENT_SUBMITS = 10
+BATCH_SIZES = [10, 50]
+API_TOKEN = "bench-token"
+
+
+# ==========================================================
+# In-process HTTP client (drives the ASGI app directly: routing, token check,
+# JSON parsing, validation and the real submit, without a socket)
+# ==========================================================
+async def post(path: str, body, headers: dict | None = None) -> tuple[int, dict]:
+    content = json.dumps(body).encode()
+    headers = {"content-type": "application/json", "authorization": f"Bearer {API_TOKEN}", **(headers or {})}
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", api.API_PORT),
+    }
+    pending = [{"type": "http.request", "body": content, "more_body": False}]
+    messages = []
+
+    async def receive():
+        return pending.pop() if pending else {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    await api.app(scope, receive, send)
+    status = next(m["status"] for m in messages if m["type"] == "http.response.start")
+    return status, json.loads(b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body"))
+
+
+def _fields(i: int) -> dict:
+    return {"driver_id": f"{10000 + i}", "idc_id": "678", "idc_liaison": "I don't know", "vehicle_type": "Van",
+            "station": "BARR", "route_number": f"{4000 + i % 1000}", "route_date": "2026-01-01", "severity": "Medium",
+            "estimated_time_lost": "15–30 min", "main_issue_category": "Routing", "sub_category": "Loop / backtracking"}
+
+
+# ==========================================================
+# Scenarios
+# ==========================================================
+async def singles(n: int) -> int:
+    for i in range(n):
+        status, result = await post("/api/submissions", _fields(i), {"idempotency-key": make_idempotency_key()})
+        if status != 201:
+            raise RuntimeError(f"benchmark submit failed ({status}): {result}")
+    return n
+
+
+async def concurrent_singles(n: int) -> int:
+    posts = [post("/api/submissions", _fields(i), {"idempotency-key": make_idempotency_key()}) for i in range(n)]
+    for status, result in await asyncio.gather(*posts):
+        if status != 201:
+            raise RuntimeError(f"benchmark submit failed ({status}): {result}")
+    return n
+
+
+async def batch(n: int) -> int:
+    status, result = await post("/api/submissions/batch", {"submissions": [_fields(i) for i in range(n)]})
+    if status != 200 or result["created"] != n:
+        raise RuntimeError(f"benchmark batch failed ({status}): {result}")
+    return n
+
+
+def scenarios() -> dict:
+    return {
+        f"{SINGLE_SUBMITS} single posts, one after another": lambda: singles(SINGLE_SUBMITS),
+        f"{CONCURRENT_SUBMITS} single posts at once": lambda: concurrent_singles(CONCURRENT_SUBMITS),
+        **{f"batch post of {n}": (lambda n=n: batch(n)) for n in BATCH_SIZES},
+    }
+
+
+# ==========================================================
+# One measurement (fresh process in an empty folder: the local store and
+# workbook cache are the benchmark's own)
+# ==========================================================
+def measure(latency_ms: float) -> dict[str, tuple[int, float, int]]:
+    fake = use_fake_graph(latency_ms)
+    api.API_TOKEN = API_TOKEN
+    results = {}
+    for name, scenario in scenarios().items():
+        fake.round_trips.clear()
+        start = time.perf_counter()
+        submissions = asyncio.run(scenario())
+        results[name] = (submissions, time.perf_counter() - start, sum(fake.round_trips.values()))
+    return results
+
+
+def run_isolated(latency_ms: float) -> dict[str, tuple[int, float, int]]:
+    code = f"import json, benchmark_api as b; print(json.dumps(b.measure({latency_ms!r})))"
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [here, os.getenv("PYTHONPATH")]))}
+    with tempfile.TemporaryDirectory() as folder:
+        out = subprocess.run([sys.executable, "-c", code], cwd=folder, env=env, check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Submissions/sec through the HTTP API, against a stubbed Graph.")
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS, help="simulated Graph round-trip time")
+    args = parser.parse_args()
+
+    results = run_isolated(args.latency_ms)
+    print(f"{'scenario':<40} {'submits':>8} {'seconds':>8} {'submits/s':>10} {'graph calls':>12}")
+    for name, (submissions, seconds, calls) in results.items():
+        print(f"{name:<40} {submissions:>8} {seconds:>8.2f} {submissions / seconds:>10.1f} {calls:>12}")
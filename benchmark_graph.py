@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from io import BytesIO
+from collections import Counter
+from urllib.parse import unquote, urlsplit
+
+import numpy as np
+import requests
+from PIL import Image
+
+import sharepoint
+from attachments import SpooledAttachment
+from ids import make_idempotency_key
+from pipeline import build_payload, submit_feedback, submit_feedback_batch
+from sharepoint import GRAPH_BASE, graph_ensure_folders, graph_get_items, graph_get_site_id, graph_get_token
+
+# ------------------------- Config ------------------------- #
+IMAGES_PER_SUBMIT = 3
+BATCH_SUBMITS = 10
+BACKFILL_FILES = 40
+LATENCY_MS = 60  # simulated round trip to Graph
+
+
+# ==========================================================
+# In-process stand-in for Graph (counts round trips, adds latency)
+# ==========================================================
+class FakeGraph:
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self.files: dict[str, tuple[str, bytes]] = {}
+        self.folders: set[str] = {"/General"}
+        self.round_trips = Counter()
+
+    # one HTTP exchange
+    def __call__(self, method, url, headers=None, data=None, json=None, params=None, **kwargs):
+        time.sleep(self.latency_s)
+        parts = urlsplit(url)
+        self.round_trips["$batch" if parts.path.endswith("/$batch") else method.upper()] += 1
+        if parts.netloc == "login.microsoftonline.com":
+            return self._response(200, {"access_token": "t", "expires_in": 3599})
+        if parts.path.endswith("/$batch"):
+            responses = []
+            for req in json["requests"]:
+                status, body = self.handle(req["method"], req["url"], req.get("headers") or {}, req.get("body"))
+                responses.append({"id": req["id"], "status": status, "body": body})
+            return self._response(200, {"responses": responses})
+        if parts.netloc == "download":
+            return self._response(200, self.files[unquote(parts.path)][1])
+        relative = url[len(GRAPH_BASE):] + (f"?$select={params['$select']}" if params and "$select" in params else "")
+        status, body = self.handle(method.upper(), relative, headers or {}, json, data)
+        return self._response(status, body)
+
+    def handle(self, method, url, headers, body=None, data=None):
+        parts = urlsplit(url)
+        path = unquote(parts.path)
+        if path.startswith("/sites/") and ":/drive" not in path and "/drive/" not in path:
+            return 200, {"id": "site"}
+        item_path = path.split("/drive/root", 1)[1].lstrip(":")
+        if method == "POST" and item_path.endswith("/children"):
+            parent = item_path[: -len(":/children")] if item_path.endswith(":/children") else ""
+            self.folders.add(f"{parent}/{body['name']}")
+            return 201, {"id": body["name"]}
+        if method == "PUT":
+            file_path = item_path[: -len(":/content")]
+            content = data.read() if hasattr(data, "read") else data
+            etag = f'"{len(self.files)}-{time.monotonic_ns()}"'
+            self.files[file_path] = (etag, content)
+            return 201, {"id": file_path, "eTag": etag}
+        if item_path in self.folders:
+            return 200, {"id": item_path}
+        if item_path not in self.files:
+            return 404, {"error": {"code": "itemNotFound"}}
+        etag, _ = self.files[item_path]
+        if headers.get("If-None-Match") == etag:
+            return 304, None
+        return 200, {"id": item_path, "eTag": etag, "@microsoft.graph.downloadUrl": f"https://download{item_path}"}
+
+    @staticmethod
+    def _response(status: int, body) -> requests.Response:
+        r = requests.Response()
+        r.status_code = status
+        r._content = body if isinstance(body, bytes) else (b"" if body is None else json.dumps(body).encode())
+        return r
+
+
+# ==========================================================
+# Scenarios (the real submit: pipeline.submit_feedback / submit_feedback_batch)
+# ==========================================================
+def _jpeg(seed: int, quality: int = 90) -> bytes:
+    rng = np.random.default_rng(seed)
+    out = BytesIO()
+    Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)).save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+def _images(seed: int, count: int, quality: int = 90) -> list[SpooledAttachment]:
+    return [SpooledAttachment(f"photo_{i}.jpg", len(c), content=c) for i, c in
+            ((i, _jpeg(seed * 100 + i, quality)) for i in range(count))]
+
+
+def _payload(**extra) -> dict:
+    fields = {"driver_id": "12345", "idc_id": "678", "station": "BARR", "route_number": "4321",
+              "route_date": "2026-01-01", "severity": "Medium", "main_issue_category": "Routing"}
+    return {**build_payload(fields), **extra}
+
+
+class Submits:
+    """Submits in the order a process sees them; later scenarios reuse earlier images and ids."""
+
+    def __init__(self):
+        self.receipts = []
+
+    def submit(self, seed: int, images: int, quality: int = 90, **extra) -> None:
+        receipt, _ = submit_feedback(_payload(**extra), _images(seed, images, quality), make_idempotency_key())
+        if not (receipt["sp_files_ok"] and receipt["sp_excel_ok"]):
+            raise RuntimeError(f"benchmark submit failed: {receipt}")
+        self.receipts.append(receipt)
+
+    def batch(self, submits: int) -> None:
+        items = [(_payload(), _images(1000 + i, 1), make_idempotency_key()) for i in range(submits)]
+        for receipt, _ in submit_feedback_batch(items):
+            if not (receipt["sp_files_ok"] and receipt["sp_excel_ok"]):
+                raise RuntimeError(f"benchmark submit failed: {receipt}")
+
+
+def backfill_check(files: int) -> None:
+    token = graph_get_token()
+    site_id = graph_get_site_id(token)
+    graph_get_items(token, site_id, [f"/General/ROF_Attachments/rof_{i}.jpg" for i in range(files)], select="id")
+
+
+def partition_folders() -> None:
+    token = graph_get_token()
+    site_id = graph_get_site_id(token)
+    graph_ensure_folders(token, site_id, ["/General/ROF_Attachments/BARR/2026/01", "/General/ROF_Attachments/CALG/2026/01"])
+
+
+def scenarios(s: Submits) -> dict:
+    n = IMAGES_PER_SUBMIT
+    return {
+        f"first submit, {n} images (cold process)": lambda: s.submit(1, n),
+        f"next submit, {n} images": lambda: s.submit(2, n),
+        f"same {n} images re-encoded (near-duplicates)": lambda: s.submit(2, n, quality=70),
+        f"re-sent submit (same id), {n} images": lambda: s.submit(2, n, submission_id=s.receipts[1]["submission_id"]),
+        f"batch of {BATCH_SUBMITS} submits, 1 image each": lambda: s.batch(BATCH_SUBMITS),
+        f"backfill check, {BACKFILL_FILES} files": lambda: backfill_check(BACKFILL_FILES),
+        "partition folders (2 x station/YYYY/MM)": partition_folders,
+    }
+
+
+# ==========================================================
+# One measurement (fresh process in an empty folder: nothing cached, the
+# local store, image index and workbook cache are the benchmark's own)
+# ==========================================================
+def use_fake_graph(latency_ms: float, batched: bool = True) -> FakeGraph:
+    """Routes every Graph request of this process to a FakeGraph, with benchmark settings."""
+    fake = FakeGraph(latency_ms / 1000)
+    requests.Session.request = fake
+    # set directly: configure() leaves settings from secrets/env alone
+    for name, value in {
+        "TENANT_ID": "bench",
+        "CLIENT_ID": "bench",
+        "CLIENT_SECRET": "bench",
+        "SP_HOSTNAME": "contoso.sharepoint.com",
+        "SP_SITE_PATH": "/sites/rof",
+        "SP_EXCEL_PATH": "/General/feedback.xlsx",
+        "SP_ATTACHMENTS_FOLDER": "/General/ROF_Attachments",
+        "SP_GRAPH_BATCH": batched,
+    }.items():
+        setattr(sharepoint, name, value)
+    return fake
+
+
+def measure(batched: bool, latency_ms: float) -> dict[str, tuple[int, float]]:
+    fake = use_fake_graph(latency_ms, batched)
+    results = {}
+    for name, scenario in scenarios(Submits()).items():
+        fake.round_trips.clear()
+        start = time.perf_counter()
+        scenario()
+        results[name] = (sum(fake.round_trips.values()), time.perf_counter() - start)
+    return results
+
+
+def run_isolated(batched: bool, latency_ms: float) -> dict[str, tuple[int, float]]:
+    code = f"import json, benchmark_graph as b; print(json.dumps(b.measure({batched!r}, {latency_ms!r})))"
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [here, os.getenv("PYTHONPATH")]))}
+    with tempfile.TemporaryDirectory() as folder:
+        out = subprocess.run([sys.executable, "-c", code], cwd=folder, env=env, check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Graph round trips of the real submit path, one call each vs $batch.")
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS, help="simulated round-trip time")
+    args = parser.parse_args()
+
+    individual, batched = run_isolated(False, args.latency_ms), run_isolated(True, args.latency_ms)
+    print(f"{'scenario':<46} {'calls':>6} {'batched':>8} {'seconds':>8} {'batched':>8}")
+    for name in individual:
+        (n1, t1), (n2, t2) = individual[name], batched[name]
+        print(f"{name:<46} {n1:>6} {n2:>8} {t1:>8.2f} {t2:>8.2f}")
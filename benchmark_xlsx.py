@@ -0,0 +1,89 @@
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from xlsx_writer import dataframe_to_xlsx_bytes
+
+# ------------------------- Config ------------------------- #
+ROW_COUNTS = [10_000, 50_000, 100_000]
+WRITERS = ["pandas", "streaming"]
+
+
+# ==========================================================
+# Synthetic workbook (same shape as the submissions sheet)
+# ==========================================================
+def synthetic_submissions(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    stations = np.array(["BARR", "BLVL", "BELO", "BRANT", "CALG", "MTL1", "TOR2"])
+    severities = np.array(["Low", "Medium", "High", "Critical"])
+    return pd.DataFrame(
+        {
+            "submission_id": [f"rof_20260101T000000.{i:06d}Z_BENCH000" for i in range(n)],
+            "submitted_at_utc": pd.Timestamp("2026-01-01T00:00:00Z").isoformat(),
+            "driver_id": rng.integers(10_000, 99_999, n).astype(str),
+            "idc_id": rng.integers(100, 999, n).astype(str),
+            "station": stations[rng.integers(0, len(stations), n)],
+            "route_number": rng.integers(1000, 9999, n).astype(str),
+            "route_date": "2026-01-01",
+            "severity": severities[rng.integers(0, len(severities), n)],
+            "route_satisfaction": "3 - Neutral",
+            "time_lost_min_mid": rng.choice([2.5, 10.0, 22.5, 45.0, np.nan], n),
+            "main_issue_category": "Routing",
+            "sub_category": "Loop / backtracking",
+            "what_happened": "Stop order sent me back across the bridge twice before the last three stops. " * 2,
+            "suggestion": "Group the stops on the east side together.",
+            "sp_attachments": [["/General/ROF_Attachments/photo.jpg"]] * n,
+        }
+    )
+
+
+# ==========================================================
+# One measurement (run in a fresh process so peak RSS is not shared)
+# ==========================================================
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(writer: str, n: int) -> dict:
+    df = synthetic_submissions(n)
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    if writer == "pandas":
+        out = BytesIO()
+        with pd.ExcelWriter(out, engine="openpyxl") as w:
+            df.to_excel(w, index=False, sheet_name="Submissions")
+        size = len(out.getvalue())
+    else:
+        size = len(dataframe_to_xlsx_bytes(df))
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "peak_rss_mb": _peak_rss_mb(), "write_rss_mb": _peak_rss_mb() - baseline, "size": size}
+
+
+def run_isolated(writer: str, n: int) -> dict:
+    code = f"import json, benchmark_xlsx as b; print(json.dumps(b.measure({writer!r}, {n})))"
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare DataFrame.to_excel with the streaming XLSX writer.")
+    parser.add_argument("--rows", type=int, action="append", help=f"row count, repeatable (default: {ROW_COUNTS})")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8}  {'writer':<10} {'seconds':>8} {'peak RSS':>10} {'+RSS write':>11} {'size':>9}")
+    for n in args.rows or ROW_COUNTS:
+        for writer in WRITERS:
+            r = run_isolated(writer, n)
+            print(
+                f"{n:>8}  {writer:<10} {r['seconds']:>8.2f} {r['peak_rss_mb']:>8.0f}MB "
+                f"{r['write_rss_mb']:>9.0f}MB {r['size'] / 1024 / 1024:>7.1f}MB"
+            )
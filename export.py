@@ -0,0 +1,214 @@
+import io
+import os
+import csv
+import json
+import argparse
+from typing import IO, Iterator
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from store import DB_FILE, ROUTE_ROLLUP_COLUMNS, iter_submissions, load_route_rollups_df
+from xlsx_writer import write_rows_xlsx
+
+# ------------------------- Config ------------------------- #
+EXPORT_FORMATS = ["csv", "parquet", "xlsx"]
+# "routes": one row per (station, route_number, route_date), see store.route_rollups
+EXPORT_DATASETS = ["submissions", "routes"]
+CHUNK_SIZE = 1000
+
+# Fixed column order so every chunk (and every format) has the same header
+EXPORT_COLUMNS = [
+    "submission_id",
+    "submitted_at_utc",
+    "driver_id",
+    "idc_id",
+    "idc_liaison",
+    "station",
+    "route_number",
+    "route_date",
+    "vehicle_type",
+    "parcel_tracking_id",
+    "issue_applies_to",
+    "stop_number",
+    "severity",
+    "route_satisfaction",
+    "route_satisfaction_int",
+    "estimated_time_lost",
+    "time_lost_min_low",
+    "time_lost_min_high",
+    "time_lost_min_mid",
+    "main_issue_category",
+    "sub_category",
+    "what_happened",
+    "what_should_have_happened",
+    "suggestion",
+    "sp_attachments",
+    "attachments",
+    "text_cluster",
+    "text_cluster_terms",
+]
+
+MIME_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+# ==========================================================
+# Rows (generators, one chunk in memory at a time)
+# ==========================================================
+def _flatten(payload: dict, columns: list[str] = EXPORT_COLUMNS) -> list:
+    row = []
+    for col in columns:
+        value = payload.get(col)
+        if isinstance(value, (list, dict)):
+            value = json.dumps(value, ensure_ascii=False)
+        row.append(value)
+    return row
+
+
+def iter_export_chunks(
+    chunk_size: int = CHUNK_SIZE,
+    db_path: str = DB_FILE,
+    date_from=None,
+    date_to=None,
+    stations: list[str] | None = None,
+    categories: list[str] | None = None,
+    severities: list[str] | None = None,
+) -> Iterator[list[list]]:
+    """Yields lists of rows (in EXPORT_COLUMNS order) matching the filters."""
+    payloads = iter_submissions(
+        db_path=db_path,
+        date_from=date_from,
+        date_to=date_to,
+        station=stations,
+        main_issue_category=categories,
+        severity=severities,
+    )
+    chunk = []
+    for payload in payloads:
+        chunk.append(_flatten(payload))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_route_chunks(
+    chunk_size: int = CHUNK_SIZE,
+    db_path: str = DB_FILE,
+    date_from=None,
+    date_to=None,
+    stations: list[str] | None = None,
+    categories: list[str] | None = None,
+    severities: list[str] | None = None,
+) -> Iterator[list[list]]:
+    """Yields route rollup rows (in ROUTE_ROLLUP_COLUMNS order); the table is small, one query."""
+    if categories or severities:
+        raise ValueError("Route rollups can only be filtered by route date and station.")
+    df = load_route_rollups_df(db_path=db_path, date_from=date_from, date_to=date_to, station=stations)
+    rows = [_flatten(r, ROUTE_ROLLUP_COLUMNS) for r in df.to_dict("records")]
+    for i in range(0, len(rows), chunk_size):
+        yield rows[i:i + chunk_size]
+
+
+# ==========================================================
+# Writers
+# ==========================================================
+def write_csv(chunks: Iterator[list[list]], out: IO[bytes], columns: list[str] = EXPORT_COLUMNS) -> int:
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    n = 0
+    for chunk in chunks:
+        writer.writerows(chunk)
+        n += len(chunk)
+    text.flush()
+    text.detach()  # leave `out` open for the caller
+    return n
+
+
+def write_parquet(chunks: Iterator[list[list]], out: IO[bytes], columns: list[str] = EXPORT_COLUMNS) -> int:
+    # All columns as strings: payload values are heterogeneous across app versions
+    schema = pa.schema([(c, pa.string()) for c in columns])
+    n = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            arrays = [pa.array([None if v is None else str(v) for v in col], type=pa.string()) for col in columns]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            n += len(chunk)
+        if n == 0:
+            writer.write_table(schema.empty_table())
+    return n
+
+
+def write_xlsx(chunks: Iterator[list[list]], out: IO[bytes], columns: list[str] = EXPORT_COLUMNS) -> int:
+    return write_rows_xlsx(out, columns, (row for chunk in chunks for row in chunk))
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet, "xlsx": write_xlsx}
+
+
+def export_submissions(
+    out: IO[bytes],
+    fmt: str = "csv",
+    chunk_size: int = CHUNK_SIZE,
+    db_path: str = DB_FILE,
+    dataset: str = "submissions",
+    **filters,
+) -> int:
+    """Streams the filtered submissions (or route rollups) into `out` (a binary file). Returns the row count."""
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt} (expected one of {', '.join(EXPORT_FORMATS)})")
+    if dataset == "submissions":
+        chunks, columns = iter_export_chunks(chunk_size=chunk_size, db_path=db_path, **filters), EXPORT_COLUMNS
+    elif dataset == "routes":
+        chunks, columns = iter_route_chunks(chunk_size=chunk_size, db_path=db_path, **filters), ROUTE_ROLLUP_COLUMNS
+    else:
+        raise ValueError(f"Unknown export dataset: {dataset} (expected one of {', '.join(EXPORT_DATASETS)})")
+    return WRITERS[fmt](chunks, out, columns)
+
+
+def export_filename(fmt: str, dataset: str = "submissions") -> str:
+    suffix = "" if dataset == "submissions" else f"_{dataset}"
+    return f"route_optimization_feedback_export{suffix}.{fmt}"
+
+
+# ==========================================================
+# CLI
+# ==========================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export filtered submissions to CSV, Parquet or XLSX.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--dataset", choices=EXPORT_DATASETS, default="submissions", help="routes: per-route rollup")
+    parser.add_argument("--output", "-o", help="output file (default: route_optimization_feedback_export.<format>)")
+    parser.add_argument("--from", dest="date_from", help="route date from (YYYY-MM-DD, inclusive)")
+    parser.add_argument("--to", dest="date_to", help="route date to (YYYY-MM-DD, inclusive)")
+    parser.add_argument("--station", action="append", dest="stations", help="repeatable")
+    parser.add_argument("--category", action="append", dest="categories", help="main issue category, repeatable")
+    parser.add_argument("--severity", action="append", dest="severities", help="repeatable")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--db", default=DB_FILE, help="submissions database")
+    args = parser.parse_args()
+
+    output = args.output or export_filename(args.format, args.dataset)
+    tmp = output + ".part"
+    with open(tmp, "wb") as f:
+        count = export_submissions(
+            f,
+            fmt=args.format,
+            dataset=args.dataset,
+            chunk_size=args.chunk_size,
+            db_path=args.db,
+            date_from=args.date_from,
+            date_to=args.date_to,
+            stations=args.stations,
+            categories=args.categories,
+            severities=args.severities,
+        )
+    os.replace(tmp, output)
+    print(f"Exported {count} {'route(s)' if args.dataset == 'routes' else 'submission(s)'} to {output}")
@@ -0,0 +1,377 @@
+import os
+import re
+import csv
+import json
+import time
+import hashlib
+import argparse
+from contextlib import closing
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from metrics import canonical_time_lost_label
+from ids import make_submission_id_at
+from pipeline import build_payload, submit_feedback_batch
+from store import SUBMISSIONS_DIR
+from validation import FORMS_IMPORT_VALIDATOR, LEGACY_FORMS_IMPORT_VALIDATOR
+
+# ------------------------- Config ------------------------- #
+IMPORTS_DIR = os.path.join(SUBMISSIONS_DIR, "cache", "imports")
+# Rows per chunk: validated together, stored in parallel, one Excel append
+CHUNK_ROWS = 500
+# Forms writes Start/Completion time without a zone, in the form owner's time zone
+FORMS_TIMEZONE = "UTC"
+
+# Forms question (normalized header, full match) -> payload field, first match wins.
+# Several columns may map to one field (branching questions, "Enter new ..."):
+# the first non-blank value is used.
+FORMS_COLUMNS = [
+    ("forms_response_id", r"id"),
+    ("forms_started_at", r"start time"),
+    ("forms_completed_at", r"completion time"),
+    ("driver_id", r"driver id"),
+    ("idc_id", r"idc id"),
+    ("driver_last_name", r"(driver )?last name"),
+    ("driver_first_name", r"(driver )?first name"),
+    ("driver_email", r"driver email"),
+    ("idc_liaison", r"(who is your )?idc liaison"),
+    ("idc", r"idc|enter new idc name"),
+    ("station", r"station|enter new station code"),
+    ("route_number", r"route number"),
+    ("route_date", r"route date"),
+    ("vehicle_type", r"(what type of )?vehicle( do you have| type)?"),
+    ("issue_applies_to", r"this issue applies to"),
+    ("stop_number", r"stop number"),
+    ("severity", r"severity"),
+    ("route_satisfaction", r"route satisfaction( / rating)?|rating"),
+    ("estimated_time_lost", r"estimated time lost"),
+    ("parcel_tracking_id", r"parcel tracking id"),
+    ("main_issue_category", r"main issue category"),
+    ("sub_category", r"sub-?category"),
+    ("what_happened", r"what happened"),
+    ("what_should_have_happened", r"what should have happened( ideally)?"),
+    ("suggestion", r"suggestions?"),
+]
+FORMS_FIELDS = [field for field, _ in FORMS_COLUMNS]
+
+# Kept on the payload next to what build_payload() produces
+EXTRA_FIELDS = ["driver_last_name", "driver_first_name", "driver_email", "idc", "forms_started_at", "forms_completed_at"]
+
+# ==========================================================
+# Reading exports (.xlsx or .csv), row by row
+# ==========================================================
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))  # numbers typed in Forms come back as floats (1234.0)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def open_export(path: str) -> tuple[list[str], object, int | None]:
+    """(headers, iterator over data rows as lists of text, number of data rows if known)."""
+    if path.lower().endswith(".csv"):
+        f = open(path, "r", encoding="utf-8-sig", newline="")
+        reader = csv.reader(f)
+        headers = next(reader, [])
+
+        def rows():
+            with f:
+                for row in reader:
+                    yield [cell.strip() for cell in row]
+
+        return headers, rows(), None
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    ws = wb.worksheets[0]
+    it = ws.iter_rows(values_only=True)
+    headers = [_cell_text(h) for h in next(it, ())]
+
+    def rows():
+        try:
+            for row in it:
+                yield [_cell_text(v) for v in row]
+        finally:
+            wb.close()
+
+    return headers, rows(), (ws.max_row - 1) if ws.max_row else None
+
+
+def iter_chunks(rows, chunk_rows: int, skip: int = 0):
+    """(row number of the first row, rows) per chunk; row numbers count data rows from 1."""
+    chunk, first = [], skip + 1
+    for number, row in enumerate(rows, start=1):
+        if number <= skip:
+            continue
+        chunk.append(row)
+        if len(chunk) == chunk_rows:
+            yield first, chunk
+            chunk, first = [], number + 1
+    if chunk:
+        yield first, chunk
+
+
+# ==========================================================
+# Columns -> payload
+# ==========================================================
+def normalize_header(header) -> str:
+    s = str(header or "").lower()
+    s = re.sub(r"\(.*?\)", " ", s)  # "(optional)", "(digits only, e.g., 1235)"
+    s = re.sub(r"\.\d+$|(?<=[a-z])\d+$", "", s.strip())  # duplicate titles: "Sub-category2", "Sub-category.1"
+    s = re.sub(r"[*?:]", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def map_columns(headers: list[str], overrides: dict[str, str] | None = None) -> dict[str, list[int]]:
+    """payload field -> indexes of the export columns holding it (overrides: {header: field})."""
+    overrides = overrides or {}
+    unknown = set(overrides.values()) - set(FORMS_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown field(s) in column map: {', '.join(sorted(unknown))}")
+    mapping: dict[str, list[int]] = {}
+    for i, header in enumerate(headers):
+        field = overrides.get(header)
+        if field is None:
+            normalized = normalize_header(header)
+            field = next((f for f, pattern in FORMS_COLUMNS if re.fullmatch(pattern, normalized)), None)
+        if field is not None:
+            mapping.setdefault(field, []).append(i)
+    return mapping
+
+
+def import_validator(mapping: dict[str, list[int]]):
+    """Exports without a Driver ID question come from the older survey (driver name + email)."""
+    return FORMS_IMPORT_VALIDATOR if "driver_id" in mapping else LEGACY_FORMS_IMPORT_VALIDATOR
+
+
+def rows_to_frame(rows: list[list[str]], mapping: dict[str, list[int]]) -> pd.DataFrame:
+    """Payloads (one per row) with dates and time-lost labels normalized, as a DataFrame for validate_frame."""
+    records = []
+    for row in rows:
+        fields = {}
+        for field, columns in mapping.items():
+            fields[field] = next((row[i] for i in columns if i < len(row) and row[i]), "")
+        payload = build_payload(fields)
+        payload.update({f: fields[f] for f in EXTRA_FIELDS if fields.get(f)})
+        payload["forms_response_id"] = fields.get("forms_response_id", "")
+        records.append(payload)
+    if not records:
+        return pd.DataFrame(columns=[*build_payload({}), *EXTRA_FIELDS, "forms_response_id"])
+    df = pd.DataFrame(records)
+
+    # Forms writes dates in the respondent's locale; unparseable ones are left for validation to report
+    parsed = pd.to_datetime(df["route_date"], errors="coerce", format="mixed")
+    df["route_date"] = parsed.dt.strftime("%Y-%m-%d").where(parsed.notna(), df["route_date"])
+    df["estimated_time_lost"] = df["estimated_time_lost"].map(canonical_time_lost_label)
+    return df
+
+
+# ==========================================================
+# Import state (resume after an interruption)
+#
+#   imports/<export name>.state.json    rows done + counts, rewritten after every chunk
+#   imports/<export name>.rejects.csv   rows that failed validation, with the messages
+#
+# A restarted import skips the rows already done. The chunk that was running
+# is run again: each row's idempotency key comes from the Forms response ID,
+# so rows that made it are reported as duplicates, not stored twice, and the
+# rejects it had written are dropped before it writes them again.
+# ==========================================================
+def _state_paths(path: str, imports_dir: str) -> tuple[str, str]:
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", os.path.basename(path))
+    return os.path.join(imports_dir, f"{name}.state.json"), os.path.join(imports_dir, f"{name}.rejects.csv")
+
+
+def _load_state(path: str, imports_dir: str, restart: bool) -> dict:
+    state_path, _ = _state_paths(path, imports_dir)
+    fresh = {"source": os.path.abspath(path), "size": os.path.getsize(path), "rows_done": 0,
+             "created": 0, "duplicate": 0, "invalid": 0}
+    if restart or not os.path.exists(state_path):
+        return fresh
+    with open(state_path, "r", encoding="utf-8") as r:
+        state = json.load(r)
+    # a different file under the same name: start over (the idempotency keys still prevent duplicates)
+    return state if state.get("size") == fresh["size"] else fresh
+
+
+def _save_state(state: dict, path: str, imports_dir: str) -> None:
+    state_path, _ = _state_paths(path, imports_dir)
+    state["updated_at_utc"] = datetime.now(timezone.utc).isoformat()
+    tmp = state_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as w:
+        json.dump(state, w, ensure_ascii=False, indent=2)
+    os.replace(tmp, state_path)
+
+
+def _keep_rejects_upto(rows_done: int, path: str, imports_dir: str) -> None:
+    """Drops rejects past rows_done (written by a chunk that did not finish); all of them for a fresh import."""
+    _, rejects_path = _state_paths(path, imports_dir)
+    if not os.path.exists(rejects_path):
+        return
+    if rows_done == 0:
+        os.remove(rejects_path)
+        return
+    with open(rejects_path, "r", encoding="utf-8", newline="") as r:
+        lines = list(csv.reader(r))
+    kept = [line for line in lines[1:] if line and int(line[0]) <= rows_done]
+    if len(kept) == len(lines) - 1:
+        return
+    tmp = rejects_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as w:
+        csv.writer(w).writerows([lines[0], *kept])
+    os.replace(tmp, rejects_path)
+
+
+def _append_rejects(rejects: list[list], path: str, imports_dir: str) -> None:
+    _, rejects_path = _state_paths(path, imports_dir)
+    new_file = not os.path.exists(rejects_path)
+    with open(rejects_path, "a", encoding="utf-8", newline="") as w:
+        writer = csv.writer(w)
+        if new_file:
+            writer.writerow(["row", "forms_response_id", "errors"])
+        writer.writerows(rejects)
+
+
+def response_time(payload: dict, tz: str = FORMS_TIMEZONE) -> datetime | None:
+    """When the response was made (completion time, else start time), in UTC; None if neither parses."""
+    for field in ("forms_completed_at", "forms_started_at"):
+        moment = pd.to_datetime(payload.get(field) or None, errors="coerce", format="mixed")
+        if pd.notna(moment):
+            moment = moment.to_pydatetime()
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=ZoneInfo(tz))
+            return moment.astimezone(timezone.utc)
+    return None
+
+
+def form_key_for(headers: list[str]) -> str:
+    """Identifies the form from its questions, so every export of one form gets the same keys."""
+    return hashlib.sha1("\n".join(normalize_header(h) for h in headers).encode("utf-8")).hexdigest()[:12]
+
+
+def _print_progress(state: dict) -> None:
+    total = f"/{state['rows_total']}" if state.get("rows_total") else ""
+    print(
+        f"rows {state['rows_done']}{total}: {state['created']} {'valid' if state.get('dry_run') else 'created'}, {state['duplicate']} already imported, "
+        f"{state['invalid']} invalid ({state['rows_per_s']:.0f} rows/s)"
+    )
+
+
+# ==========================================================
+# Import
+# ==========================================================
+def import_forms_export(
+    path: str,
+    chunk_rows: int = CHUNK_ROWS,
+    column_map: dict[str, str] | None = None,
+    form_key: str | None = None,
+    restart: bool = False,
+    dry_run: bool = False,
+    imports_dir: str = IMPORTS_DIR,
+    progress=_print_progress,
+    tz: str = FORMS_TIMEZONE,
+    export: tuple | None = None,
+) -> dict:
+    """
+    Imports a Microsoft Forms response export chunk by chunk: columns are
+    mapped to the payload, each chunk is validated in one pass and the valid
+    rows go through the submit pipeline together (local store + SharePoint,
+    one Excel append per chunk). dry_run validates only and writes nothing.
+    Submission ids and times are those of the responses (tz: zone of the
+    export's times). export: what open_export(path) returned, if already open.
+    """
+    headers, rows, rows_total = export or open_export(path)
+    mapping = map_columns(headers, column_map)
+    validator = import_validator(mapping)
+    form_key = form_key or form_key_for(headers)
+
+    os.makedirs(imports_dir, exist_ok=True)
+    state = _load_state(path, imports_dir, restart or dry_run)
+    if not dry_run:
+        _keep_rejects_upto(state["rows_done"], path, imports_dir)
+    state.update({"dry_run": dry_run, "rows_total": rows_total, "mapped": {f: [headers[i] for i in c] for f, c in mapping.items()}})
+    started, rows_at_start = time.perf_counter(), state["rows_done"]
+
+    # closes the export file even when a chunk fails
+    with closing(rows):
+        for first, chunk in iter_chunks(rows, chunk_rows, skip=state["rows_done"]):
+            numbers = [first + i for i, row in enumerate(chunk) if any(row)]  # Excel keeps trailing blank rows
+            df = rows_to_frame([row for row in chunk if any(row)], mapping)
+            errors = validator.validate_frame(df) if numbers else []  # a chunk of blank rows is skipped
+
+            items, rejects = [], []
+            for number, payload, row_errors in zip(numbers, df.to_dict("records"), errors):
+                response_id = payload.pop("forms_response_id")
+                if row_errors:
+                    rejects.append([number, response_id, " | ".join(row_errors)])
+                    continue
+                payload = {k: v for k, v in payload.items() if not (isinstance(v, float) and pd.isna(v))}
+                payload["source"] = "microsoft_forms"
+                key = f"msforms:{form_key}:{response_id or f'row{number}'}"
+                made_at = response_time(payload, tz)
+                if made_at is not None:
+                    # stored as made then, not as submitted today (ids, rollups, exports sort by it)
+                    payload["submission_id"] = make_submission_id_at(made_at, key)
+                    payload["submitted_at_utc"] = made_at.isoformat()
+                items.append((payload, [], key))
+
+            state["invalid"] += len(rejects)
+            if dry_run:
+                state["created"] += len(items)
+            else:
+                if rejects:
+                    _append_rejects(rejects, path, imports_dir)
+                if items:
+                    for _, replayed in submit_feedback_batch(items):
+                        state["duplicate" if replayed else "created"] += 1
+
+            state["rows_done"] = first + len(chunk) - 1
+            state["rows_per_s"] = (state["rows_done"] - rows_at_start) / max(time.perf_counter() - started, 1e-9)
+            if not dry_run:
+                _save_state(state, path, imports_dir)
+            if progress:
+                progress(state)
+    return state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a Microsoft Forms response export (.xlsx or .csv).")
+    parser.add_argument("path")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--map", metavar="JSON", help='extra column mapping, e.g. {"Your driver number": "driver_id"}')
+    parser.add_argument("--form-key", help="identifies the form in idempotency keys (default: hash of the questions)")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved progress and start from row 1")
+    parser.add_argument("--dry-run", action="store_true", help="map and validate only")
+    parser.add_argument("--tz", default=FORMS_TIMEZONE, help=f"time zone of the export's times (default {FORMS_TIMEZONE})")
+    args = parser.parse_args()
+
+    export = open_export(args.path)
+    headers = export[0]
+    overrides = json.loads(args.map) if args.map else None
+    mapping = map_columns(headers, overrides)
+    print("Columns: " + ", ".join(f"{field} <- {' | '.join(headers[i] for i in cols)}" for field, cols in mapping.items()))
+    missing = [f for f in import_validator(mapping).schema if f not in mapping]
+    if missing:
+        print("Checked fields not in this export (map them with --map): " + ", ".join(missing))
+
+    state = import_forms_export(
+        args.path,
+        chunk_rows=args.chunk_rows,
+        column_map=overrides,
+        form_key=args.form_key,
+        restart=args.restart,
+        dry_run=args.dry_run,
+        tz=args.tz,
+        export=export,
+    )
+    print(
+        f"Done: {state['created']} {'valid' if args.dry_run else 'created'}, {state['duplicate']} already imported, "
+        f"{state['invalid']} invalid."
+    )
+    if state["invalid"] and not args.dry_run:
+        print(f"Invalid rows: {_state_paths(args.path, IMPORTS_DIR)[1]}")
@@ -0,0 +1,94 @@
+import os
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+
+# ------------------------- Config ------------------------- #
+ID_PREFIX = "rof_"
+TIME_FORMAT = "%Y%m%dT%H%M%S.%fZ"
+# len("20260129T185640.684196Z")
+TIME_PART_LEN = 23
+
+# Crockford base32: sortable, no I/L/O/U
+CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+NODE_CHARS = 8  # 40 bits
+
+# ==========================================================
+# Monotonic, collision-free submission ids
+#
+#   rof_20260129T185640.684196Z_7QK2M9XA
+#   └── time (µs, UTC) ────────┘ └ node ┘
+#
+# The time part keeps the historical format, so new ids sort (and range-scan)
+# together with the ids already stored. Within a process the time part
+# strictly increases (a repeated or backwards clock is bumped by 1 µs);
+# the node part is random per process, so replicas/processes never collide.
+# ==========================================================
+_lock = threading.Lock()
+_last_time: datetime | None = None
+_node: str | None = None
+_node_pid: int | None = None
+
+
+def _encode_base32(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(CROCKFORD[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def _process_node() -> str:
+    global _node, _node_pid
+    # re-draw after fork so child processes don't share the parent's node
+    if _node is None or _node_pid != os.getpid():
+        _node = _encode_base32(int.from_bytes(os.urandom(5), "big"), NODE_CHARS)
+        _node_pid = os.getpid()
+    return _node
+
+
+def make_submission_id() -> str:
+    global _last_time
+    with _lock:
+        now = datetime.now(timezone.utc)
+        if _last_time is not None and now <= _last_time:
+            now = _last_time + timedelta(microseconds=1)
+        _last_time = now
+        node = _process_node()
+    return f"{ID_PREFIX}{now.strftime(TIME_FORMAT)}_{node}"
+
+
+def make_submission_id_at(moment: datetime, seed: str) -> str:
+    """
+    Id for a submission made at `moment` (imports of older responses), so it
+    sorts with the ids created at that time. The node part comes from `seed`
+    (e.g. the import's idempotency key): the same response always gets the
+    same id, and responses made in the same microsecond still differ.
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    node = _encode_base32(int.from_bytes(hashlib.sha1(seed.encode("utf-8")).digest()[:5], "big"), NODE_CHARS)
+    return f"{ID_PREFIX}{moment.astimezone(timezone.utc).strftime(TIME_FORMAT)}_{node}"
+
+
+def make_idempotency_key() -> str:
+    """Random key identifying one filled-in form, whatever the number of submit attempts."""
+    return os.urandom(16).hex()
+
+
+def submission_id_time(submission_id: str) -> datetime:
+    """Decodes the UTC timestamp of a submission id (new and legacy formats)."""
+    if not submission_id.startswith(ID_PREFIX):
+        raise ValueError(f"Not a submission id: {submission_id}")
+    time_part = submission_id[len(ID_PREFIX):len(ID_PREFIX) + TIME_PART_LEN]
+    return datetime.strptime(time_part, TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def submission_id_bound(moment: datetime) -> str:
+    """
+    Smallest possible id at `moment`: every id created at or after it sorts >= the
+    bound, every id created before it sorts <. Use it to range-scan by id.
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return f"{ID_PREFIX}{moment.astimezone(timezone.utc).strftime(TIME_FORMAT)}"
@@ -0,0 +1,205 @@
+import os
+import json
+import threading
+from io import BytesIO
+from typing import IO
+
+from PIL import Image, ImageOps
+
+from store import SUBMISSIONS_DIR
+
+# ------------------------- Config ------------------------- #
+PHASH_DIR = os.path.join(SUBMISSIONS_DIR, "cache", "phash")
+LOCAL_INDEX_FILE = os.path.join(PHASH_DIR, "local.jsonl")
+SHAREPOINT_INDEX_FILE = os.path.join(PHASH_DIR, "sharepoint.jsonl")
+
+# Max differing bits (out of 64) for two images to count as the same picture.
+# Re-encoding / resizing typically moves a dHash by 0-4 bits; at 8 bits two
+# different photos of the same kind of scene (a dashboard, a door) can match,
+# and the later one would be stored as a link to the wrong picture.
+NEAR_DUPLICATE_MAX_DISTANCE = 4
+
+
+# ==========================================================
+# dHash (difference hash)
+# ==========================================================
+def dhash(content: bytes | IO[bytes], size: int = 8) -> int | None:
+    """
+    64-bit difference hash: shrink to (size+1) x size grayscale and compare
+    horizontally adjacent pixels. Accepts bytes or a binary file (read from
+    where it is, e.g. a spooled attachment). Returns None if it is not an image.
+    """
+    try:
+        with Image.open(content if hasattr(content, "read") else BytesIO(content)) as img:
+            img = ImageOps.exif_transpose(img).convert("L").resize((size + 1, size), Image.LANCZOS)
+            pixels = list(img.getdata())
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+# ==========================================================
+# BK-tree (metric tree for Hamming-distance lookups)
+# ==========================================================
+class BKTree:
+    def __init__(self):
+        self.root = None  # [hash, item, {distance: child}]
+        self.size = 0
+
+    def add(self, h: int, item) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = [h, item, {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(h, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, item, {}]
+                return
+            node = child
+
+    def search(self, h: int, max_distance: int) -> list[tuple[int, object]]:
+        """All (distance, item) within max_distance of h, closest first."""
+        if self.root is None:
+            return []
+        found, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= max_distance:
+                found.append((d, node[1]))
+            # triangle inequality: only children in [d - r, d + r] can match
+            for dist, child in node[2].items():
+                if d - max_distance <= dist <= d + max_distance:
+                    stack.append(child)
+        return sorted(found, key=lambda x: x[0])
+
+
+# ==========================================================
+# Persistent index (append-only JSONL + in-memory BK-tree)
+# ==========================================================
+class PHashIndex:
+    """
+    One JSON line per stored image: {"hash": "<hex>", "path": ..., "submission_id": ...},
+    and {"path": ..., "removed": true} once a file is known to be gone.
+    Other processes append to the same file; refresh() picks up their lines,
+    and reloads the whole file after rewrite_paths() replaced it (new inode).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tree = BKTree()
+        self._offset = 0
+        self._file_id: tuple | None = None
+        self._removed: set[str] = set()
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as r:
+            st = os.fstat(r.fileno())
+            if (st.st_dev, st.st_ino) != self._file_id or st.st_size < self._offset:
+                # first read, or the file was rewritten (maybe by another process): start over
+                self.tree = BKTree()
+                self._removed = set()
+                self._offset = 0
+                self._file_id = (st.st_dev, st.st_ino)
+            r.seek(self._offset)
+            for line in r:
+                if not line.endswith("\n"):
+                    break  # partially written by another process; read it next time
+                self._offset += len(line.encode("utf-8"))
+                try:
+                    entry = json.loads(line)
+                    if entry.get("removed"):
+                        self._removed.add(entry["path"])
+                        continue
+                    self.tree.add(int(entry["hash"], 16), entry)
+                    self._removed.discard(entry["path"])
+                except (ValueError, KeyError):
+                    continue
+
+    def load(self) -> None:
+        """Reads lines appended since the last lookup (the whole file the first time)."""
+        with self._lock:
+            self.refresh()
+
+    def find(self, h: int, max_distance: int = NEAR_DUPLICATE_MAX_DISTANCE) -> dict | None:
+        """Closest stored image within max_distance, or None."""
+        with self._lock:
+            self.refresh()
+            matches = self.tree.search(h, max_distance)
+            return next((item for _, item in matches if item["path"] not in self._removed), None)
+
+    def add(self, h: int, path: str, **info) -> None:
+        self._append({"hash": f"{h:016x}", "path": path, **info})
+
+    def remove(self, path: str) -> None:
+        """Marks a stored file as gone (deleted or moved outside the migration); find() skips it."""
+        self._append({"path": path, "removed": True})
+
+    def _append(self, entry: dict) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            # single small O_APPEND write, so concurrent writers don't interleave lines
+            with open(self.path, "a", encoding="utf-8") as w:
+                w.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.refresh()
+
+    def rewrite_paths(self, moved: dict[str, str]) -> int:
+        """
+        Points entries at the new location of moved files (old path -> new path). Returns entries changed.
+        The file is replaced, not edited: running processes reload it on their next lookup, but a line
+        another process appends during the rewrite is lost, so run migrations between submits.
+        """
+        if not moved or not os.path.exists(self.path):
+            return 0
+        changed = 0
+        with self._lock:
+            with open(self.path, "r", encoding="utf-8") as r:
+                lines = r.readlines()
+            out = []
+            for line in lines:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    out.append(line)
+                    continue
+                if entry.get("path") in moved:
+                    entry["path"] = moved[entry["path"]]
+                    changed += 1
+                out.append(json.dumps(entry, ensure_ascii=False) + "\n")
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as w:
+                w.writelines(out)
+            os.replace(tmp, self.path)
+            self.refresh()  # new file: reloads from scratch, as other processes will on their next refresh()
+        return changed
+
+
+_indexes: dict[str, PHashIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path: str) -> PHashIndex:
+    """The process-wide index for path, loaded; concurrent sessions share one BK-tree build."""
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = PHashIndex(path)
+    index.load()
+    return index
@@ -0,0 +1,247 @@
+import os
+import re
+import json
+
+import numpy as np
+import pandas as pd
+
+from store import DB_FILE, SUBMISSIONS_DIR, count_submissions, iter_changed_submissions
+
+# ------------------------- Config ------------------------- #
+ROLLUPS_DIR = os.path.join(SUBMISSIONS_DIR, "cache", "rollups")
+ROLLUPS_STATE_FILE = "state.json"
+# One row of dimensions and measures per submission; rollups are regrouped from it
+ROLLUP_FACTS_FILE = "facts.parquet"
+
+# "60+ min" has no upper bound in the form; we cap it so it still gets a midpoint
+TIME_LOST_OPEN_ENDED_CAP_MIN = 90
+
+# (low, high) in minutes for each option of the "Estimated time lost" radio
+TIME_LOST_BUCKETS = {
+    "0–15 min": (0, 15),
+    "15–30 min": (15, 30),
+    "30–60 min": (30, 60),
+    "60+ min": (60, TIME_LOST_OPEN_ENDED_CAP_MIN),
+}
+
+# Numeric columns materialized on every payload at ingest
+NUMERIC_COLUMNS = [
+    "time_lost_min_low",
+    "time_lost_min_high",
+    "time_lost_min_mid",
+    "route_satisfaction_int",
+]
+
+ROLLUP_DIMENSIONS = {
+    "station": ["station"],
+    "route": ["station", "route_number"],
+    "issue_category": ["main_issue_category"],
+    "week": ["week"],
+}
+
+# Additive measures only, so rollups are plain sums over the per-submission facts
+ROLLUP_MEASURES = [
+    "submissions",
+    "hours_lost",
+    "hours_lost_low",
+    "hours_lost_high",
+    "rated_submissions",
+    "satisfaction_sum",
+]
+
+
+# ==========================================================
+# Numeric model (single payload)
+# ==========================================================
+def _normalize_time_lost_label(label) -> str:
+    s = str(label or "").strip()
+    s = s.replace("-", "–").replace("—", "–")
+    s = re.sub(r"\s*–\s*", "–", s)
+    return re.sub(r"\s+", " ", s)
+
+
+_TIME_LOST_LOOKUP = {_normalize_time_lost_label(k): v for k, v in TIME_LOST_BUCKETS.items()}
+_TIME_LOST_CANONICAL = {_normalize_time_lost_label(k): k for k in TIME_LOST_BUCKETS}
+
+
+def canonical_time_lost_label(label):
+    """The TIME_LOST_BUCKETS spelling of label ("1-5 min" -> "1–5 min"); unknown labels are returned as is."""
+    return _TIME_LOST_CANONICAL.get(_normalize_time_lost_label(label), label)
+
+
+def parse_time_lost(label) -> tuple[int, int, float] | None:
+    """Returns (low, high, midpoint) in minutes, or None if the label is unknown."""
+    bounds = _TIME_LOST_LOOKUP.get(_normalize_time_lost_label(label))
+    if bounds is None:
+        return None
+    low, high = bounds
+    return low, high, (low + high) / 2
+
+
+def parse_rating(value) -> int | None:
+    try:
+        rating = int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return rating if 0 <= rating <= 5 else None
+
+
+def numeric_fields(payload: dict) -> dict:
+    parsed = parse_time_lost(payload.get("estimated_time_lost"))
+    low, high, mid = parsed if parsed else (None, None, None)
+    return {
+        "time_lost_min_low": low,
+        "time_lost_min_high": high,
+        "time_lost_min_mid": mid,
+        "route_satisfaction_int": parse_rating(payload.get("route_satisfaction")),
+    }
+
+
+# ==========================================================
+# Numeric model (DataFrame, vectorized)
+# ==========================================================
+def add_numeric_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Fills the numeric columns for rows that were ingested before they existed."""
+    df = df.copy()
+    labels = df.get("estimated_time_lost", pd.Series(index=df.index, dtype=object))
+    keys = labels.map(_normalize_time_lost_label)
+    low = keys.map({k: v[0] for k, v in _TIME_LOST_LOOKUP.items()}).astype(float)
+    high = keys.map({k: v[1] for k, v in _TIME_LOST_LOOKUP.items()}).astype(float)
+
+    rating = pd.to_numeric(df.get("route_satisfaction", pd.Series(index=df.index, dtype=object)), errors="coerce")
+    rating = rating.where(rating.between(0, 5))
+
+    computed = {
+        "time_lost_min_low": low,
+        "time_lost_min_high": high,
+        "time_lost_min_mid": (low + high) / 2,
+        "route_satisfaction_int": rating,
+    }
+    for col, values in computed.items():
+        existing = pd.to_numeric(df[col], errors="coerce") if col in df.columns else None
+        df[col] = values if existing is None else existing.fillna(values)
+    df["route_satisfaction_int"] = df["route_satisfaction_int"].astype("Int64")
+    return df
+
+
+# ==========================================================
+# Driver-hours lost rollups
+# ==========================================================
+def _rollup_facts(df: pd.DataFrame) -> pd.DataFrame:
+    df = add_numeric_columns(df)
+    for col in ("station", "route_number", "main_issue_category"):
+        if col not in df.columns:
+            df[col] = ""
+        df[col] = df[col].fillna("").astype(str).str.strip()
+
+    route_date = pd.to_datetime(df.get("route_date", pd.Series(index=df.index, dtype=object)), errors="coerce")
+    # Monday of the route week
+    df["week"] = (route_date - pd.to_timedelta(route_date.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d").fillna("")
+
+    rating = df["route_satisfaction_int"].astype(float)
+    rated = rating.fillna(0) > 0  # 0 = "not applicable" on the form
+    df["submissions"] = 1
+    df["hours_lost"] = df["time_lost_min_mid"].fillna(0) / 60
+    df["hours_lost_low"] = df["time_lost_min_low"].fillna(0) / 60
+    df["hours_lost_high"] = df["time_lost_min_high"].fillna(0) / 60
+    df["rated_submissions"] = rated.astype(int)
+    df["satisfaction_sum"] = np.where(rated, rating, 0)
+    return df
+
+
+_FACT_DIMENSIONS = list(dict.fromkeys(col for dims in ROLLUP_DIMENSIONS.values() for col in dims))
+
+
+def _fact_rows(df: pd.DataFrame) -> pd.DataFrame:
+    facts = _rollup_facts(df)
+    if "submission_id" not in facts.columns:
+        facts["submission_id"] = ""
+    return facts[["submission_id"] + _FACT_DIMENSIONS + ROLLUP_MEASURES].reset_index(drop=True)
+
+
+def _group_facts(facts: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    return {
+        name: facts.groupby(dims, as_index=False)[ROLLUP_MEASURES].sum()
+        for name, dims in ROLLUP_DIMENSIONS.items()
+    }
+
+
+def compute_rollups(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    return _group_facts(_rollup_facts(df))
+
+
+def _rollup_path(name: str, rollups_dir: str) -> str:
+    return os.path.join(rollups_dir, f"{name}.parquet")
+
+
+def _read_state(rollups_dir: str) -> dict:
+    path = os.path.join(rollups_dir, ROLLUPS_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as r:
+        return json.load(r)
+
+
+def _write_state(state: dict, rollups_dir: str) -> None:
+    path = os.path.join(rollups_dir, ROLLUPS_STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as w:
+        json.dump(state, w, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def load_rollups(rollups_dir: str = ROLLUPS_DIR) -> dict[str, pd.DataFrame]:
+    out = {}
+    for name in ROLLUP_DIMENSIONS:
+        path = _rollup_path(name, rollups_dir)
+        out[name] = pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame()
+    return out
+
+
+def _read_changes(after_seq: int, db_path: str) -> tuple[int, list[dict]]:
+    last_change, payloads = after_seq, []
+    for seq, payload in iter_changed_submissions(after_seq, db_path):
+        last_change = seq
+        payloads.append(payload)
+    return last_change, payloads
+
+
+def refresh_rollups(db_path: str = DB_FILE, rollups_dir: str = ROLLUPS_DIR) -> dict[str, pd.DataFrame]:
+    """
+    Re-folds the submissions inserted or edited since the cached change counter
+    (see store.iter_changed_submissions) into the per-submission facts, replacing
+    the facts of edited rows, and regroups the rollups from them.
+    Only changed submissions are read; a missing cache or a deleted row triggers a full rebuild.
+    """
+    os.makedirs(rollups_dir, exist_ok=True)
+    state = _read_state(rollups_dir)
+    facts_path = os.path.join(rollups_dir, ROLLUP_FACTS_FILE)
+    # no "last_change": no cache yet, or one from a version that only folded in new rows
+    facts = pd.read_parquet(facts_path) if "last_change" in state and os.path.exists(facts_path) else None
+
+    last_change, payloads = _read_changes(state.get("last_change", 0) if facts is not None else 0, db_path)
+    if payloads:
+        changed = _fact_rows(pd.DataFrame(payloads))
+        if facts is not None:
+            facts = facts[~facts["submission_id"].isin(changed["submission_id"])]
+            changed = pd.concat([facts, changed], ignore_index=True)
+        facts = changed
+    if facts is not None and len(facts) != count_submissions(db_path):
+        # rows were deleted since the cache was written, their facts are stale
+        last_change, payloads = _read_changes(0, db_path)
+        facts = _fact_rows(pd.DataFrame(payloads, columns=None if payloads else ["submission_id"]))
+    elif not payloads:
+        return load_rollups(rollups_dir)
+
+    rollups = _group_facts(facts)
+    for name, df in rollups.items():
+        df.to_parquet(_rollup_path(name, rollups_dir), index=False)
+    facts.to_parquet(facts_path, index=False)
+    _write_state({"last_change": last_change}, rollups_dir)
+    return rollups
+
+
+if __name__ == "__main__":
+    for name, df in refresh_rollups().items():
+        print(f"\n== hours lost by {name} ==")
+        print(df.sort_values("hours_lost", ascending=False).head(20).to_string(index=False))
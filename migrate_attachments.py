@@ -0,0 +1,274 @@
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from attachments import ATTACHMENTS_DIR, attachment_partition, partition_index_entry, record_local_attachment
+from image_hash import LOCAL_INDEX_FILE, SHAREPOINT_INDEX_FILE, get_index
+from archive import update_archived_submissions
+from store import DB_FILE, iter_submissions, local_path, update_submissions
+from sharepoint import (
+    GRAPH_BATCH_LIMIT,
+    drive_path_url,
+    graph_batch,
+    graph_ensure_folders,
+    graph_get_items,
+    graph_get_site_id,
+    graph_get_token,
+    graph_is_configured,
+    sp_attachment_partition_folder,
+    sp_attachments_folder,
+    update_rows_in_workbooks,
+    update_sp_attachment_index,
+)
+
+# ------------------------- Config ------------------------- #
+MOVE_WORKERS = 8
+
+
+# ==========================================================
+# Plan: flat files -> <STATION>/<YYYY>/<MM>/
+#
+# A file can be referenced by several submissions (near-duplicate images are
+# linked, not copied). It goes to the partition of the first submission that
+# references it, i.e. the one that stored it.
+# ==========================================================
+def _is_flat_local(stored_path: str) -> bool:
+    return os.path.dirname(os.path.abspath(local_path(stored_path))) == os.path.abspath(ATTACHMENTS_DIR)
+
+
+def _is_flat_sharepoint(sp_path: str) -> bool:
+    return sp_path.rsplit("/", 1)[0] == sp_attachments_folder()
+
+
+def plan_local_moves(payloads: list[dict]) -> dict[str, tuple[str, str]]:
+    """stored path -> (new path, owner submission_id), for files still in the flat folder."""
+    moves = {}
+    for payload in payloads:
+        for p in payload.get("attachments") or []:
+            if not p or p in moves or not _is_flat_local(p):
+                continue
+            partition = attachment_partition(payload.get("station"), payload["submission_id"])
+            new = os.path.join(ATTACHMENTS_DIR, *partition.split("/"), os.path.basename(local_path(p)))
+            # the target already exists when an earlier run moved the file but stopped before rewriting paths
+            if os.path.exists(local_path(p)) or os.path.exists(new):
+                moves[p] = (new, payload["submission_id"])
+    return moves
+
+
+def plan_sharepoint_moves(payloads: list[dict]) -> dict[str, tuple[str, str]]:
+    moves = {}
+    for payload in payloads:
+        for p in payload.get("sp_attachments") or []:
+            if p and p not in moves and _is_flat_sharepoint(p):
+                folder = sp_attachment_partition_folder(payload.get("station"), payload["submission_id"])
+                moves[p] = (f"{folder}/{p.rsplit('/', 1)[1]}", payload["submission_id"])
+    return moves
+
+
+# ==========================================================
+# Moves
+# ==========================================================
+def move_local(moves: dict[str, tuple[str, str]], workers: int = MOVE_WORKERS) -> tuple[dict[str, str], list[str]]:
+    """Renames files into their partition (same disk: no copy). Returns ({old: new}, errors)."""
+    moved, errors = {}, []
+
+    def move(old: str, new: str, submission_id: str) -> None:
+        if not os.path.exists(local_path(old)) and os.path.exists(new):
+            return
+        os.makedirs(os.path.dirname(new), exist_ok=True)
+        os.replace(local_path(old), new)
+        record_local_attachment(new, submission_id)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(move, old, new, sid): (old, new) for old, (new, sid) in moves.items()}
+        for future in as_completed(futures):
+            old, new = futures[future]
+            try:
+                future.result()
+                moved[old] = new
+            except Exception as e:
+                errors.append(f"{old}: {e}")
+    return moved, errors
+
+
+def move_sharepoint(
+    token: str, site_id: str, moves: dict[str, tuple[str, str]], workers: int = MOVE_WORKERS
+) -> tuple[dict[str, str], list[str]]:
+    """
+    Moves files server-side (PATCH parentReference, nothing is downloaded):
+    target folders are created first, then moves go 20 per $batch call,
+    several calls in parallel. Returns ({old: new}, errors).
+    """
+    if not moves:
+        return {}, []
+    graph_ensure_folders(token, site_id, sorted({new.rsplit("/", 1)[0] for new, _ in moves.values()}))
+
+    def move_chunk(chunk: list[str]) -> list[tuple[str, dict]]:
+        reqs = [
+            {
+                "method": "PATCH",
+                "url": drive_path_url(site_id, old),
+                "body": {"parentReference": {"path": f"/drive/root:{moves[old][0].rsplit('/', 1)[0]}"}},
+            }
+            for old in chunk
+        ]
+        return list(zip(chunk, graph_batch(token, reqs)))
+
+    olds = list(moves)
+    moved, errors, missing = {}, [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(move_chunk, olds[i:i + GRAPH_BATCH_LIMIT]) for i in range(0, len(olds), GRAPH_BATCH_LIMIT)
+        ]
+        for future in as_completed(futures):
+            for old, resp in future.result():
+                if 200 <= resp["status"] < 300:
+                    moved[old] = moves[old][0]
+                elif resp["status"] == 404:
+                    missing.append(old)
+                else:
+                    errors.append(f"{old}: {resp['status']} - {resp['body']}")
+
+    # Not at the old path: moved by an earlier, interrupted run?
+    if missing:
+        found = graph_get_items(token, site_id, [moves[old][0] for old in missing], select="id")
+        for old in missing:
+            if found.get(moves[old][0]) is not None:
+                moved[old] = moves[old][0]
+            else:
+                errors.append(f"{old}: not found")
+    return moved, errors
+
+
+def update_sharepoint_indexes(
+    token: str, site_id: str, moves: dict[str, tuple[str, str]], moved: dict[str, str]
+) -> None:
+    by_folder: dict[str, list[dict]] = {}
+    for old, new in moved.items():
+        by_folder.setdefault(new.rsplit("/", 1)[0], []).append(partition_index_entry(new, moves[old][1]))
+    for folder, entries in by_folder.items():
+        update_sp_attachment_index(token, site_id, folder, entries)
+
+
+# ==========================================================
+# Stored paths
+# ==========================================================
+def path_updates(payloads: list[dict], local_moved: dict[str, str], sp_moved: dict[str, str]) -> dict[str, dict]:
+    """{submission_id: {"attachments"/"sp_attachments": new paths}} for the submissions referencing a moved file."""
+    updates = {}
+    for payload in payloads:
+        fields = {}
+        attachments = payload.get("attachments") or []
+        if any(p in local_moved for p in attachments):
+            fields["attachments"] = [local_moved.get(p, p) for p in attachments]
+        sp_attachments = payload.get("sp_attachments") or []
+        if any(p in sp_moved for p in sp_attachments):
+            fields["sp_attachments"] = [sp_moved.get(p, p) for p in sp_attachments]
+        if fields:
+            updates[payload["submission_id"]] = fields
+    return updates
+
+
+def rewrite_stored_paths(
+    updates: dict[str, dict], local_moved: dict[str, str], sp_moved: dict[str, str], db_path: str = DB_FILE
+) -> int:
+    """
+    Points every local copy of the submissions (database row, JSON file, daily
+    archive) and the image-hash indexes at the new paths. The archives matter:
+    the database is re-imported from them when it is rebuilt.
+    """
+    rewritten = update_submissions(updates, db_path=db_path)
+    update_archived_submissions(updates)
+    get_index(LOCAL_INDEX_FILE).rewrite_paths(local_moved)
+    get_index(SHAREPOINT_INDEX_FILE).rewrite_paths(sp_moved)
+    return rewritten
+
+
+def run_migration(
+    db_path: str = DB_FILE,
+    dry_run: bool = False,
+    workers: int = MOVE_WORKERS,
+    local: bool = True,
+    sharepoint: bool = True,
+) -> dict:
+    """
+    Moves flat attachments into <STATION>/<YYYY>/<MM>/ partitions (locally and
+    in SharePoint) and rewrites the stored paths, the rows of the SharePoint
+    workbook(s) included. Safe to re-run: files already in a partition are left alone.
+    """
+    payloads = list(iter_submissions(db_path=db_path))
+    local_moves = plan_local_moves(payloads) if local else {}
+    sp_moves = plan_sharepoint_moves(payloads) if sharepoint and graph_is_configured() else {}
+    report = {
+        "submissions": len(payloads),
+        "local_to_move": len(local_moves),
+        "sharepoint_to_move": len(sp_moves),
+        "local_moved": 0,
+        "sharepoint_moved": 0,
+        "rewritten": 0,
+        "workbook_rows": 0,
+        "errors": [],
+    }
+    if dry_run:
+        return report
+
+    local_moved, errors = move_local(local_moves, workers)
+    report["errors"] += errors
+
+    sp_moved = {}
+    if sp_moves:
+        token = graph_get_token()
+        site_id = graph_get_site_id(token)
+        sp_moved, errors = move_sharepoint(token, site_id, sp_moves, workers)
+        report["errors"] += errors
+        try:
+            update_sharepoint_indexes(token, site_id, sp_moves, sp_moved)
+        except Exception as e:
+            report["errors"].append(f"partition indexes: {e}")
+
+    report["local_moved"], report["sharepoint_moved"] = len(local_moved), len(sp_moved)
+    updates = path_updates(payloads, local_moved, sp_moved)
+
+    # the workbook rows hold both path lists too. First, so that when it fails the
+    # stored paths still name the old files and a re-run finds the same moves again.
+    if updates and graph_is_configured():
+        try:
+            token = graph_get_token()
+            report["workbook_rows"] = update_rows_in_workbooks(token, graph_get_site_id(token), updates)
+        except Exception as e:
+            report["errors"].append(f"workbook rows: {e}; stored paths not rewritten, re-run to finish")
+            return report
+    elif updates:
+        report["errors"].append(f"workbook rows: Graph is not configured, {len(updates)} submission(s) keep their old paths there")
+
+    report["rewritten"] = rewrite_stored_paths(updates, local_moved, sp_moved, db_path=db_path)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move flat attachments into station/YYYY/MM partitions.")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would move")
+    parser.add_argument("--workers", type=int, default=MOVE_WORKERS, help="parallel moves")
+    parser.add_argument("--local-only", action="store_true", help="don't move SharePoint files (workbook rows are still updated)")
+    parser.add_argument("--sharepoint-only", action="store_true", help="leave local files untouched")
+    parser.add_argument("--db", default=DB_FILE)
+    args = parser.parse_args()
+
+    report = run_migration(
+        db_path=args.db,
+        dry_run=args.dry_run,
+        workers=args.workers,
+        local=not args.sharepoint_only,
+        sharepoint=not args.local_only,
+    )
+    print(
+        f"Submissions: {report['submissions']}  to move: {report['local_to_move']} local, "
+        f"{report['sharepoint_to_move']} SharePoint"
+    )
+    if not args.dry_run:
+        print(
+            f"Moved {report['local_moved']} local and {report['sharepoint_moved']} SharePoint file(s); "
+            f"rewrote {report['rewritten']} submission(s) and {report['workbook_rows']} workbook row(s)."
+        )
+    for err in report["errors"]:
+        print(f"  ! {err}")
@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+import streamlit as st
+
+from export import EXPORT_DATASETS, EXPORT_FORMATS, MIME_TYPES, export_filename, export_submissions
+from store import distinct_values
+
+SEVERITY_OPTIONS = ["Low", "Medium", "High", "Critical"]
+
+st.set_page_config(page_title="Export feedback", page_icon="📤", layout="centered")
+st.title("📤 Export feedback")
+st.caption("Filtered export of the local submissions database, streamed to disk in chunks.")
+
+dataset = st.radio(
+    "Dataset",
+    options=EXPORT_DATASETS,
+    horizontal=True,
+    format_func=lambda d: "Submissions" if d == "submissions" else "Routes (one row per station / route / date)",
+)
+date_range = st.date_input("Route date", value=(), help="Optional range")
+stations = st.multiselect("Station", options=distinct_values("station"))
+categories, severities = [], []
+if dataset == "submissions":
+    categories = st.multiselect("Main issue category", options=distinct_values("main_issue_category"))
+    severities = st.multiselect("Severity", options=SEVERITY_OPTIONS)
+fmt = st.radio("Format", options=EXPORT_FORMATS, horizontal=True, format_func=str.upper)
+
+if st.button("Prepare export", type="primary"):
+    # Rows are streamed into a temp file; only the finished file is handed to the browser
+    with st.spinner("Exporting…"), tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as tmp:
+        count = export_submissions(
+            tmp,
+            fmt=fmt,
+            dataset=dataset,
+            date_from=date_range[0] if len(date_range) > 0 else None,
+            date_to=date_range[1] if len(date_range) > 1 else None,
+            stations=stations,
+            categories=categories,
+            severities=severities,
+        )
+    st.success(f"{count} {'route(s)' if dataset == 'routes' else 'submission(s)'} exported.")
+    try:
+        with open(tmp.name, "rb") as f:
+            st.download_button(
+                "Download",
+                data=f,
+                file_name=export_filename(fmt, dataset),
+                mime=MIME_TYPES[fmt],
+            )
+    finally:
+        os.remove(tmp.name)
@@ -0,0 +1,42 @@
+import streamlit as st
+
+from session_memory import SESSION_MEMORY_LIMIT_MB, memory_report, record_session_usage
+
+MB = 1024 * 1024
+
+st.set_page_config(page_title="Memory", page_icon="🧠", layout="wide")
+st.title("🧠 Memory")
+st.caption(
+    "What each live session holds in memory on this server. Sessions report on every rerun; "
+    "RSS is per process, so the part not held in session state is shown as unattributed."
+)
+
+current = record_session_usage()
+report = memory_report()
+
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Process RSS", f"{report.attrs['rss_mb']:.0f} MB")
+c2.metric("Unattributed", f"{report.attrs['unattributed_mb']:.0f} MB")
+c3.metric("Live sessions", len(report))
+c4.metric("Limit per session", f"{SESSION_MEMORY_LIMIT_MB:.0f} MB")
+
+st.subheader("Sessions")
+st.dataframe(
+    report,
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        "state_mb": st.column_config.NumberColumn("State (MB)", format="%.2f"),
+        "uploads_mb": st.column_config.NumberColumn("Uploads (MB)", format="%.2f"),
+        "peak_transient_mb": st.column_config.NumberColumn("Peak transient (MB)", format="%.1f"),
+        "rss_share_pct": st.column_config.NumberColumn("% of RSS", format="%.1f"),
+    },
+)
+
+st.subheader("Largest objects in this session's state")
+st.dataframe(
+    [{"key": key, "mb": size / MB} for key, size in current["top_objects"]],
+    hide_index=True,
+    use_container_width=True,
+    column_config={"mb": st.column_config.NumberColumn("MB", format="%.3f")},
+)
@@ -0,0 +1,49 @@
+import os
+import json
+
+import streamlit as st
+
+from reports import REPORT_CHARTS, generate_reports, latest_report
+from store import data_watermark
+
+st.set_page_config(page_title="Reports", page_icon="📊", layout="wide")
+st.title("📊 Reports")
+st.caption(
+    "Standard charts and summary workbook, built by `python reports.py --every 15` (or cron) "
+    "whenever new submissions arrive. This page only reads the cached files."
+)
+
+report = latest_report()
+if report is None or report["watermark"] != data_watermark():
+    st.info("New submissions since the last report." if report else "No report has been built yet.")
+    if st.button("Build now", type="primary"):
+        with st.spinner("Building report…"):
+            report = generate_reports()
+if report is None:
+    st.stop()
+
+overview = report["overview"]
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Submissions", overview["Submissions"])
+c2.metric("Stations", overview["Stations"])
+c3.metric("Driver-hours lost", overview["Driver-hours lost"])
+c4.metric("Built (UTC)", overview["Generated (UTC)"])
+
+with open(os.path.join(report["folder"], report["workbook"]), "rb") as f:
+    st.download_button(
+        "Download summary workbook",
+        data=f,
+        file_name=f"rof_report_{overview['Generated (UTC)'][:10]}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+for name in REPORT_CHARTS:
+    files = report["charts"].get(name, {})
+    if "vl.json" not in files:
+        continue
+    with open(os.path.join(report["folder"], files["vl.json"]), "r", encoding="utf-8") as r:
+        st.vega_lite_chart(json.load(r), use_container_width=True)
+    for fmt, mime in (("png", "image/png"), ("html", "text/html")):
+        if fmt in files:
+            with open(os.path.join(report["folder"], files[fmt]), "rb") as f:
+                st.download_button(f"{fmt.upper()}", data=f, file_name=files[fmt], mime=mime, key=f"{name}_{fmt}")
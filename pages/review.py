@@ -0,0 +1,134 @@
+import os
+import html
+
+import streamlit as st
+
+from store import distinct_values, iter_submissions, local_path
+from sharepoint import graph_download_file_bytes, graph_get_site_id, graph_get_token, graph_is_configured
+from thumbnails import local_thumbnail, sharepoint_thumbnail, thumbnail_url
+
+PAGE_SIZE = 10
+
+st.set_page_config(page_title="Review feedback", page_icon="🖼️", layout="wide")
+st.title("🖼️ Review feedback")
+
+st.markdown(
+    """
+<style>
+.thumbs { display: flex; flex-wrap: wrap; gap: 8px; margin: 6px 0 10px 0; }
+.thumbs figure { margin: 0; text-align: center; font-size: 12px; color: #666; }
+.thumbs img { height: 140px; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.15); background: #f5f5f5; }
+</style>
+""",
+    unsafe_allow_html=True,
+)
+
+
+def _graph_session() -> tuple[str, str] | None:
+    # sharepoint caches the token (until it expires) and site id in process memory;
+    # st.cache_data would pickle the bearer token into Streamlit's cache
+    if not graph_is_configured():
+        return None
+    token = graph_get_token()
+    return token, graph_get_site_id(token)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _full_size(kind: str, path: str) -> bytes | None:
+    # Full-resolution files are only fetched when a reviewer opens them
+    if kind == "local":
+        with open(path, "rb") as r:
+            return r.read()
+    session = _graph_session()
+    return graph_download_file_bytes(*session, path) if session else None
+
+
+def _attachments(payload: dict) -> list[tuple[str, str]]:
+    local = [("local", local_path(p)) for p in payload.get("attachments") or [] if p]
+    remote = [("sharepoint", p) for p in payload.get("sp_attachments") or [] if p]
+    return local + remote
+
+
+def _thumbnail_key(kind: str, path: str) -> str | None:
+    try:
+        if kind == "local":
+            return local_thumbnail(path)
+        session = _graph_session()
+        return sharepoint_thumbnail(*session, path) if session else None
+    except Exception:
+        return None
+
+
+def _gallery_html(items: list[tuple[str, str]]) -> str:
+    figures = []
+    for i, (kind, path) in enumerate(items, start=1):
+        key = _thumbnail_key(kind, path)
+        name = html.escape(os.path.basename(path))
+        if key:
+            # loading="lazy": the browser only requests thumbnails scrolled into view
+            img = f'<img loading="lazy" src="{thumbnail_url(key)}" alt="{name}" title="{name}">'
+        else:
+            img = f'<div title="{name}">No preview</div>'
+        figures.append(f"<figure>{img}<figcaption>#{i}</figcaption></figure>")
+    return f'<div class="thumbs">{"".join(figures)}</div>'
+
+
+# ------------------------- Filters ------------------------- #
+station_filter = st.selectbox("Station", options=[""] + distinct_values("station"), index=0)
+only_with_attachments = st.checkbox("Only submissions with attachments", value=True)
+
+
+def _matches(payload: dict) -> bool:
+    return bool(_attachments(payload)) or not only_with_attachments
+
+
+page = st.number_input("Page", min_value=1, value=1, step=1)
+skip = (page - 1) * PAGE_SIZE
+
+shown = []
+for payload in iter_submissions(descending=True, station=station_filter or None):
+    if not _matches(payload):
+        continue
+    if skip:
+        skip -= 1
+        continue
+    shown.append(payload)
+    if len(shown) >= PAGE_SIZE:
+        break
+
+if not shown:
+    st.info("No submissions on this page.")
+
+# ------------------------- Submissions ------------------------- #
+for payload in shown:
+    sid = payload.get("submission_id", "")
+    with st.container(border=True):
+        st.markdown(
+            f"**{html.escape(sid)}** · {payload.get('station') or '—'} · route {payload.get('route_number') or '—'} "
+            f"· {payload.get('route_date') or '—'} · **{payload.get('severity') or '—'}**"
+        )
+        st.caption(f"{payload.get('main_issue_category') or '—'} › {payload.get('sub_category') or '—'}")
+        for label, field in (("What happened", "what_happened"), ("Suggestion", "suggestion")):
+            if payload.get(field):
+                st.write(f"*{label}:* {payload[field]}")
+
+        items = _attachments(payload)
+        if not items:
+            continue
+        st.markdown(_gallery_html(items), unsafe_allow_html=True)
+
+        cols = st.columns(min(len(items), 8))
+        for i, (kind, path) in enumerate(items):
+            if cols[i % len(cols)].button(f"Open #{i + 1}", key=f"open_{sid}_{i}"):
+                st.session_state["review_open"] = (sid, kind, path)
+
+        opened = st.session_state.get("review_open")
+        if opened and opened[0] == sid:
+            _, kind, path = opened
+            try:
+                content = _full_size(kind, path)
+            except Exception as e:
+                content = None
+                st.warning(f"Unable to open {path}: {e}")
+            if content:
+                st.image(content, caption=os.path.basename(path))
@@ -0,0 +1,47 @@
+import streamlit as st
+
+from search_index import refresh_index, search, distinct_values
+
+SEVERITY_OPTIONS = ["Low", "Medium", "High", "Critical"]
+
+st.set_page_config(page_title="Search feedback", page_icon="🔎", layout="wide")
+st.title("🔎 Search feedback")
+st.caption("Searches What happened, What should have happened, Suggestion and Parcel Tracking ID.")
+
+# Picks up submissions saved by other processes since the last search
+new_docs = refresh_index()
+if new_docs:
+    st.toast(f"Indexed {new_docs} new submission(s).")
+
+query = st.text_input("Search", placeholder="e.g. gate code, wrong GPS pin, INTELXXX0001111")
+
+f1, f2, f3, f4 = st.columns(4)
+with f1:
+    stations = st.multiselect("Station", options=distinct_values("station"))
+with f2:
+    severities = st.multiselect("Severity", options=SEVERITY_OPTIONS)
+with f3:
+    categories = st.multiselect("Main issue category", options=distinct_values("main_issue_category"))
+with f4:
+    date_range = st.date_input("Route date", value=(), help="Optional range")
+
+limit = st.slider("Max results", min_value=10, max_value=200, value=50, step=10)
+
+if query.strip():
+    date_from = date_range[0].isoformat() if len(date_range) > 0 else None
+    date_to = date_range[1].isoformat() if len(date_range) > 1 else None
+
+    results, elapsed_ms = search(
+        query,
+        station=stations,
+        severity=severities,
+        category=categories,
+        date_from=date_from,
+        date_to=date_to,
+        limit=limit,
+    )
+    st.caption(f"{len(results)} result(s) in {elapsed_ms:.1f} ms")
+    if results.empty:
+        st.info("No matching feedback.")
+    else:
+        st.dataframe(results, use_container_width=True, hide_index=True)
@@ -0,0 +1,409 @@
+import os
+import json
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from metrics import numeric_fields
+from store import (
+    SUBMISSIONS_DIR,
+    SubmitInProgress,
+    claim_idempotency_key,
+    get_submission,
+    release_idempotency_key,
+    save_receipt,
+    save_submission_record,
+)
+from search_index import index_submission
+from image_hash import SHAREPOINT_INDEX_FILE, dhash, get_index
+from ids import make_submission_id
+from attachments import (
+    ATTACHMENTS_DIR,
+    SpooledAttachment,
+    local_attachment_dir,
+    partition_index_entry,
+    record_local_attachment,
+)
+from session_memory import track_transient
+from sharepoint import (
+    append_rows_to_workbooks,
+    build_sp_attachment_name,
+    excel_shard_key,
+    excel_shard_path,
+    graph_get_items,
+    graph_get_site_id,
+    graph_get_token,
+    graph_is_configured,
+    graph_upload_file_bytes,
+    mime_from_filename,
+    safe_filename,
+    sp_attachment_partition_folder,
+    update_sp_attachment_index,
+)
+
+log = logging.getLogger(__name__)
+
+# ------------------------- Config ------------------------- #
+# Submissions of one batch run their sinks (image uploads, local store) in parallel
+SINK_WORKERS = 8
+# Rows queued while a workbook rewrite runs go together in the next one, up to this many
+EXCEL_GROUP_MAX_ROWS = 500
+
+
+# ==========================================================
+# Payload (same fields and clean-up as the form in app3.py)
+# ==========================================================
+def build_payload(fields: dict) -> dict:
+    """Payload from raw field values (strings stripped, blank optional values as None)."""
+
+    def text(key: str) -> str:
+        value = fields.get(key)
+        return "" if value is None else str(value).strip()
+
+    issue_applies_to = text("issue_applies_to") or "Entire route"
+    return {
+        "driver_id": text("driver_id"),
+        "idc_id": text("idc_id"),
+        "idc_liaison": text("idc_liaison"),
+        "station": text("station"),
+        "route_number": text("route_number"),
+        "route_date": text("route_date"),
+        "vehicle_type": text("vehicle_type"),
+        "parcel_tracking_id": text("parcel_tracking_id") or None,
+        "issue_applies_to": issue_applies_to,
+        "stop_number": (text("stop_number") or None) if issue_applies_to == "Specific stop" else None,
+        "severity": text("severity"),
+        "route_satisfaction": text("route_satisfaction") or "0",
+        "estimated_time_lost": text("estimated_time_lost"),
+        "main_issue_category": text("main_issue_category"),
+        "sub_category": text("sub_category"),
+        "what_happened": text("what_happened"),
+        "what_should_have_happened": text("what_should_have_happened"),
+        "suggestion": text("suggestion"),
+    }
+
+
+# ==========================================================
+# Local sinks
+# ==========================================================
+def ensure_dirs():
+    os.makedirs(SUBMISSIONS_DIR, exist_ok=True)
+    os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
+
+
+def save_attachments_locally(images: list[SpooledAttachment], submission_id: str, station: str = "") -> list[str]:
+    """Keeps a local copy of the images so `python backfill.py` can upload them later."""
+    ensure_dirs()
+    paths = []
+    for f in images or []:
+        if f is None:
+            continue
+        out_path = os.path.join(
+            local_attachment_dir(station, submission_id, ATTACHMENTS_DIR), f"{submission_id}__{safe_filename(f.name)}"
+        )
+        f.save_to(out_path)
+        record_local_attachment(out_path, submission_id, f.size)
+        paths.append(out_path)
+    return paths
+
+
+def save_submission_json(payload: dict, submission_id: str) -> str:
+    ensure_dirs()
+    payload["submission_id"] = submission_id
+    # imports keep the time the response was made
+    payload.setdefault("submitted_at_utc", datetime.now(timezone.utc).isoformat())
+    out_json = os.path.join(SUBMISSIONS_DIR, f"{submission_id}.json")
+    with open(out_json, "w", encoding="utf-8") as w:
+        json.dump(payload, w, ensure_ascii=False, indent=2)
+
+    # SQLite system of record (indexed lookups for search, export, review, rollups)
+    save_submission_record(payload)
+
+    return out_json
+
+
+# ==========================================================
+# ✅ Upload images to SharePoint
+# ==========================================================
+def upload_images_to_sharepoint(
+    images: list[SpooledAttachment],
+    submission_id: str,
+    driver_id: str,
+    idc_id: str,
+    station: str = "",
+    resume: bool = False,
+) -> list[str]:
+    """resume: retried submit (same submission_id); files already uploaded are not sent again."""
+    if not images:
+        return []
+
+    if not graph_is_configured():
+        raise RuntimeError("Graph is not configured; cannot upload images to SharePoint.")
+
+    token = graph_get_token()
+    site_id = graph_get_site_id(token)
+
+    folder = sp_attachment_partition_folder(station, submission_id)
+
+    def sp_path_for(f) -> str:
+        return f"{folder}/{build_sp_attachment_name(submission_id, driver_id, idc_id, f.name)}".replace("//", "/")
+
+    phash_index = get_index(SHAREPOINT_INDEX_FILE)
+    candidates = []
+    for f in images:
+        if f is None:
+            continue
+
+        ext = os.path.splitext(f.name.lower())[1]
+        if ext not in (".png", ".jpg", ".jpeg"):
+            continue
+
+        # Same picture already in SharePoint (re-encoded/resized copy)? Link to it instead.
+        with f.open() as r:
+            h = dhash(r)
+        existing = phash_index.find(h) if h is not None else None
+        candidates.append((f, h, existing["path"] if existing else None))
+
+    # One batched lookup: near-duplicates still in SharePoint (moved or deleted ones are
+    # uploaded again) and, on a retried submit, the files that already made it
+    lookup = {path for _, _, path in candidates if path}
+    if resume:
+        lookup.update(sp_path_for(f) for f, _, _ in candidates)
+    found = graph_get_items(token, site_id, sorted(lookup), select="id") if lookup else {}
+
+    sp_paths = []
+    new_entries = []
+    for f, h, duplicate_of in candidates:
+        if duplicate_of and found.get(duplicate_of) is not None:
+            sp_paths.append(duplicate_of)
+            continue
+
+        if duplicate_of:
+            phash_index.remove(duplicate_of)  # the indexed copy is gone: upload this one instead
+
+        sp_path = sp_path_for(f)
+        if found.get(sp_path) is None:
+            ctype = mime_from_filename(f.name)
+            with f.open() as r:
+                graph_upload_file_bytes(token, site_id, sp_path, r, ctype)
+            new_entries.append(partition_index_entry(sp_path, submission_id, f.size))
+
+        if h is not None:
+            phash_index.add(h, sp_path, submission_id=submission_id)
+        sp_paths.append(sp_path)
+
+    # Partition index (the migration tool rebuilds it, so a failure here is not fatal)
+    if new_entries:
+        try:
+            update_sp_attachment_index(token, site_id, folder, new_entries)
+        except Exception as e:
+            log.warning("Attachment index of %s not updated for %s: %s", folder, submission_id, e)
+
+    return sp_paths
+
+
+# ==========================================================
+# ✅ Microsoft Graph: Excel remote-only (group commit)
+#
+# A workbook append is a download + rewrite of the whole file, so it is the
+# slow step of a submit. Appends go through one writer thread: rows that
+# arrive while a rewrite is running wait for it and then go together in the
+# next one. Concurrent submits (sessions, API requests) share rewrites
+# instead of queuing behind each other's.
+# ==========================================================
+def append_payloads_to_remote_excel(payloads: list[dict]) -> None:
+    if not graph_is_configured():
+        raise RuntimeError("Graph is not configured (missing TENANT_ID/CLIENT_ID/CLIENT_SECRET/SP_* settings).")
+
+    token = graph_get_token()
+    site_id = graph_get_site_id(token)
+    append_rows_to_workbooks(token, site_id, payloads)
+
+
+class ExcelAppender:
+    def __init__(self, max_rows: int = EXCEL_GROUP_MAX_ROWS):
+        self.max_rows = max_rows
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, payloads: list[dict]) -> Future:
+        future = Future()
+        self._queue.put((payloads, future))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="excel-appender", daemon=True)
+                self._thread.start()
+        return future
+
+    def append(self, payloads: list[dict]) -> None:
+        """Blocks until the rows are in the workbook(s); raises the error of the rewrite that carried them."""
+        self.submit(payloads).result()
+
+    def _run(self) -> None:
+        while True:
+            group = [self._queue.get()]
+            rows = len(group[0][0])
+            while rows < self.max_rows:
+                try:
+                    group.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                rows += len(group[-1][0])
+            try:
+                append_payloads_to_remote_excel([p for payloads, _ in group for p in payloads])
+            except Exception as e:
+                for _, future in group:
+                    future.set_exception(e)
+            else:
+                for _, future in group:
+                    future.set_result(None)
+
+
+EXCEL_APPENDER = ExcelAppender()
+
+
+# ==========================================================
+# Submit (the form, the HTTP API and bulk imports all go through here)
+# ==========================================================
+def _run_sinks(
+    payload: dict, images: list[SpooledAttachment], submission_id: str, resume: bool, previous: dict | None
+) -> dict:
+    """
+    Images + local store + search index; returns the receipt without the Excel part.
+    previous: receipt of an earlier attempt; images it uploaded are not sent again.
+    """
+    station = payload.get("station") or ""
+
+    # 1) Upload images to SharePoint (uses driver_id/idc_id in file name)
+    sp_files_ok = False
+    sp_files_err = None
+    sp_attachment_paths = []
+    if previous and previous.get("sp_files_ok"):
+        stored = get_submission(submission_id) or {}
+        sp_attachment_paths = stored.get("sp_attachments") or []
+        sp_files_ok = True
+    else:
+        try:
+            sp_attachment_paths = upload_images_to_sharepoint(
+                images=images,
+                submission_id=submission_id,
+                driver_id=payload.get("driver_id") or "",
+                idc_id=payload.get("idc_id") or "",
+                station=station,
+                resume=resume,
+            )
+            sp_files_ok = True
+        except Exception as e:
+            sp_files_err = str(e)
+            # Upload failed: keep the images locally for the backfill job
+            payload["attachments"] = save_attachments_locally(images, submission_id, station)
+
+    payload["sp_attachments"] = sp_attachment_paths
+
+    # 2) Save JSON locally + database row
+    out_json = save_submission_json(payload, submission_id=submission_id)
+
+    # Keep the full-text search index up to date (the search page also catches up on its own)
+    try:
+        index_submission(payload)
+    except Exception as e:
+        log.warning("Search index not updated for %s: %s", submission_id, e)
+
+    return {
+        "submission_id": submission_id,
+        "sp_files_ok": sp_files_ok,
+        "sp_files_err": sp_files_err,
+        "out_json": out_json,
+        "excel_path": excel_shard_path(excel_shard_key(payload)),
+        "images_folder": sp_attachment_partition_folder(station, submission_id),
+    }
+
+
+def submit_feedback_batch(
+    items: list[tuple[dict, list[SpooledAttachment], str]], workers: int = SINK_WORKERS
+) -> list[tuple[dict, bool]]:
+    """
+    Runs the submit pipeline for (payload, attachments, idempotency key)
+    items that passed validation. Each key is claimed first: an item whose
+    key has a final receipt is not run again, and one whose earlier attempt
+    had a failed sink only runs that sink again. A payload may bring its own
+    submission_id and submitted_at_utc (imports of older responses). Images and local writes run
+    in parallel; all new rows then go to Excel in one append.
+
+    Returns (receipt, replayed) per item, in order. An item repeating the key
+    of an earlier item in the same batch gets that item's receipt, as replayed.
+    An item whose key is held by a submit still running gets
+    {"submission_id", "in_progress": True}, as replayed.
+    """
+    results: list[tuple[dict, bool] | None] = [None] * len(items)
+    fresh = []
+    first_with_key: dict[str, int] = {}
+    repeats: list[tuple[int, int]] = []
+    for i, (payload, images, key) in enumerate(items):
+        if key in first_with_key:
+            repeats.append((i, first_with_key[key]))
+            continue
+        first_with_key[key] = i
+        payload.update(numeric_fields(payload))
+        preset_id = payload.get("submission_id")
+        new_id = preset_id or make_submission_id()
+        try:
+            submission_id, receipt, final = claim_idempotency_key(key, new_id)
+        except SubmitInProgress as e:
+            results[i] = ({"submission_id": e.submission_id, "in_progress": True}, True)
+            continue
+        if final:
+            results[i] = (receipt, True)
+        else:
+            # a preset id is claimed again on a retry, so it can't tell: check before uploading
+            resume = bool(preset_id) or submission_id != new_id or receipt is not None
+            fresh.append((i, submission_id, resume, receipt))
+
+    def sinks(entry: tuple[int, str, bool, dict | None]) -> dict:
+        i, submission_id, resume, previous = entry
+        payload, images, _ = items[i]
+        return _run_sinks(payload, images, submission_id, resume, previous)
+
+    try:
+        if len(fresh) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                partial = list(pool.map(sinks, fresh))
+        else:
+            partial = [sinks(entry) for entry in fresh]
+
+        # 3) Update SharePoint Excel: one append for every row not appended by an earlier attempt
+        to_append = [i for i, _, _, previous in fresh if not (previous and previous.get("sp_excel_ok"))]
+        sp_excel_ok = True
+        sp_excel_err = None
+        if to_append:
+            try:
+                with track_transient("Excel update"):
+                    EXCEL_APPENDER.append([items[i][0] for i in to_append])
+            except Exception as e:
+                sp_excel_ok = False
+                sp_excel_err = str(e)
+
+        for (i, _, _, previous), receipt in zip(fresh, partial):
+            if i in to_append:
+                receipt.update({"sp_excel_ok": sp_excel_ok, "sp_excel_err": sp_excel_err})
+            else:
+                receipt.update({"sp_excel_ok": True, "sp_excel_err": None})
+            save_receipt(items[i][2], receipt, final=receipt["sp_files_ok"] and receipt["sp_excel_ok"])
+            results[i] = (receipt, previous is not None)
+    except BaseException:
+        # let a retry in now rather than after the lease
+        for i, _, _, _ in fresh:
+            release_idempotency_key(items[i][2])
+        raise
+
+    for i, first in repeats:
+        results[i] = (results[first][0], True)
+    return results
+
+
+def submit_feedback(payload: dict, images: list[SpooledAttachment], idempotency_key: str) -> tuple[dict, bool]:
+    """One validated submission; returns (receipt, replayed)."""
+    return submit_feedback_batch([(payload, images, idempotency_key)])[0]
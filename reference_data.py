@@ -0,0 +1,33 @@
+import os
+import base64
+
+import pandas as pd
+import streamlit as st
+
+# ------------------------- Config ------------------------- #
+STATIONS_FILE = "Station adresses ASN.xlsx"
+BANNER_FILE = "MicrosoftFormTheme.jpg"
+
+
+# ==========================================================
+# Reference lists + assets (cached per process: the warm-up thread fills
+# the same caches the app reads, see warmup.py)
+# ==========================================================
+@st.cache_data(show_spinner=False)
+def load_station_list(path: str = STATIONS_FILE) -> list[str]:
+    df = pd.read_excel(path)
+    col = "Station Tag"
+    if col not in df.columns:
+        raise ValueError(f"Stations file must contain '{col}'")
+    return sorted(df[col].astype(str).str.strip().replace("nan", "").unique().tolist())
+
+
+@st.cache_data(show_spinner=False)
+def banner_as_data_uri(path: str = BANNER_FILE) -> str:
+    if not os.path.exists(path):
+        return ""
+    ext = os.path.splitext(path)[1].lower()
+    mime = "image/jpeg" if ext in [".jpg", ".jpeg"] else "image/png"
+    with open(path, "rb") as f:
+        b64 = base64.b64encode(f.read()).decode("utf-8")
+    return f"data:{mime};base64,{b64}"
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import shutil
+import argparse
+from datetime import datetime, timezone
+
+import altair as alt
+import pandas as pd
+
+from metrics import ROLLUPS_DIR, refresh_rollups
+from store import DB_FILE, SUBMISSIONS_DIR, data_watermark, load_indexed_columns_df
+
+# ------------------------- Config ------------------------- #
+REPORTS_DIR = os.path.join(SUBMISSIONS_DIR, "cache", "reports")
+REPORT_MANIFEST = "manifest.json"
+REPORTS_KEPT = 3  # older report folders are pruned after a new one is built
+REPORT_EVERY_MIN = 15
+
+SEVERITY_ORDER = ["Low", "Medium", "High", "Critical"]
+SEVERITY_COLORS = ["#8ecae6", "#ffb703", "#fb8500", "#d62828"]
+CHART_WIDTH = 640
+TOP_ISSUES = 15
+
+
+# ==========================================================
+# Report data
+# ==========================================================
+def _report_frames(db_path: str, rollups_dir: str) -> dict[str, pd.DataFrame]:
+    # indexed columns only: no payload is decoded for the counts
+    df = load_indexed_columns_df(["station", "route_date", "severity", "main_issue_category"], db_path=db_path)
+    for col in ("station", "severity", "main_issue_category"):
+        df[col] = df[col].fillna("").replace("", "(blank)")
+    route_date = pd.to_datetime(df["route_date"], errors="coerce")
+    df["week"] = (route_date - pd.to_timedelta(route_date.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d")
+
+    by_issue = refresh_rollups(db_path, rollups_dir)["issue_category"]
+    if not by_issue.empty:
+        by_issue = by_issue.assign(
+            main_issue_category=by_issue["main_issue_category"].replace("", "(blank)"),
+            hours_lost=by_issue["hours_lost"].round(2),
+        ).sort_values("hours_lost", ascending=False, ignore_index=True)
+        by_issue = by_issue[["main_issue_category", "submissions", "hours_lost", "hours_lost_low", "hours_lost_high"]]
+
+    by_station = (
+        df.groupby(["station", "main_issue_category"]).size().reset_index(name="submissions")
+        .sort_values(["station", "submissions"], ascending=[True, False], ignore_index=True)
+    )
+    severity_trend = (
+        df.dropna(subset=["week"]).groupby(["week", "severity"]).size().reset_index(name="submissions")
+        .sort_values(["week", "severity"], ignore_index=True)
+    )
+    return {"late_by_issue": by_issue, "issues_by_station": by_station, "severity_trend": severity_trend}
+
+
+# ==========================================================
+# Charts
+# ==========================================================
+def late_by_issue_chart(df: pd.DataFrame) -> alt.Chart:
+    top = df.head(TOP_ISSUES)
+    return alt.Chart(top, title="Driver-hours lost by main issue").mark_bar().encode(
+        x=alt.X("hours_lost:Q", title="Hours lost (estimated)"),
+        y=alt.Y("main_issue_category:N", sort="-x", title=None),
+        tooltip=["main_issue_category", "submissions", "hours_lost"],
+    ).properties(width=CHART_WIDTH)
+
+
+def issues_by_station_chart(df: pd.DataFrame) -> alt.Chart:
+    return alt.Chart(df, title="Issues by station").mark_bar().encode(
+        x=alt.X("station:N", sort="-y", title="Station"),
+        y=alt.Y("sum(submissions):Q", title="Submissions"),
+        color=alt.Color("main_issue_category:N", title="Main issue"),
+        tooltip=["station", "main_issue_category", "submissions"],
+    ).properties(width=CHART_WIDTH)
+
+
+def severity_trend_chart(df: pd.DataFrame) -> alt.Chart:
+    return alt.Chart(df, title="Severity by route week").mark_line(point=True).encode(
+        x=alt.X("week:T", title="Week of"),
+        y=alt.Y("submissions:Q", title="Submissions"),
+        color=alt.Color(
+            "severity:N",
+            sort=SEVERITY_ORDER,
+            scale=alt.Scale(domain=SEVERITY_ORDER, range=SEVERITY_COLORS),
+            title="Severity",
+        ),
+        tooltip=["week", "severity", "submissions"],
+    ).properties(width=CHART_WIDTH)
+
+
+REPORT_CHARTS = {
+    "late_by_issue": late_by_issue_chart,
+    "issues_by_station": issues_by_station_chart,
+    "severity_trend": severity_trend_chart,
+}
+
+
+def save_chart(chart: alt.Chart, folder: str, name: str) -> dict[str, str]:
+    """
+    Writes <name>.html, <name>.vl.json and, when vl-convert-python is installed,
+    <name>.png. Returns {format: file name}.
+    """
+    files = {}
+    for fmt in ("html", "vl.json", "png"):
+        file_name = f"{name}.{fmt}"
+        try:
+            chart.save(os.path.join(folder, file_name), format="json" if fmt == "vl.json" else fmt)
+        except (ImportError, ValueError):
+            continue  # PNG needs vl-convert-python; the HTML still renders the chart
+        files[fmt] = file_name
+    return files
+
+
+def write_summary_workbook(frames: dict[str, pd.DataFrame], overview: dict, path: str) -> None:
+    with pd.ExcelWriter(path, engine="xlsxwriter") as xw:
+        pd.DataFrame(list(overview.items()), columns=["", "value"]).to_excel(xw, sheet_name="Overview", index=False)
+        for name, df in frames.items():
+            df.to_excel(xw, sheet_name=name.replace("_", " ").capitalize(), index=False)
+
+
+# ==========================================================
+# Cache (one folder per data watermark)
+#
+#   reports/<watermark>/manifest.json
+#   reports/<watermark>/late_by_issue.{html,vl.json,png}
+#   reports/<watermark>/summary.xlsx
+#
+# The watermark changes when a submission is added or edited, so a folder
+# that exists is up to date and opening a report only reads files.
+# ==========================================================
+def _watermark_folder(watermark: str, reports_dir: str) -> str:
+    return os.path.join(reports_dir, watermark.replace(":", "").replace("/", "_"))
+
+
+def _read_manifest(folder: str) -> dict | None:
+    path = os.path.join(folder, REPORT_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as r:
+        manifest = json.load(r)
+    manifest["folder"] = folder
+    return manifest
+
+
+def latest_report(reports_dir: str = REPORTS_DIR) -> dict | None:
+    """Manifest of the newest report built, whatever its watermark (None if none yet)."""
+    if not os.path.isdir(reports_dir):
+        return None
+    manifests = [_read_manifest(e.path) for e in os.scandir(reports_dir) if e.is_dir() and not e.name.startswith(".")]
+    manifests = [m for m in manifests if m]
+    return max(manifests, key=lambda m: m["generated_at_utc"]) if manifests else None
+
+
+def _prune_reports(reports_dir: str, keep: str) -> None:
+    folders = sorted(
+        (e for e in os.scandir(reports_dir) if e.is_dir() and e.path != keep),
+        key=lambda e: e.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in folders[REPORTS_KEPT - 1:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def generate_reports(
+    db_path: str = DB_FILE,
+    reports_dir: str = REPORTS_DIR,
+    rollups_dir: str = ROLLUPS_DIR,
+    force: bool = False,
+) -> dict:
+    """
+    Builds the standard charts and the summary workbook for the current data,
+    unless a report for this watermark already exists. Returns the manifest
+    (with "generated": False when the cached report was reused).
+    """
+    watermark = data_watermark(db_path)
+    folder = _watermark_folder(watermark, reports_dir)
+    cached = _read_manifest(folder)
+    if cached and not force:
+        return {**cached, "generated": False}
+
+    started = time.perf_counter()
+    frames = _report_frames(db_path, rollups_dir)
+    # built in a temp folder and renamed, so readers never see a half-written report
+    tmp = os.path.join(reports_dir, f".{os.path.basename(folder)}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    charts = {name: save_chart(build(frames[name]), tmp, name) for name, build in REPORT_CHARTS.items()}
+    overview = {
+        "Watermark": watermark,
+        "Generated (UTC)": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "Submissions": int(frames["issues_by_station"]["submissions"].sum()),
+        "Stations": int(frames["issues_by_station"]["station"].nunique()),
+        "Driver-hours lost": round(float(frames["late_by_issue"].get("hours_lost", pd.Series()).sum()), 1),
+    }
+    write_summary_workbook(frames, overview, os.path.join(tmp, "summary.xlsx"))
+
+    manifest = {
+        "watermark": watermark,
+        "generated_at_utc": datetime.now(timezone.utc).isoformat(),
+        "seconds": round(time.perf_counter() - started, 2),
+        "overview": overview,
+        "charts": charts,
+        "workbook": "summary.xlsx",
+    }
+    with open(os.path.join(tmp, REPORT_MANIFEST), "w", encoding="utf-8") as w:
+        json.dump(manifest, w, ensure_ascii=False, indent=2)
+
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.replace(tmp, folder)
+    _prune_reports(reports_dir, keep=folder)
+    return {**manifest, "folder": folder, "generated": True}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the standard report charts and summary workbook when the submission data changed."
+    )
+    parser.add_argument("--every", type=float, metavar="MIN", help=f"keep running, checking every MIN minutes "
+                        f"(e.g. {REPORT_EVERY_MIN}); without it, run once (for cron)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the data did not change")
+    parser.add_argument("--db", default=DB_FILE)
+    args = parser.parse_args()
+
+    while True:
+        report = generate_reports(db_path=args.db, force=args.force)
+        state = f"built in {report['seconds']}s" if report["generated"] else "unchanged, cached report kept"
+        print(f"{datetime.now():%Y-%m-%d %H:%M:%S}  {report['watermark']}: {state} ({report['folder']})")
+        if not args.every:
+            break
+        args.force = False
+        time.sleep(args.every * 60)
@@ -0,0 +1,242 @@
+import os
+import re
+import sqlite3
+import time
+
+import pandas as pd
+
+from store import DB_FILE, SUBMISSIONS_DIR, iter_inserted_submissions
+
+# ------------------------- Config ------------------------- #
+SEARCH_DB_FILE = os.path.join(SUBMISSIONS_DIR, "cache", "search.sqlite3")
+
+# Indexed free-text fields and their bm25 weight (higher = more relevant)
+TEXT_FIELDS = {
+    "what_happened": 3.0,
+    "what_should_have_happened": 1.5,
+    "suggestion": 1.5,
+    "parcel_tracking_id": 10.0,
+}
+
+# Queries matching more rows than this are ordered by recency instead of bm25
+RANK_MAX_CANDIDATES = 20000
+MIN_PREFIX_LEN = 3
+SNIPPET_WORDS = 16
+
+# Filterable columns stored next to the text
+FILTER_FIELDS = ["station", "severity", "main_issue_category", "route_date", "submitted_at_utc"]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS docs (
+    rowid INTEGER PRIMARY KEY,
+    submission_id TEXT UNIQUE NOT NULL,
+    {", ".join(f"{c} TEXT" for c in FILTER_FIELDS)}
+);
+CREATE INDEX IF NOT EXISTS docs_station ON docs(station);
+CREATE INDEX IF NOT EXISTS docs_severity ON docs(severity);
+CREATE INDEX IF NOT EXISTS docs_category ON docs(main_issue_category);
+CREATE INDEX IF NOT EXISTS docs_route_date ON docs(route_date);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    {", ".join(TEXT_FIELDS)},
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+# Persistent bm25 column weights, so "ORDER BY rank" uses them
+RANK_CONFIG = f"bm25({', '.join(str(w) for w in TEXT_FIELDS.values())})"
+
+
+# ==========================================================
+# Index maintenance
+# ==========================================================
+def connect(db_path: str = SEARCH_DB_FILE) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    if _get_meta(conn, "rank") != RANK_CONFIG:
+        with conn:
+            conn.execute("INSERT INTO docs_fts(docs_fts, rank) VALUES ('rank', ?)", (RANK_CONFIG,))
+            _set_meta(conn, "rank", RANK_CONFIG)
+    return conn
+
+
+def _get_meta(conn: sqlite3.Connection, key: str) -> str | None:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value: str) -> None:
+    conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, value))
+
+
+def _index_payload(conn: sqlite3.Connection, payload: dict) -> None:
+    submission_id = payload["submission_id"]
+    row = conn.execute("SELECT rowid FROM docs WHERE submission_id = ?", (submission_id,)).fetchone()
+    if row:
+        conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (row[0],))
+        conn.execute("DELETE FROM docs WHERE rowid = ?", (row[0],))
+
+    filters = [str(payload.get(c) or "") for c in FILTER_FIELDS]
+    cur = conn.execute(
+        f"INSERT INTO docs(submission_id, {', '.join(FILTER_FIELDS)}) VALUES (?{', ?' * len(FILTER_FIELDS)})",
+        [submission_id] + filters,
+    )
+    texts = [str(payload.get(c) or "") for c in TEXT_FIELDS]
+    conn.execute(
+        f"INSERT INTO docs_fts(rowid, {', '.join(TEXT_FIELDS)}) VALUES (?{', ?' * len(TEXT_FIELDS)})",
+        [cur.lastrowid] + texts,
+    )
+
+
+def index_submission(payload: dict, db_path: str = SEARCH_DB_FILE) -> None:
+    """Adds (or replaces) one submission in the index. Called right after ingest."""
+    conn = connect(db_path)
+    try:
+        with conn:
+            _index_payload(conn, payload)
+    finally:
+        conn.close()
+
+
+def refresh_index(store_db: str = DB_FILE, db_path: str = SEARCH_DB_FILE) -> int:
+    """Indexes submissions stored since the last refresh (insert order, so late imports too). Returns how many."""
+    conn = connect(db_path)
+    try:
+        # an index built before the rowid watermark is refreshed in full once (re-indexing replaces)
+        after_rowid = int(_get_meta(conn, "last_rowid") or 0)
+        count = 0
+        with conn:
+            for rowid, payload in iter_inserted_submissions(after_rowid, db_path=store_db):
+                _index_payload(conn, payload)
+                after_rowid = rowid
+                count += 1
+            if count:
+                _set_meta(conn, "last_rowid", str(after_rowid))
+        return count
+    finally:
+        conn.close()
+
+
+# ==========================================================
+# Search
+# ==========================================================
+def to_fts_query(text: str) -> str:
+    """
+    Turns free user input into a safe FTS5 query: every word must match,
+    the last one as a prefix (search-as-you-type) once it has a few letters.
+    """
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    if len(words[-1]) >= MIN_PREFIX_LEN:
+        terms[-1] += "*"
+    return " AND ".join(terms)
+
+
+def make_snippet(texts: list[str], words: list[str], width: int = SNIPPET_WORDS) -> str:
+    """Window of text around the first matching word, with matches in [brackets]."""
+    for txt in texts:
+        tokens = str(txt or "").split()
+        lowered = [re.sub(r"\W+", "", t).lower() for t in tokens]
+        hits = [i for i, t in enumerate(lowered) if any(t.startswith(w) for w in words)]
+        if not hits:
+            continue
+        lo = max(0, hits[0] - width // 3)
+        window = [f"[{t}]" if i in hits else t for i, t in enumerate(tokens[lo:lo + width], start=lo)]
+        return ("… " if lo else "") + " ".join(window) + (" …" if lo + width < len(tokens) else "")
+    return ""
+
+
+def search(
+    text: str,
+    station: list[str] | None = None,
+    severity: list[str] | None = None,
+    category: list[str] | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    limit: int = 50,
+    db_path: str = SEARCH_DB_FILE,
+) -> tuple[pd.DataFrame, float]:
+    """Returns (ranked results, elapsed milliseconds)."""
+    query = to_fts_query(text)
+    if not query:
+        return pd.DataFrame(), 0.0
+
+    where = ["docs_fts MATCH ?"]
+    params: list = [query]
+    for col, values in (("station", station), ("severity", severity), ("main_issue_category", category)):
+        if values:
+            where.append(f"d.{col} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    if date_from:
+        where.append("d.route_date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        where.append("d.route_date <= ?")
+        params.append(str(date_to))
+    where_sql = " AND ".join(where)
+
+    conn = connect(db_path)
+    try:
+        start = time.perf_counter()
+        # CROSS JOIN keeps the full-text match as the outer loop.
+        # bm25 costs a few microseconds per matching row; when a query matches most
+        # of the corpus, relevance is meaningless anyway, so show the newest first.
+        candidates = conn.execute("SELECT count(*) FROM docs_fts WHERE docs_fts MATCH ?", (query,)).fetchone()[0]
+        order_by = "docs_fts.rank" if candidates <= RANK_MAX_CANDIDATES else "docs_fts.rowid DESC"
+        top = conn.execute(
+            f"""
+            SELECT docs_fts.rowid FROM docs_fts
+            CROSS JOIN docs d ON d.rowid = docs_fts.rowid
+            WHERE {where_sql}
+            ORDER BY {order_by}
+            LIMIT ?
+            """,
+            params + [int(limit)],
+        ).fetchall()
+        rowids = [r[0] for r in top]
+
+        # Details for the page of results only, read by rowid (no MATCH re-evaluation)
+        df = pd.DataFrame()
+        if rowids:
+            df = pd.read_sql_query(
+                f"""
+                SELECT docs_fts.rowid AS _rowid, d.submission_id, {", ".join(f"d.{c}" for c in FILTER_FIELDS)},
+                       {", ".join(f"docs_fts.{c}" for c in TEXT_FIELDS)}
+                FROM docs_fts
+                CROSS JOIN docs d ON d.rowid = docs_fts.rowid
+                WHERE docs_fts.rowid IN ({", ".join("?" * len(rowids))})
+                """,
+                conn,
+                params=rowids,
+            )
+            words = [w.lower() for w in re.findall(r"\w+", text)]
+            df["snippet"] = [make_snippet([row[c] for c in TEXT_FIELDS], words) for _, row in df.iterrows()]
+            order = {rowid: i for i, rowid in enumerate(rowids)}
+            df = (
+                df.sort_values("_rowid", key=lambda s: s.map(order))
+                .drop(columns=["_rowid"] + list(TEXT_FIELDS))
+                .reset_index(drop=True)
+            )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    finally:
+        conn.close()
+    return df, elapsed_ms
+
+
+def distinct_values(column: str, db_path: str = SEARCH_DB_FILE) -> list[str]:
+    if column not in FILTER_FIELDS:
+        raise ValueError(f"Unknown filter column: {column}")
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(f"SELECT DISTINCT {column} FROM docs WHERE {column} != '' ORDER BY 1").fetchall()
+    finally:
+        conn.close()
+    return [r[0] for r in rows]
+
+
+if __name__ == "__main__":
+    print(f"Indexed {refresh_index()} new submission(s) into {SEARCH_DB_FILE}")
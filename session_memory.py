@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+# ------------------------- Config ------------------------- #
+# Per-session budget for what a session keeps in memory (widget state, uploads, DataFrames)
+SESSION_MEMORY_LIMIT_MB = float(os.getenv("SESSION_MEMORY_LIMIT_MB", "200"))
+# Share of the budget at which the session's uploads are dropped (before refusing to run)
+SESSION_UPLOADS_SHARE = 0.5
+
+TOP_OBJECTS = 10
+MB = 1024 * 1024
+
+# session_id -> latest accounting (shared by all sessions of this server process)
+_usage: dict[str, dict] = {}
+_usage_lock = threading.Lock()
+
+
+# ==========================================================
+# Sizes
+# ==========================================================
+def deep_sizeof(obj, _seen: set | None = None) -> int:
+    """Approximate bytes held by obj (DataFrames, uploads and containers included)."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if hasattr(obj, "getbuffer"):
+        # UploadedFile / BytesIO: the buffer is the weight
+        return sys.getsizeof(obj) + obj.getbuffer().nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(deep_sizeof(v, seen) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def _is_upload(value) -> bool:
+    return hasattr(value, "getbuffer") and hasattr(value, "file_id")
+
+
+def _upload_bytes(value) -> int:
+    files = value if isinstance(value, (list, tuple)) else [value]
+    return sum(f.getbuffer().nbytes for f in files if _is_upload(f))
+
+
+def process_rss_bytes() -> int:
+    """Current resident set size of this server process (0 where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+# ==========================================================
+# Accounting
+# ==========================================================
+def current_session_id() -> str | None:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+
+def session_state_sizes() -> list[tuple[str, int]]:
+    """(key, bytes) of the current session's state, largest first."""
+    sizes = [(str(k), deep_sizeof(st.session_state[k])) for k in list(st.session_state.keys())]
+    return sorted(sizes, key=lambda kv: kv[1], reverse=True)
+
+
+def record_session_usage() -> dict:
+    """Measures the current session's state and stores it in the shared table."""
+    sizes = session_state_sizes()
+    usage = {
+        "session_id": current_session_id() or "local",
+        "updated_at": time.time(),
+        "state_bytes": sum(size for _, size in sizes),
+        "upload_bytes": sum(_upload_bytes(st.session_state[k]) for k, _ in sizes if k in st.session_state),
+        "top_objects": sizes[:TOP_OBJECTS],
+    }
+    with _usage_lock:
+        previous = _usage.get(usage["session_id"], {})
+        usage["peak_transient_bytes"] = previous.get("peak_transient_bytes", 0)
+        _usage[usage["session_id"]] = usage
+    return usage
+
+
+@contextmanager
+def track_transient(label: str):
+    """Records RSS growth of the wrapped block (e.g. a workbook rewrite) against the current session."""
+    before = process_rss_bytes()
+    try:
+        yield
+    finally:
+        grown = max(0, process_rss_bytes() - before)
+        sid = current_session_id() or "local"
+        with _usage_lock:
+            entry = _usage.setdefault(sid, {"session_id": sid, "state_bytes": 0, "upload_bytes": 0, "top_objects": []})
+            if grown >= entry.get("peak_transient_bytes", 0):
+                entry["peak_transient_bytes"] = grown
+                entry["peak_transient_label"] = label
+
+
+def _prune_closed_sessions() -> None:
+    try:
+        from streamlit import runtime
+    except ImportError:
+        return
+    if not runtime.exists():
+        return
+    rt = runtime.get_instance()
+    with _usage_lock:
+        for sid in list(_usage):
+            if sid != "local" and not rt.is_active_session(sid):
+                del _usage[sid]
+
+
+def memory_report() -> pd.DataFrame:
+    """
+    One row per live session: bytes held in session state (uploads included),
+    the largest transient RSS growth seen, and the share of process RSS this
+    represents. RSS is per process, so "unattributed" covers everything else
+    (Python, libraries, st.cache_data).
+    """
+    _prune_closed_sessions()
+    rss = process_rss_bytes()
+    with _usage_lock:
+        rows = [dict(u) for u in _usage.values()]
+    df = pd.DataFrame(
+        [
+            {
+                "session_id": r["session_id"],
+                "state_mb": r.get("state_bytes", 0) / MB,
+                "uploads_mb": r.get("upload_bytes", 0) / MB,
+                "peak_transient_mb": r.get("peak_transient_bytes", 0) / MB,
+                "peak_transient_in": r.get("peak_transient_label", ""),
+                "largest_key": r["top_objects"][0][0] if r.get("top_objects") else "",
+                "rss_share_pct": 100 * r.get("state_bytes", 0) / rss if rss else None,
+                "last_seen": pd.Timestamp(r["updated_at"], unit="s", tz="UTC") if r.get("updated_at") else pd.NaT,
+            }
+            for r in rows
+        ],
+        columns=[
+            "session_id",
+            "state_mb",
+            "uploads_mb",
+            "peak_transient_mb",
+            "peak_transient_in",
+            "largest_key",
+            "rss_share_pct",
+            "last_seen",
+        ],
+    )
+    attributed = sum(r.get("state_bytes", 0) for r in rows)
+    df.attrs["rss_mb"] = rss / MB
+    df.attrs["unattributed_mb"] = max(0, rss - attributed) / MB
+    return df.sort_values("state_mb", ascending=False, ignore_index=True)
+
+
+# ==========================================================
+# Uploads + limits
+# ==========================================================
+def uploader_key(base: str) -> str:
+    """Widget key for a file_uploader; clear_uploaded_files() rotates it so the widget comes back empty."""
+    return f"{base}_{st.session_state.get(f'_{base}_generation', 0)}"
+
+
+def clear_uploaded_files(base: str) -> None:
+    """Drops the session's uploads (widget state and Streamlit's upload store) and empties the widget."""
+    st.session_state.pop(uploader_key(base), None)
+    st.session_state[f"_{base}_generation"] = st.session_state.get(f"_{base}_generation", 0) + 1
+    sid = current_session_id()
+    try:
+        from streamlit import runtime
+    except ImportError:
+        return
+    if sid and runtime.exists():
+        runtime.get_instance().uploaded_file_mgr.remove_session_files(sid)
+
+
+def enforce_session_limit(upload_base: str | None = None, limit_mb: float = SESSION_MEMORY_LIMIT_MB) -> dict:
+    """
+    Records the session's usage and applies the budget: uploads are dropped
+    once they take SESSION_UPLOADS_SHARE of it; a session still over the limit
+    is stopped with an explanation instead of growing until the server is killed.
+    """
+    usage = record_session_usage()
+    limit = limit_mb * MB
+    if upload_base and usage["upload_bytes"] > limit * SESSION_UPLOADS_SHARE:
+        clear_uploaded_files(upload_base)
+        st.warning(
+            f"Your attachments were removed: {usage['upload_bytes'] / MB:.0f} MB is more than this session "
+            f"may hold ({limit * SESSION_UPLOADS_SHARE / MB:.0f} MB). Please attach fewer or smaller files."
+        )
+        usage = record_session_usage()
+    if usage["state_bytes"] > limit:
+        st.error(
+            f"This session is using {usage['state_bytes'] / MB:.0f} MB (limit {limit_mb:.0f} MB). "
+            "Reload the page to start a fresh session."
+        )
+        st.stop()
+    return usage
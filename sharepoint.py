@@ -0,0 +1,903 @@
+import os
+import json
+import hashlib
+import threading
+import time
+from io import BytesIO
+from datetime import datetime, timezone
+from typing import IO
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+import streamlit as st
+
+from ids import submission_id_time
+from attachments import attachment_partition
+from xlsx_writer import dataframe_to_xlsx_bytes, write_dataframe_xlsx
+
+# ------------------------- SharePoint / Graph Config ------------------------- #
+GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+GRAPH_BATCH_LIMIT = 20  # requests per $batch call (Graph limit)
+TOKEN_REFRESH_MARGIN_S = 300
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PARQUET_MIME = "application/vnd.apache.parquet"
+
+# Local Parquet mirror of each remote workbook, keyed by the eTag it was read at
+WORKBOOK_CACHE_DIR = os.path.join("submissions", "cache", "workbooks")
+
+
+def _get_secret_or_env(key: str, default=None):
+    try:
+        if key in st.secrets:
+            return st.secrets[key]
+    except Exception:
+        pass
+    return os.getenv(key, default)
+
+
+# Put these in .streamlit/secrets.toml OR env variables (see README). Every page,
+# the API, the warm-up and the CLIs read them here, so they agree whichever starts first.
+TENANT_ID = _get_secret_or_env("TENANT_ID")
+CLIENT_ID = _get_secret_or_env("CLIENT_ID")
+CLIENT_SECRET = _get_secret_or_env("CLIENT_SECRET")
+
+SP_HOSTNAME = _get_secret_or_env("SP_HOSTNAME")
+SP_SITE_PATH = _get_secret_or_env("SP_SITE_PATH")
+SP_EXCEL_PATH = _get_secret_or_env("SP_EXCEL_PATH")
+SP_ATTACHMENTS_FOLDER = _get_secret_or_env("SP_ATTACHMENTS_FOLDER")
+
+# Split the workbook: "" (single workbook), "month" (submission month) or "station".
+# With "station", SP_STATION_REGIONS ({"BARR": "ON-North", ...}, dict or JSON) groups stations.
+SP_EXCEL_SHARDING = _get_secret_or_env("SP_EXCEL_SHARDING", "")
+SP_STATION_REGIONS = _get_secret_or_env("SP_STATION_REGIONS")
+
+# Keep <workbook>.parquet next to each workbook in SharePoint and read rows from it
+# instead of parsing Excel ("0" to disable). It records the workbook version it
+# matches; a workbook edited by hand since is read again and the mirror re-seeded.
+SP_PARQUET_MIRROR = str(_get_secret_or_env("SP_PARQUET_MIRROR", "1")).lower() not in ("0", "false", "no", "")
+
+# Send small metadata requests through Graph JSON batching ($batch) ("0" for one call each)
+SP_GRAPH_BATCH = str(_get_secret_or_env("SP_GRAPH_BATCH", "1")).lower() not in ("0", "false", "no", "")
+
+SETTINGS = [
+    "TENANT_ID",
+    "CLIENT_ID",
+    "CLIENT_SECRET",
+    "SP_HOSTNAME",
+    "SP_SITE_PATH",
+    "SP_EXCEL_PATH",
+    "SP_ATTACHMENTS_FOLDER",
+    "SP_EXCEL_SHARDING",
+    "SP_STATION_REGIONS",
+    "SP_PARQUET_MIRROR",
+    "SP_GRAPH_BATCH",
+]
+
+
+# Settings found in secrets.toml/env; configure() does not override them
+_SECRET_SETTINGS = {name for name in SETTINGS if _get_secret_or_env(name) is not None}
+
+
+def configure(**settings) -> None:
+    """
+    Fills settings that secrets.toml/env leave unset, e.g.
+    configure(SP_EXCEL_PATH="/General/x.xlsx"); secrets and env always win.
+    """
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown SharePoint setting(s): {', '.join(sorted(unknown))}")
+    globals().update({k: v for k, v in settings.items() if v is not None and k not in _SECRET_SETTINGS})
+
+
+def guess_sp_attachments_folder() -> str:
+    base = os.path.dirname(SP_EXCEL_PATH or "").replace("\\", "/")
+    if not base.startswith("/"):
+        base = "/" + base
+    return f"{base}/ROF_Attachments"
+
+
+def sp_attachments_folder() -> str:
+    folder = (SP_ATTACHMENTS_FOLDER or guess_sp_attachments_folder()).replace("\\", "/")
+    if not folder.startswith("/"):
+        folder = "/" + folder
+    return folder
+
+
+# ==========================================================
+# Attachment naming
+# ==========================================================
+def safe_filename(name: str) -> str:
+    keep = []
+    for ch in name:
+        if ch.isalnum() or ch in ("-", "_", ".", " "):
+            keep.append(ch)
+    cleaned = "".join(keep).strip().replace(" ", "_")
+    return cleaned[:150] if cleaned else "file"
+
+
+def mime_from_filename(name: str) -> str:
+    ext = os.path.splitext(name.lower())[1]
+    if ext == ".png":
+        return "image/png"
+    if ext in (".jpg", ".jpeg"):
+        return "image/jpeg"
+    return "application/octet-stream"
+
+
+def _clean_for_name(x: str, max_len: int = 60) -> str:
+    x = (x or "").strip().lower().replace(" ", "_")
+    keep = []
+    for ch in x:
+        if ch.isalnum() or ch in ("_", "-", ".", "@"):
+            keep.append(ch)
+    return "".join(keep)[:max_len] if keep else "unknown"
+
+
+# ✅ MODIF: nom de fichier basé sur driver_id + idc_id (plus de nom/prenom/email)
+def build_sp_attachment_name(submission_id: str, driver_id: str, idc_id: str, original_filename: str) -> str:
+    base = f"{submission_id}__driver_{_clean_for_name(driver_id)}__idc_{_clean_for_name(idc_id)}"
+    orig = safe_filename(original_filename)
+    return f"{base}__{orig}"
+
+
+# ==========================================================
+# Microsoft Graph: Auth
+# ==========================================================
+def graph_is_configured() -> bool:
+    required = [TENANT_ID, CLIENT_ID, CLIENT_SECRET, SP_HOSTNAME, SP_SITE_PATH, SP_EXCEL_PATH]
+    return all(bool(x) for x in required)
+
+
+_token_cache: dict[str, tuple[str, float]] = {}
+_site_cache: dict[tuple[str, str], str] = {}
+_graph_cache_lock = threading.Lock()
+
+
+def graph_get_token() -> str:
+    """App-only token, reused until shortly before it expires (about an hour)."""
+    with _graph_cache_lock:
+        cached = _token_cache.get(CLIENT_ID or "")
+    if cached and cached[1] - TOKEN_REFRESH_MARGIN_S > time.time():
+        return cached[0]
+
+    url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
+    data = {
+        "client_id": CLIENT_ID,
+        "client_secret": CLIENT_SECRET,
+        "grant_type": "client_credentials",
+        "scope": "https://graph.microsoft.com/.default",
+    }
+    r = requests.post(url, data=data, timeout=30)
+    r.raise_for_status()
+    body = r.json()
+    with _graph_cache_lock:
+        _token_cache[CLIENT_ID or ""] = (body["access_token"], time.time() + float(body.get("expires_in", 3599)))
+    return body["access_token"]
+
+
+def graph_get_site_id(token: str) -> str:
+    """Site id of SP_HOSTNAME:SP_SITE_PATH, resolved once per process."""
+    key = (SP_HOSTNAME or "", SP_SITE_PATH or "")
+    with _graph_cache_lock:
+        if key in _site_cache:
+            return _site_cache[key]
+    url = f"{GRAPH_BASE}/sites/{SP_HOSTNAME}:{SP_SITE_PATH}"
+    r = requests.get(url, headers={"Authorization": f"Bearer {token}"}, params={"$select": "id"}, timeout=30)
+    r.raise_for_status()
+    with _graph_cache_lock:
+        _site_cache[key] = r.json()["id"]
+    return _site_cache[key]
+
+
+# ==========================================================
+# Microsoft Graph: JSON batching
+#
+# Up to 20 small requests (metadata lookups, folder creation) travel in one
+# POST /$batch round trip. Each request is {"method", "url" (relative to
+# GRAPH_BASE), optional "headers" / "body"}; each response is
+# {"status", "headers", "body"} in input order. When $batch itself fails (or
+# SP_GRAPH_BATCH is off) the requests are sent one by one instead, and items
+# the batch answered with 429/503 (throttled) are retried one by one.
+# ==========================================================
+def _graph_single(token: str, req: dict) -> dict:
+    headers = {"Authorization": f"Bearer {token}", **(req.get("headers") or {})}
+    r = requests.request(
+        req["method"], f"{GRAPH_BASE}{req['url']}", headers=headers, json=req.get("body"), timeout=30
+    )
+    try:
+        body = r.json() if r.content else None
+    except ValueError:
+        body = r.text
+    return {"status": r.status_code, "headers": dict(r.headers), "body": body}
+
+
+def _batch_request(i: int, req: dict) -> dict:
+    item = {"id": str(i), "method": req["method"], "url": req["url"]}
+    headers = dict(req.get("headers") or {})
+    if req.get("body") is not None:
+        item["body"] = req["body"]
+        headers.setdefault("Content-Type", "application/json")
+    if headers:
+        item["headers"] = headers
+    return item
+
+
+def graph_batch(token: str, reqs: list[dict]) -> list[dict]:
+    if not SP_GRAPH_BATCH or len(reqs) == 1:
+        return [_graph_single(token, req) for req in reqs]
+
+    responses: list[dict | None] = [None] * len(reqs)
+    for start in range(0, len(reqs), GRAPH_BATCH_LIMIT):
+        chunk = reqs[start:start + GRAPH_BATCH_LIMIT]
+        payload = {"requests": [_batch_request(i, req) for i, req in enumerate(chunk, start=start)]}
+        try:
+            r = requests.post(
+                f"{GRAPH_BASE}/$batch",
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+                json=payload,
+                timeout=60,
+            )
+            answered = r.json().get("responses", []) if r.ok else []
+        except (requests.RequestException, ValueError):
+            answered = []
+        for resp in answered:
+            i = int(resp["id"])
+            if resp.get("status") not in (429, 503):
+                responses[i] = {"status": resp["status"], "headers": resp.get("headers") or {}, "body": resp.get("body")}
+
+    # not answered, throttled, or $batch unavailable: one call each
+    return [resp if resp is not None else _graph_single(token, reqs[i]) for i, resp in enumerate(responses)]
+
+
+def drive_path_url(site_id: str, sp_path: str, select: str | None = None) -> str:
+    """URL of a drive item by path, relative to GRAPH_BASE (for graph_batch requests)."""
+    url = f"/sites/{site_id}/drive/root:{quote(sp_path)}"
+    return f"{url}?$select={select}" if select else url
+
+
+def graph_get_items(token: str, site_id: str, sp_paths: list[str], select: str = "id,eTag") -> dict[str, dict | None]:
+    """Metadata of several files/folders in one batched round trip; None for the missing ones."""
+    responses = graph_batch(token, [{"method": "GET", "url": drive_path_url(site_id, p, select)} for p in sp_paths])
+    items = {}
+    for path, resp in zip(sp_paths, responses):
+        if resp["status"] == 404:
+            items[path] = None
+        elif 200 <= resp["status"] < 300:
+            items[path] = resp["body"]
+        else:
+            raise RuntimeError(f"SharePoint item lookup failed: {resp['status']} - {resp['body']}")
+    return items
+
+
+def graph_ensure_folders(token: str, site_id: str, folders: list[str]) -> int:
+    """
+    Creates the missing folders (and their parents): one batched existence check,
+    then one batched create per depth level. Returns how many were created.
+    """
+    wanted = set()
+    for folder in folders:
+        parts = [p for p in folder.replace("\\", "/").split("/") if p]
+        wanted.update("/" + "/".join(parts[:n]) for n in range(1, len(parts) + 1))
+    if not wanted:
+        return 0
+    existing = graph_get_items(token, site_id, sorted(wanted), select="id")
+    missing = sorted((p for p, item in existing.items() if item is None), key=lambda p: p.count("/"))
+
+    created = 0
+    for depth in sorted({p.count("/") for p in missing}):
+        level = [p for p in missing if p.count("/") == depth]
+        reqs = []
+        for path in level:
+            parent, name = path.rsplit("/", 1)
+            url = f"/sites/{site_id}/drive/root" + (f":{quote(parent)}:/children" if parent else "/children")
+            reqs.append(
+                {
+                    "method": "POST",
+                    "url": url,
+                    "body": {"name": name, "folder": {}, "@microsoft.graph.conflictBehavior": "fail"},
+                }
+            )
+        for path, resp in zip(level, graph_batch(token, reqs)):
+            if resp["status"] in (200, 201):
+                created += 1
+            elif resp["status"] != 409:  # 409: created meanwhile by someone else
+                raise RuntimeError(f"SharePoint folder creation failed: {path}: {resp['status']} - {resp['body']}")
+    return created
+
+
+# ==========================================================
+# Microsoft Graph: Files
+# ==========================================================
+def graph_download_file_bytes(token: str, site_id: str, sp_file_path: str) -> bytes | None:
+    """Returns file bytes, or None if the file does NOT exist yet (404)."""
+    url = f"{GRAPH_BASE}/sites/{site_id}/drive/root:{sp_file_path}:/content"
+    r = requests.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=120)
+    if r.status_code == 404:
+        return None
+    if not r.ok:
+        raise RuntimeError(f"SharePoint download failed: {r.status_code} - {r.text}")
+    return r.content
+
+
+def graph_download_excel_bytes(token: str, site_id: str, sp_file_path: str) -> bytes | None:
+    return graph_download_file_bytes(token, site_id, sp_file_path)
+
+
+def graph_download_url_bytes(download_url: str) -> bytes:
+    """Downloads from a pre-authenticated @microsoft.graph.downloadUrl (no token needed)."""
+    r = requests.get(download_url, timeout=120)
+    if not r.ok:
+        raise RuntimeError(f"SharePoint download failed: {r.status_code} - {r.text}")
+    return r.content
+
+
+class WorkbookConflict(RuntimeError):
+    """The file changed between read and upload (HTTP 412)."""
+
+
+def graph_upload_file_bytes(
+    token: str,
+    site_id: str,
+    sp_file_path: str,
+    content: bytes | IO[bytes],
+    content_type: str,
+    if_match: str | None = None,
+) -> dict:
+    """
+    Creates or overwrites the file; returns the drive item.
+    content: bytes, or a binary file streamed from disk (never loaded whole).
+    if_match: eTag the file was read at; the upload is refused (412) if it changed since.
+    """
+    url = f"{GRAPH_BASE}/sites/{site_id}/drive/root:{sp_file_path}:/content"
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": content_type}
+    if if_match:
+        headers["If-Match"] = if_match
+    r = requests.put(url, headers=headers, data=content, timeout=120)
+    if r.status_code == 412:
+        raise WorkbookConflict(f"SharePoint upload failed: {sp_file_path} was modified by someone else, retry.")
+    if r.status_code not in (200, 201):
+        raise RuntimeError(f"SharePoint upload failed: {r.status_code} - {r.text}")
+    return r.json()
+
+
+def graph_upload_excel_bytes(
+    token: str, site_id: str, sp_file_path: str, content: bytes, if_match: str | None = None
+) -> dict:
+    return graph_upload_file_bytes(token, site_id, sp_file_path, content, XLSX_MIME, if_match=if_match)
+
+
+def graph_get_item(
+    token: str,
+    site_id: str,
+    sp_file_path: str,
+    select: str = "id,eTag,cTag,size,file",
+    if_none_match: str | None = None,
+) -> dict | None:
+    """
+    Drive item metadata (no content). Returns None if the file does not exist.
+    With if_none_match (an eTag), an unchanged item returns {} (304 Not Modified).
+    """
+    url = f"{GRAPH_BASE}/sites/{site_id}/drive/root:{sp_file_path}"
+    headers = {"Authorization": f"Bearer {token}"}
+    if if_none_match:
+        headers["If-None-Match"] = if_none_match
+    r = requests.get(url, headers=headers, params={"$select": select}, timeout=30)
+    if r.status_code == 304:
+        return {}
+    if r.status_code == 404:
+        return None
+    if not r.ok:
+        raise RuntimeError(f"SharePoint item lookup failed: {r.status_code} - {r.text}")
+    return r.json()
+
+
+def graph_download_thumbnail_bytes(token: str, site_id: str, sp_file_path: str, size: str = "medium") -> bytes | None:
+    """SharePoint-generated thumbnail (small/medium/large), without downloading the original."""
+    url = f"{GRAPH_BASE}/sites/{site_id}/drive/root:{sp_file_path}:/thumbnails/0/{size}/content"
+    r = requests.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=60)
+    if r.status_code == 404:
+        return None
+    if not r.ok:
+        raise RuntimeError(f"SharePoint thumbnail download failed: {r.status_code} - {r.text}")
+    return r.content
+
+
+# ==========================================================
+# Remote workbook (read-modify-write)
+# ==========================================================
+EXCEL_SHEET_NAME = "Submissions"
+# Read-modify-write attempts when another writer got in between (HTTP 412)
+MANIFEST_RETRIES = 3
+
+
+_workbooks: dict[str, tuple[str, pd.DataFrame]] = {}
+_workbooks_lock = threading.Lock()
+
+
+def mirror_path(sp_file_path: str) -> str:
+    # /General/feedback.xlsx -> /General/feedback.parquet
+    return os.path.splitext(sp_file_path)[0] + ".parquet"
+
+
+# Parquet key-value metadata: eTag of the workbook the mirror was written with
+MIRROR_SOURCE_KEY = "rof_workbook_etag"
+
+
+def dataframe_to_parquet_bytes(df: pd.DataFrame, metadata: dict[str, str] | None = None) -> bytes:
+    """
+    Keeps numeric/date columns typed. Columns mixing types (payload values vary across
+    app versions) are stored as strings; list cells as the text the workbook shows.
+    """
+    arrays = []
+    for c in df.columns:
+        col = df[c]
+        if col.dtype == object:
+            col = col.map(lambda v: str(v) if isinstance(v, (list, tuple, dict, set)) else v)
+        try:
+            arrays.append(pa.array(col, from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if pd.isna(v) else str(v) for v in col], type=pa.string()))
+    out = BytesIO()
+    table = pa.Table.from_arrays(arrays, names=[str(c) for c in df.columns])
+    if metadata:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+    pq.write_table(table, out)
+    return out.getvalue()
+
+
+def _table_to_frame(table: pa.Table) -> pd.DataFrame:
+    df = table.to_pandas()
+    source = (table.schema.metadata or {}).get(MIRROR_SOURCE_KEY.encode("utf-8"))
+    if source is not None:
+        df.attrs[MIRROR_SOURCE_KEY] = source.decode("utf-8")
+    return df
+
+
+def _parse_parquet(content: bytes) -> pd.DataFrame:
+    return _table_to_frame(pq.read_table(BytesIO(content)))
+
+
+def _parse_xlsx(content: bytes) -> pd.DataFrame:
+    return pd.read_excel(BytesIO(content))
+
+
+def _workbook_cache_files(sp_path: str) -> tuple[str, str]:
+    key = hashlib.sha256(sp_path.encode("utf-8")).hexdigest()[:16]
+    base = os.path.join(WORKBOOK_CACHE_DIR, key)
+    return f"{base}.parquet", f"{base}.json"
+
+
+def _cached_workbook(sp_path: str) -> tuple[str, pd.DataFrame] | None:
+    with _workbooks_lock:
+        cached = _workbooks.get(sp_path)
+    if cached:
+        return cached
+    df_path, meta_path = _workbook_cache_files(sp_path)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as r:
+            etag = json.load(r)["eTag"]
+        cached = (etag, _table_to_frame(pq.read_table(df_path)))
+    except (OSError, ValueError, KeyError, pa.ArrowException):
+        return None
+    with _workbooks_lock:
+        _workbooks[sp_path] = cached
+    return cached
+
+
+def _store_workbook(sp_path: str, etag: str | None, df: pd.DataFrame, content: bytes | None = None) -> None:
+    """content: the Parquet bytes if already serialized."""
+    if not etag:
+        return
+    with _workbooks_lock:
+        _workbooks[sp_path] = (etag, df)
+    try:
+        os.makedirs(WORKBOOK_CACHE_DIR, exist_ok=True)
+        df_path, meta_path = _workbook_cache_files(sp_path)
+        tmp = f"{df_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as w:
+            w.write(content if content is not None else dataframe_to_parquet_bytes(df))
+        os.replace(tmp, df_path)
+        # metadata last: the eTag only points at a fully written mirror
+        tmp = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as w:
+            json.dump({"eTag": etag, "path": sp_path}, w)
+        os.replace(tmp, meta_path)
+    except (OSError, pa.ArrowException):
+        pass
+
+
+def _read_remote_frame(token: str, site_id: str, sp_path: str, parse) -> tuple[pd.DataFrame, str | None]:
+    """
+    Returns (rows, eTag) of a remote file, parsed with `parse`; (empty, None) if missing.
+    The cached copy is revalidated with If-None-Match: an unchanged file costs
+    one small metadata request instead of a download + parse.
+    """
+    cached = _cached_workbook(sp_path)
+    item = graph_get_item(
+        token,
+        site_id,
+        sp_path,
+        select="eTag,@microsoft.graph.downloadUrl",
+        if_none_match=cached[0] if cached else None,
+    )
+    return _frame_from_item(token, site_id, sp_path, parse, item, cached)
+
+
+def _frame_from_item(token: str, site_id: str, sp_path: str, parse, item, cached) -> tuple[pd.DataFrame, str | None]:
+    """item: the file's metadata (None if missing, {} if not modified since cached)."""
+    if item is None:
+        return pd.DataFrame(), None
+    if not item and cached:
+        return cached[1], cached[0]
+
+    etag = item.get("eTag")
+    download_url = item.get("@microsoft.graph.downloadUrl")
+    if download_url:
+        content = graph_download_url_bytes(download_url)
+    else:
+        content = graph_download_file_bytes(token, site_id, sp_path)
+    if not content:
+        return pd.DataFrame(), etag
+    try:
+        df = parse(content)
+    except Exception as e:
+        # never treat an unreadable file as empty: the next write would replace it with only the new rows
+        raise RuntimeError(f"SharePoint file {sp_path} could not be read: {e}") from e
+    _store_workbook(sp_path, etag, df, content if parse is _parse_parquet else None)
+    return df, etag
+
+
+def _get_items_revalidated(token: str, site_id: str, lookups: list[tuple[str, str | None]]) -> list[dict | None]:
+    """
+    Metadata (eTag + download URL) of several files in one batched round trip;
+    lookups are (path, cached eTag or None). As graph_get_item: None if missing,
+    {} if not modified since the cached eTag.
+    """
+    reqs = []
+    for path, etag in lookups:
+        req = {"method": "GET", "url": drive_path_url(site_id, path, "eTag,@microsoft.graph.downloadUrl")}
+        if etag:
+            req["headers"] = {"If-None-Match": etag}
+        reqs.append(req)
+    items = []
+    for (path, _), resp in zip(lookups, graph_batch(token, reqs)):
+        if resp["status"] == 304:
+            items.append({})
+        elif resp["status"] == 404:
+            items.append(None)
+        elif 200 <= resp["status"] < 300:
+            items.append(resp["body"])
+        else:
+            raise RuntimeError(f"SharePoint item lookup failed for {path}: {resp['status']} - {resp['body']}")
+    return items
+
+
+def read_remote_workbook(token: str, site_id: str, sp_file_path: str) -> tuple[pd.DataFrame, object]:
+    """
+    Returns (rows, version) of a workbook; pass the version to write_remote_workbook
+    as if_match. A missing workbook is an empty frame with version None.
+    With SP_PARQUET_MIRROR the rows come from the Parquet mirror, unless the
+    workbook changed since the mirror was written (edited in Excel, or a write
+    that stopped halfway): then the workbook is parsed and becomes the new baseline.
+    The returned frame is shared with the cache; don't modify it in place.
+    """
+    if not SP_PARQUET_MIRROR:
+        return _read_remote_frame(token, site_id, sp_file_path, _parse_xlsx)
+
+    # mirror (revalidated against its cached copy) and workbook version: one round trip
+    parquet_path = mirror_path(sp_file_path)
+    cached = _cached_workbook(parquet_path)
+    mirror, workbook = _get_items_revalidated(
+        token, site_id, [(parquet_path, cached[0] if cached else None), (sp_file_path, None)]
+    )
+    df, mirror_etag = _frame_from_item(token, site_id, parquet_path, _parse_parquet, mirror, cached)
+    workbook_etag = workbook.get("eTag") if workbook else None
+    if mirror_etag is not None and (
+        workbook_etag is None  # workbook deleted: the next write recreates it from the mirror
+        or MIRROR_SOURCE_KEY not in df.attrs  # mirror from before the workbook version was recorded
+        or df.attrs[MIRROR_SOURCE_KEY] == workbook_etag
+    ):
+        return df, (mirror_etag, workbook_etag)
+
+    # no mirror yet, or the workbook changed after it: (re)seed from the workbook
+    df, workbook_etag = _frame_from_item(token, site_id, sp_file_path, _parse_xlsx, workbook, None)
+    return df, ((mirror_etag, workbook_etag) if workbook_etag or mirror_etag else None)
+
+
+def write_remote_workbook(token: str, site_id: str, sp_file_path: str, df: pd.DataFrame, if_match) -> None:
+    """
+    Uploads the rows, conditional on if_match (the version from read_remote_workbook).
+    With SP_PARQUET_MIRROR the workbook is uploaded first, conditional on its own
+    eTag, so an edit made in Excel since the read is never overwritten (412, the
+    caller re-reads). The mirror is then written with the new workbook eTag.
+    """
+    if not SP_PARQUET_MIRROR:
+        content = dataframe_to_xlsx_bytes(df, sheet_name=EXCEL_SHEET_NAME)
+        item = graph_upload_excel_bytes(token, site_id, sp_file_path, content, if_match=if_match)
+        # Our own write is the new baseline: the next read revalidates to 304
+        _store_workbook(sp_file_path, item.get("eTag"), df)
+        return
+
+    mirror_etag, workbook_etag = if_match or (None, None)
+    content = dataframe_to_xlsx_bytes(df, sheet_name=EXCEL_SHEET_NAME)
+    item = graph_upload_excel_bytes(token, site_id, sp_file_path, content, if_match=workbook_etag)
+
+    # If this upload fails, the mirror still names the previous workbook eTag,
+    # so the next read re-seeds from the workbook just written: nothing is lost.
+    parquet_path = mirror_path(sp_file_path)
+    df = df.copy(deep=False)
+    df.attrs[MIRROR_SOURCE_KEY] = item.get("eTag") or ""
+    content = dataframe_to_parquet_bytes(df, metadata={MIRROR_SOURCE_KEY: df.attrs[MIRROR_SOURCE_KEY]})
+    mirror = graph_upload_file_bytes(token, site_id, parquet_path, content, PARQUET_MIME, if_match=mirror_etag)
+    _store_workbook(parquet_path, mirror.get("eTag"), df, content)
+
+
+def append_rows_to_remote_excel(token: str, site_id: str, sp_file_path: str, rows: list[dict]) -> int:
+    """
+    Appends rows to the workbook in one rewrite. Keeps all columns that ever appeared;
+    rows whose submission_id is already there are skipped (returns the count appended).
+    The upload is conditional on the eTag that was read, so a concurrent append is
+    never overwritten: on a conflict the workbook is read again and the rows re-applied.
+    """
+    if not rows:
+        return 0
+    for attempt in range(MANIFEST_RETRIES):
+        existing_df, etag = read_remote_workbook(token, site_id, sp_file_path)
+        pending = rows
+        if "submission_id" in existing_df.columns:
+            # a retried submit (same submission_id) is already in the workbook
+            present = set(existing_df["submission_id"].dropna().astype(str))
+            pending = [r for r in rows if str(r.get("submission_id")) not in present]
+            if not pending:
+                return 0
+
+        new_rows = pd.DataFrame(pending)
+        all_cols = list(dict.fromkeys(list(existing_df.columns) + list(new_rows.columns)))
+        updated_df = pd.concat(
+            [existing_df.reindex(columns=all_cols), new_rows.reindex(columns=all_cols)], ignore_index=True
+        )
+        try:
+            write_remote_workbook(token, site_id, sp_file_path, updated_df, if_match=etag)
+            return len(pending)
+        except WorkbookConflict:
+            # someone else wrote the workbook since it was read: re-read and append again
+            if attempt == MANIFEST_RETRIES - 1:
+                raise
+
+
+def _workbook_cell(value):
+    # same text the workbook and the mirror hold for list cells (see dataframe_to_parquet_bytes)
+    return str(value) if isinstance(value, (list, tuple, dict, set)) else value
+
+
+def update_rows_in_remote_excel(token: str, site_id: str, sp_file_path: str, updates: dict[str, dict]) -> int:
+    """
+    Sets fields of rows already in the workbook ({submission_id: fields}) in one
+    rewrite, conditional on the version read like an append (re-read and re-applied
+    on a conflict). Returns the number of rows changed; unchanged rows cost no write.
+    """
+    if not updates:
+        return 0
+    for attempt in range(MANIFEST_RETRIES):
+        existing_df, etag = read_remote_workbook(token, site_id, sp_file_path)
+        if "submission_id" not in existing_df.columns:
+            return 0
+        ids = existing_df["submission_id"].astype(str)
+        df = existing_df.copy()
+        changed = set()
+        for i in df.index[ids.isin(updates)]:
+            for col, value in updates[ids[i]].items():
+                value = _workbook_cell(value)
+                if col not in df.columns:
+                    df[col] = None
+                old = df.at[i, col]
+                if (pd.isna(old) and value is None) or (not pd.isna(old) and old == value):
+                    continue
+                if df[col].dtype != object:
+                    df[col] = df[col].astype(object)
+                df.at[i, col] = value
+                changed.add(i)
+        if not changed:
+            return 0
+        try:
+            write_remote_workbook(token, site_id, sp_file_path, df, if_match=etag)
+            return len(changed)
+        except WorkbookConflict:
+            if attempt == MANIFEST_RETRIES - 1:
+                raise
+
+
+# ==========================================================
+# Local workbook (same Parquet mirror, on disk)
+#
+#   <export>.parquet   the rows, canonical
+#   <export>.xlsx      regenerated from them on every write
+#
+# The mirror records the .xlsx version (mtime:size) it was written with, so a
+# workbook edited in Excel since is parsed once and becomes the new baseline.
+# ==========================================================
+def _local_file_version(path: str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def read_local_workbook(xlsx_path: str) -> pd.DataFrame:
+    """
+    Rows of a local workbook, read from its Parquet mirror; the .xlsx is only
+    parsed when there is no mirror yet or it was changed after the mirror.
+    Empty if neither file exists; raises if the rows can't be read.
+    """
+    parquet_path = mirror_path(xlsx_path)
+    workbook_version = _local_file_version(xlsx_path) if os.path.exists(xlsx_path) else None
+    if os.path.exists(parquet_path):
+        try:
+            df = _table_to_frame(pq.read_table(parquet_path))
+        except (OSError, pa.ArrowException):
+            df = None  # half-written or damaged: the workbook still has the rows
+        if df is not None and (workbook_version is None or df.attrs.get(MIRROR_SOURCE_KEY) == workbook_version):
+            return df
+    if workbook_version is None:
+        return pd.DataFrame()
+    try:
+        df = pd.read_excel(xlsx_path)
+    except Exception as e:
+        # never treat an unreadable file as empty: the next write would replace it with only the new rows
+        raise RuntimeError(f"Workbook {xlsx_path} could not be read: {e}") from e
+    _write_local_mirror(df, parquet_path, workbook_version)
+    return df
+
+
+def _write_local_mirror(df: pd.DataFrame, parquet_path: str, workbook_version: str) -> None:
+    tmp = f"{parquet_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as w:
+        w.write(dataframe_to_parquet_bytes(df, metadata={MIRROR_SOURCE_KEY: workbook_version}))
+    os.replace(tmp, parquet_path)
+
+
+def write_local_workbook(df: pd.DataFrame, xlsx_path: str) -> None:
+    """
+    Writes the .xlsx, then the mirror naming its version. If the process stops in
+    between, the mirror names the previous version and the next read re-seeds it.
+    """
+    write_dataframe_xlsx(df, xlsx_path, sheet_name=EXCEL_SHEET_NAME)
+    _write_local_mirror(df, mirror_path(xlsx_path), _local_file_version(xlsx_path))
+
+
+# ==========================================================
+# Sharded workbooks + manifest
+# ==========================================================
+MANIFEST_COLUMNS = ["shard", "path", "rows", "last_submission_id", "updated_at_utc"]
+
+
+def _station_regions() -> dict:
+    regions = SP_STATION_REGIONS or {}
+    if isinstance(regions, str):
+        regions = json.loads(regions)
+    return {str(k).strip().upper(): str(v) for k, v in dict(regions).items()}
+
+
+def excel_shard_key(payload: dict) -> str:
+    """Shard a submission belongs to ("" when the workbook is not sharded)."""
+    if not SP_EXCEL_SHARDING:
+        return ""
+    if SP_EXCEL_SHARDING == "month":
+        sid = payload.get("submission_id")
+        return (submission_id_time(sid) if sid else datetime.now(timezone.utc)).strftime("%Y-%m")
+    if SP_EXCEL_SHARDING == "station":
+        station = str(payload.get("station") or "").strip().upper() or "UNKNOWN"
+        return _station_regions().get(station, station)
+    raise ValueError(f"Unknown SP_EXCEL_SHARDING: {SP_EXCEL_SHARDING} (expected '', 'month' or 'station')")
+
+
+def excel_shard_path(key: str) -> str:
+    # /General/feedback.xlsx -> /General/feedback_2026-10.xlsx
+    if not key:
+        return SP_EXCEL_PATH
+    base, ext = os.path.splitext(SP_EXCEL_PATH)
+    return f"{base}_{safe_filename(key)}{ext}"
+
+
+def excel_manifest_path() -> str:
+    base, ext = os.path.splitext(SP_EXCEL_PATH)
+    return f"{base}_manifest{ext}"
+
+
+def excel_workbook_paths(token: str, site_id: str) -> list[str]:
+    """Every workbook that may hold submissions (the unsharded one plus the shards in the manifest)."""
+    paths = [SP_EXCEL_PATH]
+    if SP_EXCEL_SHARDING:
+        manifest, _ = read_remote_workbook(token, site_id, excel_manifest_path())
+        if "path" in manifest.columns:
+            paths += manifest["path"].dropna().astype(str).tolist()
+    return list(dict.fromkeys(paths))
+
+
+def update_excel_manifest(token: str, site_id: str, shards: dict[str, dict]) -> None:
+    """Upserts one manifest row per shard ({key: {"path", "rows", "last_submission_id"}})."""
+    path = excel_manifest_path()
+    now = datetime.now(timezone.utc).isoformat()
+    for attempt in range(MANIFEST_RETRIES):
+        manifest, etag = read_remote_workbook(token, site_id, path)
+        records = {str(r["shard"]): r for r in manifest.to_dict("records")} if "shard" in manifest.columns else {}
+        for key, info in shards.items():
+            records[key] = {"shard": key, **info, "updated_at_utc": now}
+        df = pd.DataFrame(sorted(records.values(), key=lambda r: r["shard"])).reindex(columns=MANIFEST_COLUMNS)
+        try:
+            write_remote_workbook(token, site_id, path, df, if_match=etag)
+            return
+        except WorkbookConflict:
+            # another process updated the manifest meanwhile: re-read and merge again
+            if attempt == MANIFEST_RETRIES - 1:
+                raise
+
+
+def append_rows_to_workbooks(token: str, site_id: str, rows: list[dict]) -> int:
+    """
+    Appends rows to the workbook(s) per SP_EXCEL_SHARDING. Each shard gets one
+    rewrite and only the shards the rows belong to are touched; the manifest
+    then records every touched shard with its row count.
+    """
+    if not SP_EXCEL_SHARDING:
+        return append_rows_to_remote_excel(token, site_id, SP_EXCEL_PATH, rows)
+
+    by_shard: dict[str, list[dict]] = {}
+    for row in rows:
+        by_shard.setdefault(excel_shard_key(row), []).append(row)
+
+    shards = {}
+    appended = 0
+    for key, shard_rows in by_shard.items():
+        shard_path = excel_shard_path(key)
+        appended += append_rows_to_remote_excel(token, site_id, shard_path, shard_rows)
+        # served from the copy we just uploaded (304)
+        shard_df, _ = read_remote_workbook(token, site_id, shard_path)
+        shards[key] = {
+            "path": shard_path,
+            "rows": len(shard_df),
+            "last_submission_id": max(str(r.get("submission_id") or "") for r in shard_rows),
+        }
+    update_excel_manifest(token, site_id, shards)
+    return appended
+
+
+def update_rows_in_workbooks(token: str, site_id: str, updates: dict[str, dict]) -> int:
+    """update_rows_in_remote_excel over every workbook (shards included); returns the rows changed."""
+    return sum(update_rows_in_remote_excel(token, site_id, path, updates) for path in excel_workbook_paths(token, site_id))
+
+
+# ==========================================================
+# Attachment partitions (<folder>/<STATION>/<YYYY>/<MM>/ + _index.json)
+# ==========================================================
+SP_ATTACHMENT_INDEX_NAME = "_index.json"
+
+
+def sp_attachment_partition_folder(station, submission_id: str | None) -> str:
+    return f"{sp_attachments_folder()}/{attachment_partition(station, submission_id)}".replace("//", "/")
+
+
+def _read_json_file(token: str, site_id: str, sp_path: str) -> tuple[list, str | None]:
+    item = graph_get_item(token, site_id, sp_path, select="eTag,@microsoft.graph.downloadUrl")
+    if not item:
+        return [], None
+    download_url = item.get("@microsoft.graph.downloadUrl")
+    content = graph_download_url_bytes(download_url) if download_url else graph_download_file_bytes(token, site_id, sp_path)
+    return json.loads(content or b"[]"), item.get("eTag")
+
+
+def update_sp_attachment_index(token: str, site_id: str, folder: str, entries: list[dict]) -> None:
+    """Upserts files (by name) in the partition's index, with the same retry-on-conflict as the manifest."""
+    path = f"{folder}/{SP_ATTACHMENT_INDEX_NAME}"
+    for attempt in range(MANIFEST_RETRIES):
+        index, etag = _read_json_file(token, site_id, path)
+        records = {r["name"]: r for r in index}
+        records.update({e["name"]: e for e in entries})
+        content = json.dumps(sorted(records.values(), key=lambda r: r["name"]), ensure_ascii=False, indent=1)
+        try:
+            graph_upload_file_bytes(token, site_id, path, content.encode("utf-8"), "application/json", if_match=etag)
+            return
+        except WorkbookConflict:
+            if attempt == MANIFEST_RETRIES - 1:
+                raise
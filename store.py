@@ -0,0 +1,753 @@
+import os
+import sys
+import json
+import glob
+import itertools
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from ids import submission_id_bound
+
+# ------------------------- Config ------------------------- #
+SUBMISSIONS_DIR = "submissions"
+SUBMISSION_PREFIX = "rof_"
+
+# Local system of record (SQLite, WAL mode so several Streamlit processes can share it)
+DB_FILE = os.path.join(SUBMISSIONS_DIR, "submissions.sqlite3")
+
+# Payload fields copied into real columns, each with a secondary index
+INDEXED_COLUMNS = [
+    "station",
+    "route_date",
+    "route_number",
+    "driver_id",
+    "idc_id",
+    "severity",
+    "main_issue_category",
+    "submitted_at_utc",
+]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS submissions (
+    submission_id TEXT PRIMARY KEY,
+    {", ".join(f"{c} TEXT" for c in INDEXED_COLUMNS)},
+    payload TEXT NOT NULL
+);
+{"".join(f"CREATE INDEX IF NOT EXISTS submissions_{c} ON submissions({c});" for c in INDEXED_COLUMNS)}
+CREATE TABLE IF NOT EXISTS route_rollups (
+    station TEXT NOT NULL,
+    route_number TEXT NOT NULL,
+    route_date TEXT NOT NULL,
+    issue_count INTEGER NOT NULL,
+    worst_severity TEXT,
+    time_lost_min_total REAL NOT NULL,
+    stops TEXT NOT NULL,
+    issue_categories TEXT NOT NULL,
+    last_submission_id TEXT,
+    PRIMARY KEY (station, route_number, route_date)
+);
+CREATE INDEX IF NOT EXISTS route_rollups_route_date ON route_rollups(route_date);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idempotency_key TEXT PRIMARY KEY,
+    submission_id TEXT NOT NULL,
+    receipt TEXT,
+    created_at_utc TEXT NOT NULL,
+    final INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL
+);
+"""
+# Bumped when a migration is added (see _migrate): 1 builds the route rollups,
+# 2 imports the JSON files (and archives) written before the database existed,
+# 3 adds the final flag and lease of idempotency keys, 4 the change counter
+SCHEMA_VERSION = 4
+
+# Change counter: every insert, edit or delete of a submission bumps
+# data_changes.seq, and inserted/edited rows record the value in change_seq
+# (so "what changed since N" is an indexed range scan). Set up by migration 4.
+CHANGE_TRACKING = """
+CREATE TABLE IF NOT EXISTS data_changes (id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL);
+INSERT OR IGNORE INTO data_changes (id, seq) SELECT 1, coalesce(max(rowid), 0) FROM submissions;
+UPDATE submissions SET change_seq = rowid WHERE change_seq IS NULL;
+CREATE INDEX IF NOT EXISTS submissions_change_seq ON submissions(change_seq);
+CREATE TRIGGER IF NOT EXISTS submissions_inserted AFTER INSERT ON submissions BEGIN
+    UPDATE data_changes SET seq = seq + 1 WHERE id = 1;
+    UPDATE submissions SET change_seq = (SELECT seq FROM data_changes WHERE id = 1) WHERE rowid = NEW.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS submissions_edited AFTER UPDATE OF payload ON submissions BEGIN
+    UPDATE data_changes SET seq = seq + 1 WHERE id = 1;
+    UPDATE submissions SET change_seq = (SELECT seq FROM data_changes WHERE id = 1) WHERE rowid = NEW.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS submissions_deleted AFTER DELETE ON submissions BEGIN
+    UPDATE data_changes SET seq = seq + 1 WHERE id = 1;
+END;
+"""
+
+# How long a submit holds its idempotency key; a retry waits that long for a
+# submit that stopped without releasing it (process killed mid-upload)
+SUBMIT_LEASE_S = 600
+
+# One row per (station, route_number, route_date), maintained at every insert
+ROUTE_KEY = ["station", "route_number", "route_date"]
+ROUTE_ROLLUP_COLUMNS = ROUTE_KEY + [
+    "issue_count",
+    "worst_severity",
+    "time_lost_min_total",
+    "stops",
+    "issue_categories",
+    "last_submission_id",
+]
+SEVERITY_ORDER = ["Low", "Medium", "High", "Critical"]
+
+READ_BATCH_SIZE = 500
+
+
+# ==========================================================
+# Local submissions (one JSON file per submission)
+# ==========================================================
+def list_submission_files(directory: str = SUBMISSIONS_DIR) -> list[str]:
+    # submission ids are time-ordered, so a name sort is a chronological sort
+    return sorted(glob.glob(os.path.join(directory, f"{SUBMISSION_PREFIX}*.json")))
+
+
+def submission_id_from_path(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_submission_file(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as r:
+        payload = json.load(r)
+    payload.setdefault("submission_id", submission_id_from_path(path))
+    return payload
+
+
+def submission_path(submission_id: str, directory: str = SUBMISSIONS_DIR) -> str:
+    return os.path.join(directory, f"{submission_id}.json")
+
+
+def write_submission_file(payload: dict, directory: str = SUBMISSIONS_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = submission_path(payload["submission_id"], directory)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as w:
+        json.dump(payload, w, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def local_path(stored_path: str) -> str:
+    # attachments saved on Windows are stored with backslashes
+    return os.sep.join(stored_path.replace("\\", "/").split("/"))
+
+
+# ==========================================================
+# SQLite system of record
+# ==========================================================
+_prepared: set[str] = set()
+_prepare_lock = threading.Lock()
+
+
+def connect(db_path: str = DB_FILE) -> sqlite3.Connection:
+    """
+    Connection to the store. The schema and migrations are checked once per
+    process and database file; later calls only open the connection.
+    """
+    key = os.path.abspath(db_path)
+    if key not in _prepared or not os.path.exists(db_path):
+        with _prepare_lock:
+            if key not in _prepared or not os.path.exists(db_path):
+                _prepare(db_path)
+                _prepared.add(key)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA synchronous=NORMAL")  # per connection; WAL mode is stored in the file
+    return conn
+
+
+def _prepare(db_path: str) -> None:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # re-check under the write lock: another process may have just done it
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version < SCHEMA_VERSION:
+                    _migrate(conn, version, os.path.dirname(db_path) or ".")
+                    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    finally:
+        conn.close()
+
+
+def _migrate(conn: sqlite3.Connection, version: int, directory: str) -> None:
+    if version < 1:
+        _rebuild_route_rollups(conn)
+    if version < 2:
+        # submissions saved as JSON only (before the database, or by the older apps)
+        _import_json_dir(conn, directory)
+    if version < 3:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(idempotency_keys)")}
+        if "final" not in columns:
+            conn.execute("ALTER TABLE idempotency_keys ADD COLUMN final INTEGER NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE idempotency_keys ADD COLUMN lease_until REAL")
+            # receipts used to be saved only once a submit was over
+            conn.execute("UPDATE idempotency_keys SET final = 1 WHERE receipt IS NOT NULL")
+    if version < 4:
+        if "change_seq" not in {row[1] for row in conn.execute("PRAGMA table_info(submissions)")}:
+            conn.execute("ALTER TABLE submissions ADD COLUMN change_seq INTEGER")
+        for statement in _split_statements(CHANGE_TRACKING):
+            conn.execute(statement)
+
+
+def _split_statements(script: str) -> list[str]:
+    # executescript() would commit the migration transaction; triggers span several ";"
+    statements, current = [], ""
+    for line in script.strip().splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    return statements
+
+
+def _row_values(payload: dict) -> list:
+    values = [payload["submission_id"]]
+    for c in INDEXED_COLUMNS:
+        v = payload.get(c)
+        values.append(None if v is None else str(v))
+    values.append(json.dumps(payload, ensure_ascii=False))
+    return values
+
+
+_COLUMNS_SQL = ", ".join(["submission_id"] + INDEXED_COLUMNS + ["payload"])
+_PLACEHOLDERS_SQL = ", ".join("?" * (len(INDEXED_COLUMNS) + 2))
+_UPDATE_SQL = ", ".join(f"{c} = excluded.{c}" for c in INDEXED_COLUMNS + ["payload"])
+
+
+# ==========================================================
+# Route rollups (incremental)
+# ==========================================================
+def _route_key(payload: dict) -> tuple[str, str, str]:
+    return tuple(str(payload.get(c) or "").strip() for c in ROUTE_KEY)
+
+
+def _time_lost_mid(payload: dict) -> float:
+    if "time_lost_min_mid" not in payload:
+        # submissions saved before the numeric columns existed
+        from metrics import numeric_fields
+
+        payload = numeric_fields(payload)
+    value = payload.get("time_lost_min_mid")
+    return float(value) if value is not None and value == value else 0.0
+
+
+def _route_contribution(payload: dict) -> tuple:
+    return (
+        _route_key(payload),
+        payload.get("severity"),
+        _time_lost_mid(payload),
+        str(payload.get("stop_number") or "").strip(),
+        str(payload.get("main_issue_category") or "").strip(),
+    )
+
+
+def _empty_route_row() -> dict:
+    return {
+        "issue_count": 0,
+        "worst_severity": None,
+        "time_lost_min_total": 0.0,
+        "stops": [],
+        "issue_categories": {},
+        "last_submission_id": None,
+    }
+
+
+def _fold_into_route_row(row: dict, payload: dict) -> dict:
+    _, severity, time_lost, stop, category = _route_contribution(payload)
+    row["issue_count"] += 1
+    if severity in SEVERITY_ORDER and (
+        row["worst_severity"] not in SEVERITY_ORDER
+        or SEVERITY_ORDER.index(severity) > SEVERITY_ORDER.index(row["worst_severity"])
+    ):
+        row["worst_severity"] = severity
+    row["time_lost_min_total"] += time_lost
+    if stop and stop not in row["stops"]:
+        row["stops"].append(stop)
+    if category:
+        row["issue_categories"][category] = row["issue_categories"].get(category, 0) + 1
+    row["last_submission_id"] = max(row["last_submission_id"] or "", payload["submission_id"])
+    return row
+
+
+def _write_route_row(conn: sqlite3.Connection, key: tuple, row: dict) -> None:
+    conn.execute(
+        f"INSERT OR REPLACE INTO route_rollups ({', '.join(ROUTE_ROLLUP_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(ROUTE_ROLLUP_COLUMNS))})",
+        [
+            *key,
+            row["issue_count"],
+            row["worst_severity"],
+            row["time_lost_min_total"],
+            json.dumps(row["stops"], ensure_ascii=False),
+            json.dumps(row["issue_categories"], ensure_ascii=False),
+            row["last_submission_id"],
+        ],
+    )
+
+
+def _read_route_row(conn: sqlite3.Connection, key: tuple) -> dict | None:
+    found = conn.execute(
+        f"SELECT {', '.join(ROUTE_ROLLUP_COLUMNS)} FROM route_rollups "
+        "WHERE station = ? AND route_number = ? AND route_date = ?",
+        key,
+    ).fetchone()
+    if found is None:
+        return None
+    row = dict(zip(ROUTE_ROLLUP_COLUMNS, found))
+    row["stops"] = json.loads(row["stops"])
+    row["issue_categories"] = json.loads(row["issue_categories"])
+    return row
+
+
+def _add_to_route_rollup(conn: sqlite3.Connection, payload: dict) -> None:
+    """O(1): folds one new submission into its route row (one primary-key read + write)."""
+    key = _route_key(payload)
+    row = _read_route_row(conn, key) or _empty_route_row()
+    _write_route_row(conn, key, _fold_into_route_row(row, payload))
+
+
+def _rebuild_route_rollup(conn: sqlite3.Connection, key: tuple) -> None:
+    # Only needed when an already stored submission moves route or changes severity etc.
+    conn.execute("DELETE FROM route_rollups WHERE station = ? AND route_number = ? AND route_date = ?", key)
+    date = key[2]
+    rows = conn.execute(
+        "SELECT payload FROM submissions WHERE route_date = ? ORDER BY submission_id" if date
+        else "SELECT payload FROM submissions WHERE route_date IS NULL OR route_date = '' ORDER BY submission_id",
+        (date,) if date else (),
+    )
+    row = None
+    for (raw,) in rows:
+        payload = json.loads(raw)
+        if _route_key(payload) == key:
+            row = _fold_into_route_row(row or _empty_route_row(), payload)
+    if row:
+        _write_route_row(conn, key, row)
+
+
+def _rebuild_route_rollups(conn: sqlite3.Connection) -> None:
+    conn.execute("DELETE FROM route_rollups")
+    rows: dict[tuple, dict] = {}
+    for (raw,) in conn.execute("SELECT payload FROM submissions ORDER BY submission_id"):
+        payload = json.loads(raw)
+        key = _route_key(payload)
+        rows[key] = _fold_into_route_row(rows.get(key) or _empty_route_row(), payload)
+    for key, row in rows.items():
+        _write_route_row(conn, key, row)
+
+
+def _upsert_submission(conn: sqlite3.Connection, payload: dict, old: dict | None) -> None:
+    """old: the stored payload (None if new). Keeps the route rollup in step."""
+    # an upsert, not INSERT OR REPLACE: an edited row keeps its rowid (insert order)
+    conn.execute(
+        f"INSERT INTO submissions ({_COLUMNS_SQL}) VALUES ({_PLACEHOLDERS_SQL}) "
+        f"ON CONFLICT(submission_id) DO UPDATE SET {_UPDATE_SQL}",
+        _row_values(payload),
+    )
+    if old is None:
+        _add_to_route_rollup(conn, payload)
+    elif _route_contribution(old) != _route_contribution(payload):
+        for key in {_route_key(old), _route_key(payload)}:
+            _rebuild_route_rollup(conn, key)
+
+
+def save_submission_record(payload: dict, db_path: str = DB_FILE) -> None:
+    """Inserts (or replaces) one submission in the database, keeping its route rollup in step."""
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            old = conn.execute(
+                "SELECT payload FROM submissions WHERE submission_id = ?", (payload["submission_id"],)
+            ).fetchone()
+            _upsert_submission(conn, payload, json.loads(old[0]) if old else None)
+    finally:
+        conn.close()
+
+
+# ==========================================================
+# Idempotent submits
+#
+# The form gets an idempotency key when it is first rendered. The first submit
+# with a key claims it for a submission id and holds it (a lease) while its
+# sinks run; a retry (double click, reconnect) gets the same id back, so every
+# sink writes the same JSON file, row and SharePoint names again instead of
+# new ones. A retry that arrives while the lease is held is turned away
+# (SubmitInProgress). Once every sink has succeeded the receipt is final and
+# later retries just show it; a receipt with a failed sink is kept for the
+# next retry, which runs the failed sinks again.
+# ==========================================================
+class SubmitInProgress(Exception):
+    def __init__(self, submission_id: str):
+        super().__init__(f"Submission {submission_id} is still being processed.")
+        self.submission_id = submission_id
+
+
+def claim_idempotency_key(
+    key: str, submission_id: str, db_path: str = DB_FILE, lease_s: float = SUBMIT_LEASE_S
+) -> tuple[str, dict | None, bool]:
+    """
+    Returns (submission id to use, receipt or None, final). With a final receipt
+    the submit is done. Otherwise the caller now holds the key for lease_s seconds
+    and the receipt, if any, is that of an earlier attempt with a failed sink.
+    Raises SubmitInProgress while another caller holds the key.
+    """
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT submission_id, receipt, final, lease_until FROM idempotency_keys WHERE idempotency_key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO idempotency_keys (idempotency_key, submission_id, created_at_utc, lease_until) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, submission_id, datetime.now(timezone.utc).isoformat(), now + lease_s),
+                )
+                return submission_id, None, False
+            claimed_id, receipt, final, lease_until = row
+            if final:
+                return claimed_id, json.loads(receipt), True
+            if lease_until is not None and lease_until > now:
+                raise SubmitInProgress(claimed_id)
+            conn.execute("UPDATE idempotency_keys SET lease_until = ? WHERE idempotency_key = ?", (now + lease_s, key))
+            return claimed_id, json.loads(receipt) if receipt else None, False
+    finally:
+        conn.close()
+
+
+def save_receipt(key: str, receipt: dict, db_path: str = DB_FILE, final: bool = True) -> None:
+    """Stores the receipt and releases the key; final=False when a sink failed (the next retry runs it again)."""
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE idempotency_keys SET receipt = ?, final = ?, lease_until = NULL WHERE idempotency_key = ?",
+                (json.dumps(receipt, ensure_ascii=False), int(final), key),
+            )
+    finally:
+        conn.close()
+
+
+def release_idempotency_key(key: str, db_path: str = DB_FILE) -> None:
+    """Lets a retry in at once after a submit that failed before saving a receipt."""
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("UPDATE idempotency_keys SET lease_until = NULL WHERE idempotency_key = ? AND final = 0", (key,))
+    finally:
+        conn.close()
+
+
+def get_submission(submission_id: str, db_path: str = DB_FILE) -> dict | None:
+    conn = connect(db_path)
+    try:
+        row = conn.execute("SELECT payload FROM submissions WHERE submission_id = ?", (submission_id,)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def _where(filters: dict) -> tuple[list[str], list]:
+    """
+    Filters on indexed columns: a value (or list of values) per column,
+    plus date_from / date_to on route_date (inclusive, YYYY-MM-DD) and
+    submitted_from / submitted_to (datetimes, [from, to)) as a primary-key range scan.
+    """
+    clauses, params = [], []
+    for key, value in filters.items():
+        if value is None or value == "" or value == []:
+            continue
+        if key in ("date_from", "date_to"):
+            clauses.append("route_date >= ?" if key == "date_from" else "route_date <= ?")
+            params.append(value.isoformat() if hasattr(value, "isoformat") else str(value))
+        elif key in ("submitted_from", "submitted_to"):
+            # ids start with their creation time, so a time range is an id range
+            clauses.append("submission_id >= ?" if key == "submitted_from" else "submission_id < ?")
+            params.append(submission_id_bound(value))
+        elif key in INDEXED_COLUMNS:
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f"{key} IN ({', '.join('?' * len(values))})")
+            params.extend(str(v) for v in values)
+        else:
+            raise ValueError(f"Unknown submission filter: {key}")
+    return clauses, params
+
+
+def iter_submissions(after_id: str | None = None, descending: bool = False, db_path: str = DB_FILE, **filters):
+    """
+    Yields submission payloads in submission_id order (newest first if descending).
+    after_id skips everything up to and including that id (in iteration order).
+    Reads in keyset-paginated batches, so memory stays flat on large stores.
+    """
+    clauses, params = _where(filters)
+    op, order = ("<", "DESC") if descending else (">", "ASC")
+    conn = connect(db_path)
+    try:
+        cursor_id = after_id
+        while True:
+            where = list(clauses)
+            page_params = list(params)
+            if cursor_id:
+                where.append(f"submission_id {op} ?")
+                page_params.append(cursor_id)
+            sql = "SELECT submission_id, payload FROM submissions"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += f" ORDER BY submission_id {order} LIMIT {READ_BATCH_SIZE}"
+            rows = conn.execute(sql, page_params).fetchall()
+            for _, payload in rows:
+                yield json.loads(payload)
+            if len(rows) < READ_BATCH_SIZE:
+                return
+            cursor_id = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def iter_inserted_submissions(after_rowid: int = 0, db_path: str = DB_FILE):
+    """
+    Yields (rowid, payload) in insert order, after after_rowid. Unlike an id
+    watermark, this sees rows stored late with an older id (imports, backfill,
+    retried submits) exactly once; edits keep their rowid and are not seen again.
+    """
+    conn = connect(db_path)
+    try:
+        while True:
+            rows = conn.execute(
+                f"SELECT rowid, payload FROM submissions WHERE rowid > ? ORDER BY rowid LIMIT {READ_BATCH_SIZE}",
+                (after_rowid,),
+            ).fetchall()
+            for rowid, payload in rows:
+                yield rowid, json.loads(payload)
+            if len(rows) < READ_BATCH_SIZE:
+                return
+            after_rowid = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def iter_changed_submissions(after_seq: int = 0, db_path: str = DB_FILE):
+    """
+    Yields (change_seq, payload) for rows inserted or edited after the change
+    counter value after_seq, oldest change first. Deletes are not reported;
+    compare counts to notice them.
+    """
+    conn = connect(db_path)
+    try:
+        while True:
+            rows = conn.execute(
+                "SELECT change_seq, payload FROM submissions WHERE change_seq > ? "
+                f"ORDER BY change_seq LIMIT {READ_BATCH_SIZE}",
+                (after_seq,),
+            ).fetchall()
+            for seq, payload in rows:
+                yield seq, json.loads(payload)
+            if len(rows) < READ_BATCH_SIZE:
+                return
+            after_seq = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def count_inserted_upto(rowid: int, db_path: str = DB_FILE) -> int:
+    """Rows with rowid <= rowid; lets a rowid watermark notice that rows were deleted or renumbered (VACUUM)."""
+    conn = connect(db_path)
+    try:
+        return conn.execute("SELECT count(*) FROM submissions WHERE rowid <= ?", (rowid,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def load_submissions_df(after_id: str | None = None, db_path: str = DB_FILE, **filters) -> pd.DataFrame:
+    return pd.DataFrame(list(iter_submissions(after_id=after_id, db_path=db_path, **filters)))
+
+
+def load_indexed_columns_df(columns: list[str], db_path: str = DB_FILE, **filters) -> pd.DataFrame:
+    """Only indexed columns (plus submission_id), straight from SQL: no payload is decoded."""
+    unknown = set(columns) - set(INDEXED_COLUMNS)
+    if unknown:
+        raise ValueError(f"Not an indexed column: {', '.join(sorted(unknown))}")
+    clauses, params = _where(filters)
+    sql = f"SELECT {', '.join(['submission_id'] + list(columns))} FROM submissions"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY submission_id"
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+
+def data_change_seq(db_path: str = DB_FILE) -> int:
+    """The change counter: bumped by every insert, edit and delete of a submission."""
+    conn = connect(db_path)
+    try:
+        return conn.execute("SELECT seq FROM data_changes WHERE id = 1").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def data_watermark(db_path: str = DB_FILE) -> str:
+    """Changes whenever a submission is added, edited or deleted (count + change counter)."""
+    conn = connect(db_path)
+    try:
+        count, seq = conn.execute(
+            "SELECT count(*), (SELECT seq FROM data_changes WHERE id = 1) FROM submissions"
+        ).fetchone()
+    finally:
+        conn.close()
+    return f"{count}-{seq}"
+
+
+def count_submissions(db_path: str = DB_FILE, **filters) -> int:
+    clauses, params = _where(filters)
+    sql = "SELECT count(*) FROM submissions" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+    conn = connect(db_path)
+    try:
+        return conn.execute(sql, params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def distinct_values(column: str, db_path: str = DB_FILE) -> list[str]:
+    if column not in INDEXED_COLUMNS:
+        raise ValueError(f"Not an indexed column: {column}")
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT DISTINCT {column} FROM submissions WHERE {column} IS NOT NULL AND {column} != '' ORDER BY 1"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [r[0] for r in rows]
+
+
+def load_route_rollups_df(
+    db_path: str = DB_FILE, date_from=None, date_to=None, station: str | list[str] | None = None
+) -> pd.DataFrame:
+    """Route rollup rows (newest route date first); stops / issue_categories decoded."""
+    clauses, params = [], []
+    if date_from:
+        clauses.append("route_date >= ?")
+        params.append(date_from.isoformat() if hasattr(date_from, "isoformat") else str(date_from))
+    if date_to:
+        clauses.append("route_date <= ?")
+        params.append(date_to.isoformat() if hasattr(date_to, "isoformat") else str(date_to))
+    if station:
+        stations = station if isinstance(station, (list, tuple, set)) else [station]
+        clauses.append(f"station IN ({', '.join('?' * len(stations))})")
+        params.extend(stations)
+    sql = f"SELECT {', '.join(ROUTE_ROLLUP_COLUMNS)} FROM route_rollups"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY route_date DESC, station, route_number"
+    conn = connect(db_path)
+    try:
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    df["stops"] = df["stops"].map(json.loads)
+    df["issue_categories"] = df["issue_categories"].map(json.loads)
+    return df
+
+
+def update_submission(submission_id: str, fields: dict, db_path: str = DB_FILE, directory: str = SUBMISSIONS_DIR) -> None:
+    """Merges fields into a stored submission (database row and, if present, its JSON file)."""
+    update_submissions({submission_id: fields}, db_path=db_path, directory=directory)
+
+
+def update_submissions(
+    updates: dict[str, dict], db_path: str = DB_FILE, directory: str = SUBMISSIONS_DIR
+) -> int:
+    """
+    update_submission for many rows ({submission_id: fields}) in one transaction;
+    the JSON files that exist are rewritten after it commits. Unknown ids are
+    skipped. Returns the number of submissions updated.
+    """
+    payloads = []
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = list(updates)
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT payload FROM submissions WHERE submission_id IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for (stored,) in rows:
+                    old = json.loads(stored)
+                    payload = {**old, **updates[old["submission_id"]]}
+                    _upsert_submission(conn, payload, old)
+                    payloads.append(payload)
+    finally:
+        conn.close()
+    for payload in payloads:
+        if os.path.exists(submission_path(payload["submission_id"], directory)):
+            write_submission_file(payload, directory)
+    return len(payloads)
+
+
+def _iter_json_dir(directory: str):
+    for path in list_submission_files(directory):
+        try:
+            yield read_submission_file(path)
+        except (OSError, ValueError):
+            continue
+
+
+def _import_json_dir(conn: sqlite3.Connection, directory: str) -> int:
+    from archive import ARCHIVE_DIR, iter_archived_submissions
+
+    archive_dir = ARCHIVE_DIR if directory == SUBMISSIONS_DIR else os.path.join(directory, "archive")
+    imported = 0
+    for payload in itertools.chain(iter_archived_submissions(archive_dir), _iter_json_dir(directory)):
+        cur = conn.execute(
+            f"INSERT OR IGNORE INTO submissions ({_COLUMNS_SQL}) VALUES ({_PLACEHOLDERS_SQL})",
+            _row_values(payload),
+        )
+        if cur.rowcount:
+            _add_to_route_rollup(conn, payload)
+        imported += cur.rowcount
+    return imported
+
+
+def import_json_dir(directory: str = SUBMISSIONS_DIR, db_path: str = DB_FILE) -> int:
+    """
+    Import of the JSON files, and of the daily archives they were compacted
+    into (archive.py). Runs once by itself when the database is created or
+    migrated; safe to re-run (existing ids are kept).
+    """
+    conn = connect(db_path)
+    try:
+        with conn:
+            return _import_json_dir(conn, directory)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["import"]:
+        print("usage: python store.py import")
+        sys.exit(2)
+    n = import_json_dir()
+    print(f"Imported {n} submission(s) from {SUBMISSIONS_DIR}/ into {DB_FILE} ({count_submissions()} total).")
@@ -0,0 +1,283 @@
+import os
+import re
+import json
+import zlib
+import argparse
+from collections import Counter
+
+import numpy as np
+import scipy.sparse as sp
+
+from store import DB_FILE, SUBMISSIONS_DIR, iter_inserted_submissions, iter_submissions, update_submissions
+
+# ------------------------- Config ------------------------- #
+CLUSTERS_DIR = os.path.join(SUBMISSIONS_DIR, "cache", "text_clusters")
+MODEL_FILE = "model.npz"
+STATE_FILE = "state.json"
+
+TEXT_FIELDS = ["what_happened", "suggestion"]
+
+# Hashed vocabulary: new words never require refitting the vectorizer
+N_FEATURES = 2 ** 16
+N_CLUSTERS = 12
+BATCH_SIZE = 1024
+TOP_TERMS = 8
+
+# Drivers write in English and French
+STOPWORDS = set(
+    """
+    a an and are as at be but by for from has have i in is it its my of on or so that the their there this to
+    was were will with we you your our they them he she his her not no yes can could should would did do does
+    le la les un une des du de et ou en au aux pour par sur dans est sont pas que qui ce cette il elle on nous
+    vous ils elles je tu mon ma mes son sa ses leur leurs avec sans plus tres
+    """.split()
+)
+
+
+# ==========================================================
+# TF-IDF (hashed, sparse)
+# ==========================================================
+def tokenize(text: str) -> list[str]:
+    words = re.findall(r"[^\W\d_]{2,}", (text or "").lower())
+    return [w for w in words if w not in STOPWORDS]
+
+
+def submission_text(payload: dict) -> str:
+    return " ".join(str(payload.get(f) or "") for f in TEXT_FIELDS).strip()
+
+
+def _bucket(token: str) -> int:
+    # crc32 is stable across processes (unlike hash())
+    return zlib.crc32(token.encode("utf-8")) % N_FEATURES
+
+
+def count_matrix(docs: list[list[str]]) -> sp.csr_matrix:
+    indptr, indices, data = [0], [], []
+    for tokens in docs:
+        counts = Counter(_bucket(t) for t in tokens)
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    return sp.csr_matrix(
+        (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+        shape=(len(docs), N_FEATURES),
+    )
+
+
+def tfidf(counts: sp.csr_matrix, doc_freq: np.ndarray, n_docs: int) -> sp.csr_matrix:
+    X = counts.copy()
+    X.data = 1 + np.log(X.data)  # sublinear tf
+    idf = np.log((1 + n_docs) / (1 + doc_freq)).astype(np.float32) + 1
+    X = X @ sp.diags(idf)
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sp.csr_matrix(sp.diags(1 / norms) @ X)
+
+
+# ==========================================================
+# Mini-batch (spherical) k-means
+# ==========================================================
+class TextClusterModel:
+    def __init__(self, n_clusters: int = N_CLUSTERS):
+        self.n_clusters = n_clusters
+        self.centroids = None  # dense (k, N_FEATURES), rows L2-normalized
+        self.cluster_counts = np.zeros(n_clusters, dtype=np.int64)
+        self.doc_freq = np.zeros(N_FEATURES, dtype=np.int64)
+        self.n_docs = 0
+        self.bucket_terms: dict[int, Counter] = {}
+
+    # ---------- persistence ---------- #
+    @classmethod
+    def load(cls, directory: str = CLUSTERS_DIR) -> "TextClusterModel | None":
+        path = os.path.join(directory, MODEL_FILE)
+        if not os.path.exists(path):
+            return None
+        data = np.load(path, allow_pickle=False)
+        model = cls(n_clusters=int(data["n_clusters"]))
+        model.centroids = data["centroids"] if data["centroids"].size else None
+        model.cluster_counts = data["cluster_counts"]
+        model.doc_freq = data["doc_freq"]
+        model.n_docs = int(data["n_docs"])
+        with open(os.path.join(directory, "terms.json"), "r", encoding="utf-8") as r:
+            model.bucket_terms = {int(k): Counter(v) for k, v in json.load(r).items()}
+        return model
+
+    def save(self, directory: str = CLUSTERS_DIR) -> None:
+        os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(
+            os.path.join(directory, MODEL_FILE),
+            n_clusters=self.n_clusters,
+            centroids=self.centroids if self.centroids is not None else np.zeros(0, dtype=np.float32),
+            cluster_counts=self.cluster_counts,
+            doc_freq=self.doc_freq,
+            n_docs=self.n_docs,
+        )
+        with open(os.path.join(directory, "terms.json"), "w", encoding="utf-8") as w:
+            json.dump({k: dict(v.most_common(3)) for k, v in self.bucket_terms.items()}, w, ensure_ascii=False)
+
+    # ---------- fitting ---------- #
+    def _observe(self, docs: list[list[str]], counts: sp.csr_matrix) -> None:
+        self.n_docs += counts.shape[0]
+        self.doc_freq += np.bincount(counts.indices, minlength=N_FEATURES)
+        for tokens in docs:
+            for t in set(tokens):
+                self.bucket_terms.setdefault(_bucket(t), Counter())[t] += 1
+
+    def _init_centroids(self, X: sp.csr_matrix, rng: np.random.Generator) -> None:
+        # k-means++ seeding on the first batch
+        picks = [int(rng.integers(X.shape[0]))]
+        dist = np.ones(X.shape[0])
+        for _ in range(1, self.n_clusters):
+            sim = np.asarray((X @ X[picks[-1]].T).todense()).ravel()
+            dist = np.minimum(dist, np.clip(1 - sim, 0, None))
+            total = dist.sum()
+            picks.append(int(rng.choice(X.shape[0], p=dist / total)) if total > 0 else int(rng.integers(X.shape[0])))
+        self.centroids = np.asarray(X[picks].todense(), dtype=np.float32)
+
+    def predict(self, X: sp.csr_matrix) -> np.ndarray:
+        return np.asarray(X @ self.centroids.T).argmax(axis=1)
+
+    def partial_fit(self, docs: list[list[str]], seed: int = 0) -> np.ndarray:
+        """Updates IDF stats and centroids with one batch; returns the batch labels."""
+        counts = count_matrix(docs)
+        self._observe(docs, counts)
+        X = tfidf(counts, self.doc_freq, self.n_docs)
+        if self.centroids is None:
+            self._init_centroids(X, np.random.default_rng(seed))
+
+        labels = self.predict(X)
+        for c in np.unique(labels):
+            members = X[labels == c]
+            self.cluster_counts[c] += members.shape[0]
+            # per-center learning rate 1/count (Sculley, 2010), applied to the batch mean
+            lr = members.shape[0] / self.cluster_counts[c]
+            mean = np.asarray(members.mean(axis=0)).ravel()
+            self.centroids[c] = (1 - lr) * self.centroids[c] + lr * mean
+            norm = np.linalg.norm(self.centroids[c])
+            if norm > 0:
+                self.centroids[c] /= norm
+        return labels
+
+    def top_terms(self, cluster: int, n: int = TOP_TERMS) -> list[str]:
+        terms = []
+        for bucket in np.argsort(self.centroids[cluster])[::-1]:
+            if self.centroids[cluster][bucket] <= 0 or len(terms) >= n:
+                break
+            names = self.bucket_terms.get(int(bucket))
+            if names:
+                terms.append(names.most_common(1)[0][0])
+        return terms
+
+
+# ==========================================================
+# Job
+# ==========================================================
+def _read_state(directory: str) -> dict:
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as r:
+        return json.load(r)
+
+
+def _write_state(state: dict, directory: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, STATE_FILE), "w", encoding="utf-8") as w:
+        json.dump(state, w, indent=2)
+
+
+def _batches(payloads, size: int):
+    batch = []
+    for p in payloads:
+        batch.append(p)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _store_labels(model: TextClusterModel, payloads: list[dict], labels, db_path: str) -> None:
+    terms = {}  # top terms per cluster, computed once per batch
+    updates = {}
+    for payload, label in zip(payloads, labels):
+        label = int(label)
+        if label not in terms:
+            terms[label] = model.top_terms(label)
+        updates[payload["submission_id"]] = {"text_cluster": label, "text_cluster_terms": terms[label]}
+    update_submissions(updates, db_path=db_path)
+
+
+def run_clustering(
+    db_path: str = DB_FILE,
+    clusters_dir: str = CLUSTERS_DIR,
+    n_clusters: int = N_CLUSTERS,
+    relabel: bool = False,
+) -> int:
+    """
+    Folds submissions stored since the last run into the model and labels them.
+    With relabel=True, every submission is re-assigned to the current centroids.
+    Returns the number of submissions labelled.
+    """
+    model = TextClusterModel.load(clusters_dir) or TextClusterModel(n_clusters=n_clusters)
+    state = _read_state(clusters_dir)
+    # insert order, so rows stored late with an older id (imports) are folded in too
+    after_rowid = state.get("last_rowid", 0)
+    # state from before the rowid watermark: skip what its id watermark already covered
+    folded_upto_id = None if "last_rowid" in state else state.get("last_submission_id")
+    labelled = 0
+
+    pending = []
+    for batch in _batches(iter_inserted_submissions(after_rowid, db_path), BATCH_SIZE):
+        after_rowid = batch[-1][0]
+        with_text = [
+            p for _, p in batch
+            if submission_text(p) and not (folded_upto_id and p["submission_id"] <= folded_upto_id)
+        ]
+        pending.extend(with_text)
+        # k-means++ needs at least k documents before the first update
+        if model.centroids is None and len(pending) < model.n_clusters:
+            continue
+        labels = model.partial_fit([tokenize(submission_text(p)) for p in pending])
+        _store_labels(model, pending, labels, db_path)
+        labelled += len(pending)
+        pending = []
+
+    if model.centroids is None:
+        # Not enough text yet; retry from the same point next run
+        return 0
+
+    if relabel:
+        # covers the submissions just folded in too: count each one once
+        labelled = 0
+        for batch in _batches((p for p in iter_submissions(db_path=db_path) if submission_text(p)), BATCH_SIZE):
+            counts = count_matrix([tokenize(submission_text(p)) for p in batch])
+            labels = model.predict(tfidf(counts, model.doc_freq, model.n_docs))
+            _store_labels(model, batch, labels, db_path)
+            labelled += len(batch)
+
+    model.save(clusters_dir)
+    _write_state({"last_rowid": after_rowid, "n_docs": model.n_docs}, clusters_dir)
+    return labelled
+
+
+def cluster_summary(clusters_dir: str = CLUSTERS_DIR) -> list[dict]:
+    model = TextClusterModel.load(clusters_dir)
+    if model is None or model.centroids is None:
+        return []
+    return [
+        {"cluster": c, "submissions": int(model.cluster_counts[c]), "top_terms": model.top_terms(c)}
+        for c in range(model.n_clusters)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster driver narratives (what_happened + suggestion).")
+    parser.add_argument("--clusters", type=int, default=N_CLUSTERS, help="number of clusters (first run only)")
+    parser.add_argument("--relabel", action="store_true", help="re-assign every submission to the current clusters")
+    args = parser.parse_args()
+
+    n = run_clustering(n_clusters=args.clusters, relabel=args.relabel)
+    print(f"Labelled {n} submission(s).")
+    for row in cluster_summary():
+        print(f"  #{row['cluster']:>2}  {row['submissions']:>6}  {', '.join(row['top_terms'])}")
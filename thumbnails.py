@@ -0,0 +1,119 @@
+import os
+import base64
+import hashlib
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from sharepoint import graph_download_file_bytes, graph_download_thumbnail_bytes, graph_get_item
+
+# ------------------------- Config ------------------------- #
+# Served by Streamlit at app/static/thumbs/ (server.enableStaticServing = true)
+THUMBS_DIR = os.path.join("static", "thumbs")
+THUMBS_URL = "app/static/thumbs"
+THUMB_MAX_SIZE = (320, 320)
+THUMB_QUALITY = 80
+
+# (path, size, mtime) -> content key, so unchanged local files are hashed once per process
+_local_keys: dict[tuple, str] = {}
+# SharePoint path -> content key
+_sharepoint_keys: dict[str, str] = {}
+
+
+# ==========================================================
+# Thumbnail cache (on disk, keyed by content hash)
+# ==========================================================
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def thumbnail_path(key: str) -> str:
+    return os.path.join(THUMBS_DIR, f"{key}.jpg")
+
+
+def thumbnail_url(key: str) -> str:
+    return f"{THUMBS_URL}/{key}.jpg"
+
+
+def make_thumbnail(content: bytes) -> bytes:
+    with Image.open(BytesIO(content)) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail(THUMB_MAX_SIZE)
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=THUMB_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def _store_thumbnail(key: str, thumb: bytes) -> None:
+    os.makedirs(THUMBS_DIR, exist_ok=True)
+    path = thumbnail_path(key)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as w:
+        w.write(thumb)
+    os.replace(tmp, path)
+
+
+def local_thumbnail(path: str) -> str | None:
+    """Content key of the thumbnail for a local attachment (generated on first use)."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    memo = (path, stat.st_size, stat.st_mtime_ns)
+    key = _local_keys.get(memo)
+    if key and os.path.exists(thumbnail_path(key)):
+        return key
+
+    with open(path, "rb") as r:
+        content = r.read()
+    key = content_hash(content)
+    if not os.path.exists(thumbnail_path(key)):
+        try:
+            _store_thumbnail(key, make_thumbnail(content))
+        except Exception:
+            return None
+    _local_keys[memo] = key
+    return key
+
+
+def _sharepoint_key(item: dict) -> str | None:
+    # quickXorHash is SharePoint's content hash; fall back to the content tag
+    hashes = (item.get("file") or {}).get("hashes") or {}
+    raw = hashes.get("quickXorHash") or hashes.get("sha256Hash")
+    if raw:
+        try:
+            return "qx_" + base64.b64decode(raw).hex()
+        except ValueError:
+            return "qx_" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    tag = item.get("cTag") or item.get("eTag")
+    return "tag_" + hashlib.sha256(tag.encode("utf-8")).hexdigest() if tag else None
+
+
+def sharepoint_thumbnail(token: str, site_id: str, sp_path: str) -> str | None:
+    """
+    Content key of the thumbnail for a SharePoint attachment. Uses the small
+    SharePoint-rendered thumbnail; only falls back to the original if none exists.
+    """
+    key = _sharepoint_keys.get(sp_path)
+    if key and os.path.exists(thumbnail_path(key)):
+        return key
+
+    item = graph_get_item(token, site_id, sp_path, select="eTag,cTag,file")
+    if item is None:
+        return None
+    key = _sharepoint_key(item)
+    if key is None:
+        return None
+
+    if not os.path.exists(thumbnail_path(key)):
+        content = graph_download_thumbnail_bytes(token, site_id, sp_path)
+        if content is None:
+            content = graph_download_file_bytes(token, site_id, sp_path)
+        if content is None:
+            return None
+        try:
+            _store_thumbnail(key, make_thumbnail(content))
+        except Exception:
+            return None
+    _sharepoint_keys[sp_path] = key
+    return key
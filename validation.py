@@ -0,0 +1,295 @@
+import os
+import re
+import math
+
+import numpy as np
+import pandas as pd
+
+from attachments import MAX_SUBMISSION_ATTACHMENT_BYTES, total_attachment_size
+
+# ------------------------- Config ------------------------- #
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# required_if condition: "when the other field is filled in"
+NOT_BLANK = object()
+
+# ==========================================================
+# Schemas (declarative)
+#
+#   field: {
+#       "required": message,
+#       "required_if": (other_field, value or NOT_BLANK, message),
+#       "pattern": (regex, message),           # full match, checked when filled in
+#       "extensions": (extensions, message),   # list of file names / uploads; {name} in message
+#       "max_total_bytes": (limit, message),    # list of uploads; {total_mb} / {limit_mb} in message
+#   }
+#
+# Messages are reported in schema order, so the UI lists them top to bottom.
+# ==========================================================
+IDENTIFICATION_SCHEMA = {
+    "driver_id": {"required": "Driver ID is required."},
+    "idc_id": {"required": "IDC ID is required."},
+}
+
+# app.py / app2.py identify drivers by name and email
+LEGACY_IDENTIFICATION_SCHEMA = {
+    "driver_last_name": {"required": "Driver last name is required."},
+    "driver_first_name": {"required": "Driver first name is required."},
+    "driver_email": {"required": "Driver email is required."},
+    "idc": {"required": "IDC is required."},
+}
+
+ROUTE_AND_ISSUE_SCHEMA = {
+    "station": {"required": "Station is required."},
+    "route_number": {
+        "required": "Route number is required.",
+        "pattern": (r"\d+", "Route number must contain digits only (e.g., 1235)."),
+    },
+    "idc_liaison": {"required": "IDC Liaison is required."},
+    "vehicle_type": {"required": "Vehicle type is required."},
+    "stop_number": {
+        "required_if": ("issue_applies_to", "Specific stop", "Stop number is required when 'Specific stop' is selected."),
+    },
+    "parcel_tracking_id": {
+        "required_if": (
+            "issue_applies_to",
+            "Specific stop",
+            "Parcel Tracking ID is required when 'Specific stop' is selected.",
+        ),
+    },
+    "estimated_time_lost": {"required": "Estimated time lost is required."},
+    "main_issue_category": {"required": "Main issue category is required."},
+    "sub_category": {"required_if": ("main_issue_category", NOT_BLANK, "Sub-category is required.")},
+}
+
+# Form-only fields (not stored in the payload)
+CONFIRMATION_SCHEMA = {
+    "agree": {"required": "You must confirm the accuracy checkbox."},
+}
+ATTACHMENTS_TOO_LARGE = "Attachments are too large: {total_mb:.1f} MB in total (limit {limit_mb:.0f} MB). Remove or shrink some files."
+ATTACHMENTS_SCHEMA = {
+    "attachments": {"max_total_bytes": (MAX_SUBMISSION_ATTACHMENT_BYTES, ATTACHMENTS_TOO_LARGE)},
+}
+IMAGE_ATTACHMENTS_SCHEMA = {
+    "attachments": {
+        "extensions": (IMAGE_EXTENSIONS, "Only images are allowed. Invalid file: {name}"),
+        "max_total_bytes": (MAX_SUBMISSION_ATTACHMENT_BYTES, ATTACHMENTS_TOO_LARGE),
+    },
+}
+
+PAYLOAD_SCHEMA = {**IDENTIFICATION_SCHEMA, **ROUTE_AND_ISSUE_SCHEMA}
+ROUTE_DATE_SCHEMA = {
+    "route_date": {
+        "required": "Route date is required.",
+        "pattern": (r"\d{4}-\d{2}-\d{2}", "Route date must be YYYY-MM-DD."),
+    },
+}
+# HTTP API (api.py): no widgets, so the values the form always has must be checked too
+API_SCHEMA = {
+    **PAYLOAD_SCHEMA,
+    **ROUTE_DATE_SCHEMA,
+    "severity": {
+        "required": "Severity is required.",
+        "pattern": (r"Low|Medium|High|Critical", "Severity must be one of Low, Medium, High, Critical."),
+    },
+    **IMAGE_ATTACHMENTS_SCHEMA,
+}
+FORM_SCHEMA = {**PAYLOAD_SCHEMA, **CONFIRMATION_SCHEMA, **IMAGE_ATTACHMENTS_SCHEMA}
+# Microsoft Forms exports (forms_import.py): older surveys identify drivers by name and email
+FORMS_IMPORT_SCHEMA = {**PAYLOAD_SCHEMA, **ROUTE_DATE_SCHEMA}
+LEGACY_FORMS_IMPORT_SCHEMA = {**LEGACY_IDENTIFICATION_SCHEMA, **ROUTE_AND_ISSUE_SCHEMA, **ROUTE_DATE_SCHEMA}
+LEGACY_FORM_SCHEMA = {
+    **LEGACY_IDENTIFICATION_SCHEMA,
+    **ROUTE_AND_ISSUE_SCHEMA,
+    **CONFIRMATION_SCHEMA,
+    **ATTACHMENTS_SCHEMA,
+}
+
+
+# ==========================================================
+# Blank values (scalar + vectorized)
+# ==========================================================
+def is_blank(value) -> bool:
+    if value is None or value is False or value is pd.NA or value is pd.NaT:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    if isinstance(value, (list, tuple, set, dict)):
+        return not value
+    return False
+
+
+def _column(df: pd.DataFrame, field: str) -> pd.Series:
+    return df[field] if field in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+def _blank_mask(s: pd.Series) -> np.ndarray:
+    if pd.api.types.is_bool_dtype(s):
+        return ~s.to_numpy(dtype=bool)
+    if pd.api.types.is_numeric_dtype(s):
+        return s.isna().to_numpy()
+    if s.dtype == object:
+        # mixed cells (lists, booleans, numbers): one test per cell
+        return s.map(is_blank).to_numpy(dtype=bool)
+    return (s.isna() | s.astype("string").str.strip().eq("")).to_numpy(dtype=bool)
+
+
+def _file_name(f) -> str:
+    return str(getattr(f, "name", f))
+
+
+def _bad_files(value, extensions: tuple) -> list[str]:
+    if is_blank(value):
+        return []
+    files = value if isinstance(value, (list, tuple)) else [value]
+    return [_file_name(f) for f in files if os.path.splitext(_file_name(f).lower())[1] not in extensions]
+
+
+def _total_bytes(value) -> int:
+    if is_blank(value):
+        return 0
+    return total_attachment_size(value if isinstance(value, (list, tuple)) else [value])
+
+
+def _as_text(value) -> str:
+    # a number column with blanks is float: 123 comes back as 123.0
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+# ==========================================================
+# Compiled checks
+# ==========================================================
+class _Check:
+    """One rule on one field: a scalar test for the UI and a vectorized one for frames."""
+
+    def __init__(self, field: str, failed, failed_mask, messages):
+        self.field = field
+        self.failed = failed  # (record) -> bool
+        self.failed_mask = failed_mask  # (df) -> np.ndarray[bool]
+        self.messages = messages  # (value) -> list[str], only called on failures
+
+
+def _compile_field(field: str, rules: dict) -> list[_Check]:
+    unknown = set(rules) - {"required", "required_if", "pattern", "extensions", "max_total_bytes"}
+    if unknown:
+        raise ValueError(f"Unknown validation rule(s) for {field}: {', '.join(sorted(unknown))}")
+    checks = []
+
+    if "required" in rules:
+        message = rules["required"]
+        checks.append(
+            _Check(
+                field,
+                lambda record: is_blank(record.get(field)),
+                lambda df: _blank_mask(_column(df, field)),
+                lambda value, m=message: [m],
+            )
+        )
+
+    if "required_if" in rules:
+        other, expected, message = rules["required_if"]
+
+        def condition(record, other=other, expected=expected) -> bool:
+            value = record.get(other)
+            return not is_blank(value) if expected is NOT_BLANK else value == expected
+
+        def condition_mask(df, other=other, expected=expected) -> np.ndarray:
+            col = _column(df, other)
+            return ~_blank_mask(col) if expected is NOT_BLANK else col.eq(expected).to_numpy(dtype=bool)
+
+        checks.append(
+            _Check(
+                field,
+                lambda record: condition(record) and is_blank(record.get(field)),
+                lambda df: condition_mask(df) & _blank_mask(_column(df, field)),
+                lambda value, m=message: [m],
+            )
+        )
+
+    if "pattern" in rules:
+        regex, message = rules["pattern"]
+        compiled = re.compile(regex)
+
+        def mismatch_mask(df) -> np.ndarray:
+            col = _column(df, field)
+            filled = ~_blank_mask(col)
+            text = col.map(_as_text, na_action="ignore").astype("string")
+            matches = text.str.fullmatch(compiled.pattern).fillna(False).to_numpy(dtype=bool)
+            return filled & ~matches
+
+        checks.append(
+            _Check(
+                field,
+                lambda record: not is_blank(record.get(field))
+                and compiled.fullmatch(_as_text(record.get(field))) is None,
+                mismatch_mask,
+                lambda value, m=message: [m],
+            )
+        )
+
+    if "extensions" in rules:
+        extensions, message = rules["extensions"]
+        extensions = tuple(e.lower() for e in extensions)
+        checks.append(
+            _Check(
+                field,
+                lambda record: bool(_bad_files(record.get(field), extensions)),
+                lambda df: _column(df, field).map(lambda v: bool(_bad_files(v, extensions))).to_numpy(dtype=bool),
+                lambda value, m=message: [m.format(name=name) for name in _bad_files(value, extensions)],
+            )
+        )
+
+    if "max_total_bytes" in rules:
+        limit, message = rules["max_total_bytes"]
+        mb = 1024 * 1024
+        checks.append(
+            _Check(
+                field,
+                lambda record: _total_bytes(record.get(field)) > limit,
+                lambda df: _column(df, field).map(lambda v: _total_bytes(v) > limit).to_numpy(dtype=bool),
+                lambda value, m=message: [m.format(total_mb=_total_bytes(value) / mb, limit_mb=limit / mb)],
+            )
+        )
+
+    return checks
+
+
+class Validator:
+    """A schema compiled once into checks; validates single records or whole DataFrames."""
+
+    def __init__(self, schema: dict):
+        self.schema = schema
+        self.checks = [check for field, rules in schema.items() for check in _compile_field(field, rules)]
+
+    def validate(self, record: dict) -> list[str]:
+        """Error messages for one submission (empty list = valid)."""
+        return [
+            message
+            for check in self.checks
+            if check.failed(record)
+            for message in check.messages(record.get(check.field))
+        ]
+
+    def validate_frame(self, df: pd.DataFrame) -> pd.Series:
+        """Per-row error lists (aligned with df.index), e.g. for imports and backfills."""
+        errors = [[] for _ in range(len(df))]
+        for check in self.checks:
+            failed = np.flatnonzero(check.failed_mask(df))
+            if not len(failed):
+                continue
+            values = _column(df, check.field).to_numpy()
+            for i in failed:
+                errors[i].extend(check.messages(values[i]))
+        return pd.Series(errors, index=df.index, dtype=object)
+
+
+PAYLOAD_VALIDATOR = Validator(PAYLOAD_SCHEMA)
+API_VALIDATOR = Validator(API_SCHEMA)
+FORMS_IMPORT_VALIDATOR = Validator(FORMS_IMPORT_SCHEMA)
+LEGACY_FORMS_IMPORT_VALIDATOR = Validator(LEGACY_FORMS_IMPORT_SCHEMA)
+FORM_VALIDATOR = Validator(FORM_SCHEMA)
+LEGACY_FORM_VALIDATOR = Validator(LEGACY_FORM_SCHEMA)
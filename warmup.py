@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+
+from image_hash import LOCAL_INDEX_FILE, SHAREPOINT_INDEX_FILE, get_index
+from reference_data import BANNER_FILE, STATIONS_FILE, banner_as_data_uri, load_station_list
+from store import SUBMISSIONS_DIR, connect
+from sharepoint import excel_workbook_paths, graph_get_site_id, graph_get_token, graph_is_configured, read_remote_workbook
+
+# ------------------------- Config ------------------------- #
+# Written by the Streamlit launcher (`python warmup.py --streamlit app3.py`), read by `--check`
+READY_FILE = os.path.join(SUBMISSIONS_DIR, "cache", "ready.json")
+# A failed step is tried again by the next start_warmup() call after this long
+WARMUP_RETRY_S = 60
+
+
+# ==========================================================
+# Steps
+#
+# Everything the first driver after a deploy would otherwise wait for. Each
+# step fills a per-process cache the app already reads: st.cache_data for the
+# lists and the banner, the token/site cache and the workbook cache in
+# sharepoint.py, the image-hash index, the database schema check.
+# ==========================================================
+class SkipStep(Exception):
+    pass
+
+
+def _warm_reference_lists() -> None:
+    load_station_list(STATIONS_FILE)
+
+
+def _warm_assets() -> None:
+    banner_as_data_uri(BANNER_FILE)
+
+
+def _warm_database() -> None:
+    connect().close()  # creates/migrates the schema once, not on the first submit
+
+
+def _warm_image_indexes() -> None:
+    get_index(LOCAL_INDEX_FILE)
+    get_index(SHAREPOINT_INDEX_FILE)
+
+
+def _graph_token_and_site() -> tuple[str, str]:
+    if not graph_is_configured():
+        raise SkipStep("Graph is not configured in this process")
+    token = graph_get_token()
+    return token, graph_get_site_id(token)
+
+
+def _warm_graph() -> None:
+    _graph_token_and_site()
+
+
+def _warm_workbooks() -> None:
+    token, site_id = _graph_token_and_site()
+    for path in excel_workbook_paths(token, site_id):
+        read_remote_workbook(token, site_id, path)
+
+
+# (name, function, needs Graph settings)
+WARMUP_STEPS = [
+    ("reference lists", _warm_reference_lists, False),
+    ("banner", _warm_assets, False),
+    ("database", _warm_database, False),
+    ("image indexes", _warm_image_indexes, False),
+    ("graph token + site", _warm_graph, True),
+    ("workbooks", _warm_workbooks, True),
+]
+
+
+# ==========================================================
+# Background run + readiness
+# ==========================================================
+_lock = threading.Lock()
+_thread: threading.Thread | None = None
+_status: dict = {"ready": False, "started_at_utc": None, "seconds": None, "steps": {}}
+
+
+def readiness() -> dict:
+    """
+    {"ready": ..., "steps": {name: {"state", "seconds", "error"}}}; ready once
+    every step has succeeded (Graph steps may be skipped when Graph is not configured).
+    """
+    with _lock:
+        return {**_status, "pid": os.getpid(), "steps": {k: dict(v) for k, v in _status["steps"].items()}}
+
+
+def is_ready() -> bool:
+    with _lock:
+        return _status["ready"]
+
+
+def _write_ready_file(path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as w:
+        json.dump(readiness(), w, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _step_done(name: str, needs_graph: bool) -> bool:
+    step = _status["steps"].get(name)
+    if step is None:
+        return False
+    # Graph steps skipped for lack of settings are not needed while Graph stays unconfigured
+    return step["state"] == "ok" or (step["state"] == "skipped" and needs_graph and not graph_is_configured())
+
+
+def _run(steps: list[tuple], ready_file: str | None) -> None:
+    started = time.perf_counter()
+    for name, func, _ in steps:
+        with _lock:
+            _status["steps"][name] = {"state": "running", "seconds": None, "error": None}
+        t0 = time.perf_counter()
+        try:
+            func()
+            state, error = "ok", None
+        except SkipStep as e:
+            state, error = "skipped", str(e)
+        except Exception as e:
+            # reported and retried later (see WARMUP_RETRY_S); the app still works, just cold for that part
+            state, error = "failed", str(e)
+        with _lock:
+            _status["steps"][name] = {
+                "state": state,
+                "seconds": round(time.perf_counter() - t0, 3),
+                "error": error,
+                "finished": time.monotonic(),
+            }
+        if ready_file:
+            _write_ready_file(ready_file)
+
+    with _lock:
+        ready = all(_step_done(name, needs_graph) for name, _, needs_graph in WARMUP_STEPS)
+        if ready and not _status["ready"]:
+            _status["seconds"] = round(time.perf_counter() - started, 3)
+        _status["ready"] = ready
+    if ready_file:
+        _write_ready_file(ready_file)
+
+
+def _needs_run(name: str, needs_graph: bool) -> bool:
+    step = _status["steps"].get(name)
+    if step is None:
+        return True
+    if step["state"] == "failed":
+        return time.monotonic() - step["finished"] >= WARMUP_RETRY_S
+    # Graph steps skipped before Graph settings were available run once they are
+    return step["state"] == "skipped" and needs_graph and graph_is_configured()
+
+
+def start_warmup(ready_file: str | None = None) -> threading.Thread | None:
+    """
+    Warms this process up in a background thread. Safe to call on every
+    rerun: only steps that have not run yet, failed more than WARMUP_RETRY_S
+    ago, or were skipped for lack of Graph settings that are now present are started.
+    """
+    global _thread
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return _thread
+        pending = [step for step in WARMUP_STEPS if _needs_run(step[0], step[2])]
+        if not pending:
+            return None
+        if _status["started_at_utc"] is None:
+            _status["started_at_utc"] = datetime.now(timezone.utc).isoformat()
+        for name, _, _ in pending:
+            _status["steps"][name] = {"state": "pending", "seconds": None, "error": None}
+        _thread = threading.Thread(target=_run, args=(pending, ready_file), name="warmup", daemon=True)
+        _thread.start()
+        return _thread
+
+
+def check_ready_file(path: str = READY_FILE) -> bool:
+    """True if the process that wrote the file is alive and warm (for container health checks)."""
+    try:
+        with open(path, "r", encoding="utf-8") as r:
+            status = json.load(r)
+        os.kill(int(status["pid"]), 0)
+    except (OSError, ValueError, KeyError):
+        return False
+    return bool(status.get("ready"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm up the app process (lists, assets, Graph token/site, workbooks).")
+    parser.add_argument("--check", action="store_true", help="exit 0 only if the Streamlit process is warm")
+    parser.add_argument("--streamlit", metavar="APP", help="start `streamlit run APP` with the warm-up running")
+    args, streamlit_args = parser.parse_known_args()
+
+    if args.check:
+        sys.exit(0 if check_ready_file() else 1)
+
+    if args.streamlit:
+        from streamlit.web import cli as stcli
+
+        if os.path.exists(READY_FILE):
+            os.remove(READY_FILE)
+        start_warmup(ready_file=READY_FILE)
+        sys.argv = ["streamlit", "run", args.streamlit, *streamlit_args]
+        sys.exit(stcli.main())
+
+    start_warmup().join()
+    status = readiness()
+    for name, step in status["steps"].items():
+        print(f"{name:<20} {step['state']:<8} {step['seconds'] or 0:>7.3f}s  {step['error'] or ''}")
+    if not status["ready"]:
+        print("Not ready: a required step failed")
+        sys.exit(1)
+    print(f"Warm in {status['seconds']:.2f}s")
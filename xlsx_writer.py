@@ -0,0 +1,70 @@
+import os
+import math
+from io import BytesIO
+from typing import IO, Iterable
+
+import pandas as pd
+import xlsxwriter
+
+# ------------------------- Config ------------------------- #
+SHEET_NAME = "Submissions"
+
+WORKBOOK_OPTIONS = {
+    # rows are flushed to a temp file as soon as the next row starts: flat memory
+    "constant_memory": True,
+    "in_memory": False,
+    # driver text is data, never a formula or hyperlink ("=..." / "http...")
+    "strings_to_formulas": False,
+    "strings_to_urls": False,
+    "nan_inf_to_errors": True,
+    "default_date_format": "yyyy-mm-dd hh:mm:ss",
+    "remove_timezone": True,
+}
+
+
+# ==========================================================
+# Streaming XLSX writer (xlsxwriter, constant-memory mode)
+#
+# DataFrame.to_excel (openpyxl) builds a cell object for every value before
+# saving, which costs several times the workbook size in memory. Here each row
+# is serialized once and written out, so memory stays flat and it is ~2x faster.
+# ==========================================================
+def _cell_value(value):
+    if value is None or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (list, tuple, dict, set)):
+        # same text DataFrame.to_excel wrote for list cells (e.g. sp_attachments)
+        return str(value)
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        return value.item()  # numpy scalar
+    return value
+
+
+def write_rows_xlsx(out: IO[bytes] | str, columns: list, rows: Iterable[Iterable], sheet_name: str = SHEET_NAME) -> int:
+    """Streams rows (in `columns` order) into `out` as a one-sheet workbook. Returns the row count."""
+    wb = xlsxwriter.Workbook(out, WORKBOOK_OPTIONS)
+    ws = wb.add_worksheet(sheet_name)
+    ws.write_row(0, 0, [str(c) for c in columns], wb.add_format({"bold": True}))
+    n = 0
+    for n, row in enumerate(rows, start=1):
+        ws.write_row(n, 0, [_cell_value(v) for v in row])
+    wb.close()
+    return n
+
+
+def dataframe_to_xlsx_bytes(df: pd.DataFrame, sheet_name: str = SHEET_NAME) -> bytes:
+    out = BytesIO()
+    write_rows_xlsx(out, list(df.columns), df.itertuples(index=False, name=None), sheet_name)
+    return out.getvalue()
+
+
+def write_dataframe_xlsx(df: pd.DataFrame, path: str, sheet_name: str = SHEET_NAME) -> None:
+    """Writes a local workbook atomically (readers never see a half-written file)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as w:
+        write_rows_xlsx(w, list(df.columns), df.itertuples(index=False, name=None), sheet_name)
+    os.replace(tmp, path)